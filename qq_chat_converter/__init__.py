@@ -1 +1,34 @@
-from qq_chat_converter.py_funcs import export_from_mht, deduplicate_images, embed_json_in_html
\ No newline at end of file
+# 公开接口按需加载：转换引擎依赖 bs4 / lxml / tqdm，导入耗时较长，
+# 只用到查看器服务器（qq_chat_converter.server）或启动 GUI 时不必提前加载。
+_EXPORTS = {
+    "export_from_mht": "qq_chat_converter.py_funcs",
+    "ExportOptions": "qq_chat_converter.py_funcs",
+    "deduplicate_images": "qq_chat_converter.py_funcs",
+    "embed_json_in_html": "qq_chat_converter.py_funcs",
+    "scan_mht": "qq_chat_converter.py_funcs",
+    "ProgressEvent": "qq_chat_converter.py_funcs",
+    "ConversionCancelled": "qq_chat_converter.py_funcs",
+    "export_static_site": "qq_chat_converter.static_site",
+    "ChatArchive": "qq_chat_converter.archive",
+    "ParseCache": "qq_chat_converter.parse_cache",
+    "ImageTranscoder": "qq_chat_converter.transcode",
+    "write_viewer_bundle": "qq_chat_converter.bundle",
+    "dedupe_exports": "qq_chat_converter.dedup",
+    "merge_exports": "qq_chat_converter.merge",
+    "migrate_image_layout": "qq_chat_converter.layout",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,202 @@
+import os
+import re
+import json
+
+from array import array
+from datetime import date
+
+from qq_chat_converter.records import MessageRecord, RecordStore, StringTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+STATS_VERSION = 1
+TIME_RE = re.compile(r"^(\d{1,2}):(\d{2}):(\d{2})$")
+
+
+def stats_path_for(json_path):
+    """qq_chat.json -> qq_chat.stats.json"""
+    return os.path.splitext(json_path)[0] + ".stats.json"
+
+
+def _ordinal(date_str):
+    try:
+        return date.fromisoformat(date_str).toordinal()
+    except (TypeError, ValueError):
+        return -1
+
+
+def time_seconds(time_str):
+    """时间字符串 H:MM:SS -> 当天的秒数，无法解析时为 -1"""
+    m = TIME_RE.match(time_str or "")
+    if not m or int(m.group(1)) > 23:
+        return -1
+    return int(m.group(1)) * 3600 + int(m.group(2)) * 60 + int(m.group(3))
+
+
+def _image_count(images, forwarded):
+    n = len(images) if images else 0
+    for fwd in forwarded or ():
+        fwd_images = fwd.get("images") if isinstance(fwd, dict) else getattr(fwd, "images", None)
+        n += len(fwd_images) if isinstance(fwd_images, (list, tuple)) else 0
+    return n
+
+
+class ChatStats:
+    """
+    边解析边按列累积每条消息的 发送者 / 日期 / 时间 / 正文长度 / 图片数（含转发内容中的图片），
+    result() 一次性计算发送者排行、每日消息量、按小时与星期的活跃度热力图等汇总。
+    发送者与日期使用 store 的字符串表 id，时间按取值去重，只在汇总时逐个解析。
+    安装了 NumPy 时用 bincount 向量化汇总，否则退回等价的纯 Python 循环。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._times = StringTable()
+        self.sender_ids = array("i")
+        self.date_ids = array("i")
+        self.time_ids = array("i")
+        self.text_lens = array("i")
+        self.image_counts = array("i")
+
+    def __len__(self):
+        return len(self.sender_ids)
+
+    def add(self, record):
+        """加入一条消息：紧凑记录（MessageRecord）或导出格式的 dict"""
+        if isinstance(record, MessageRecord):
+            sender, date_id, time, text = record.sender, record.date, record.time, record.text
+            images, forwarded = record.images, record.forwarded
+        elif isinstance(record, dict):
+            sender = self.store.senders.id_of(record.get("sender")) if isinstance(record.get("sender"), str) else None
+            date_id = self.store.dates.id_of(record.get("date")) if isinstance(record.get("date"), str) else None
+            time, text = record.get("time"), record.get("text")
+            images = record.get("images") if isinstance(record.get("images"), list) else None
+            forwarded = record.get("forwarded") if isinstance(record.get("forwarded"), list) else None
+        else:
+            # 结构异常的记录也占一行，count 与 JSON 中的记录数保持一致
+            sender = date_id = time = text = images = forwarded = None
+        self.sender_ids.append(-1 if sender is None else sender)
+        self.date_ids.append(-1 if date_id is None else date_id)
+        self.time_ids.append(self._times.id_of(time) if isinstance(time, str) else -1)
+        self.text_lens.append(len(text) if isinstance(text, str) else 0)
+        self.image_counts.append(_image_count(images, forwarded))
+
+    def result(self):
+        senders = self.store.senders.values
+        dates = self.store.dates.values
+        ordinals = [_ordinal(d) for d in dates]
+        seconds = [time_seconds(t) for t in self._times.values]
+        if np is not None:
+            counts = _aggregate_numpy(self, len(senders), ordinals, seconds)
+        else:
+            counts = _aggregate_python(self, len(senders), ordinals, seconds)
+        per_sender, per_date, hours, weekdays, heatmap = counts
+
+        # 发送者按消息数降序；没有发送者的消息计入 sender 为 null 的一项
+        sender_rows = []
+        for i, (messages, images, chars) in enumerate(per_sender):
+            if messages:
+                sender_rows.append({"sender": senders[i] if i < len(senders) else None,
+                                    "messages": messages, "images": images, "chars": chars})
+        sender_rows.sort(key=lambda row: (-row["messages"], row["sender"] is None, row["sender"] or ""))
+        daily = {dates[i]: n for i, n in sorted(enumerate(per_date), key=lambda x: dates[x[0]]) if n}
+        return {
+            "version": STATS_VERSION,
+            "count": len(self),
+            "first_date": min(daily) if daily else None,
+            "last_date": max(daily) if daily else None,
+            "days": len(daily),
+            "images": sum(row["images"] for row in sender_rows),
+            "chars": sum(row["chars"] for row in sender_rows),
+            "senders": sender_rows,
+            "daily": daily,
+            "hours": hours,
+            "weekdays": weekdays,  # 周一为 0
+            "heatmap": heatmap,    # 7 x 24：[星期][小时]
+        }
+
+
+def _aggregate_numpy(stats, n_senders, ordinals, seconds):
+    sender = np.frombuffer(stats.sender_ids, dtype=np.int32)
+    date_id = np.frombuffer(stats.date_ids, dtype=np.int32)
+    time_id = np.frombuffer(stats.time_ids, dtype=np.int32)
+    text_len = np.frombuffer(stats.text_lens, dtype=np.int32)
+    image_count = np.frombuffer(stats.image_counts, dtype=np.int32)
+
+    # 没有发送者的消息归入最后一个桶（下标 n_senders）
+    sender_bucket = np.where(sender < 0, n_senders, sender)
+    size = n_senders + 1
+    messages = np.bincount(sender_bucket, minlength=size)
+    images = np.bincount(sender_bucket, weights=image_count, minlength=size)
+    chars = np.bincount(sender_bucket, weights=text_len, minlength=size)
+    per_sender = list(zip(messages.tolist(), images.astype(np.int64).tolist(), chars.astype(np.int64).tolist()))
+
+    has_date = date_id >= 0
+    per_date = np.bincount(date_id[has_date], minlength=len(ordinals)).tolist()
+
+    # 按取值查表：每个不同的日期 / 时间只解析一次
+    ordinal = np.asarray(ordinals + [-1], dtype=np.int64)[date_id]
+    second = np.asarray(seconds + [-1], dtype=np.int64)[time_id]
+    has_time = second >= 0
+    hour = second[has_time] // 3600
+    hours = np.bincount(hour, minlength=24).tolist()
+
+    valid = ordinal >= 0
+    weekday = (ordinal[valid] - 1) % 7  # date(1, 1, 1) 的序号为 1，是周一
+    weekdays = np.bincount(weekday, minlength=7).tolist()
+    both = valid & has_time
+    cell = ((ordinal[both] - 1) % 7) * 24 + second[both] // 3600
+    heatmap = np.bincount(cell, minlength=7 * 24).reshape(7, 24).tolist()
+    return per_sender, per_date, hours, weekdays, heatmap
+
+
+def _aggregate_python(stats, n_senders, ordinals, seconds):
+    per_sender = [[0, 0, 0] for _ in range(n_senders + 1)]
+    per_date = [0] * len(ordinals)
+    hours = [0] * 24
+    weekdays = [0] * 7
+    heatmap = [[0] * 24 for _ in range(7)]
+    for sender, date_id, time_id, text_len, image_count in zip(
+            stats.sender_ids, stats.date_ids, stats.time_ids, stats.text_lens, stats.image_counts):
+        row = per_sender[sender if sender >= 0 else n_senders]
+        row[0] += 1
+        row[1] += image_count
+        row[2] += text_len
+        ordinal = ordinals[date_id] if date_id >= 0 else -1
+        second = seconds[time_id] if time_id >= 0 else -1
+        if date_id >= 0:
+            per_date[date_id] += 1
+        if second >= 0:
+            hours[second // 3600] += 1
+        if ordinal >= 0:
+            weekdays[(ordinal - 1) % 7] += 1
+            if second >= 0:
+                heatmap[(ordinal - 1) % 7][second // 3600] += 1
+    return [tuple(row) for row in per_sender], per_date, hours, weekdays, heatmap
+
+
+def compute_stats(records, store=None):
+    """为一组记录（紧凑记录或 dict）计算汇总统计，返回写入 qq_chat.stats.json 的 dict"""
+    stats = ChatStats(store if store is not None else RecordStore())
+    for record in records:
+        stats.add(record)
+    return stats.result()
+
+
+def load_stats(json_file, count=None):
+    """读取 json_file 旁的统计文件；不存在、版本不符或与记录数（count）不一致时返回 None"""
+    path = stats_path_for(json_file)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != STATS_VERSION:
+        return None
+    if count is not None and data.get("count") != count:
+        return None
+    return data
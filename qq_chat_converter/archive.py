@@ -0,0 +1,285 @@
+import os
+import re
+import json
+import mmap
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+
+INDEX_VERSION = "2"
+MISSING_TS = -(1 << 62)  # 没有日期的记录
+TIME_RE = re.compile(r"^(\d{1,2}):(\d{2}):(\d{2})$")
+
+
+def _index_paths(json_file):
+    base = os.path.splitext(json_file)[0]
+    return base + ".archive.json", base + ".archive.bin"
+
+
+def _source_stamp(json_file):
+    st = os.stat(json_file)
+    return f"{INDEX_VERSION}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _utf8(value):
+    """按 latin-1 解码的字符串还原为真正的文本（见 build_archive_index）"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return value.encode("latin-1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return value  # 含 \\u 转义的字符串已经是正确的文本
+
+
+def _timestamp(date_str, time_str=None):
+    """'YYYY-MM-DD' + 'H:MM:SS' -> 从公元元年起的秒数（不涉及时区，只用于排序与区间比较）"""
+    try:
+        day = date.fromisoformat(date_str)
+    except (TypeError, ValueError):
+        return MISSING_TS
+    seconds = 0
+    m = TIME_RE.match(time_str or "")
+    if m:
+        seconds = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + int(m.group(3))
+    return day.toordinal() * 86400 + seconds
+
+
+def _to_timestamp(value, end=False):
+    """查询边界：datetime 精确到秒；date 或 'YYYY-MM-DD' 表示整天（end=True 时为当天最后一秒）"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value) if len(value) > 10 else date.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.toordinal() * 86400 + value.hour * 3600 + value.minute * 60 + value.second
+    return value.toordinal() * 86400 + (86399 if end else 0)
+
+
+def build_archive_index(json_file):
+    """
+    流式扫描导出的 JSON，生成 ChatArchive 使用的索引（<name>.archive.json 元数据 + <name>.archive.bin 数组）：
+    每条记录在文件中的字节偏移与长度、按时间排序的时间戳与记录 id、按发送者分组的记录 id、
+    日期 -> [[start, end), ...] 区间表（与 qq_chat.index.json 相同）。JSON 逐块读取，内存占用与文件大小无关。
+    先写入临时文件再原子替换。
+    """
+    from qq_chat_converter.py_funcs import DateIndex, iter_json_array_spans
+
+    meta_path, bin_path = _index_paths(json_file)
+    stamp = _source_stamp(json_file)  # 扫描前取得：扫描期间 JSON 被替换时，下次打开会重新构建
+
+    starts, lengths, stamps = array("Q"), array("I"), array("q")
+    postings = {}  # 发送者 -> [记录 id]
+    dates = DateIndex()
+    # 按 latin-1 解码：每个字节对应一个字符，解析位置即字节偏移
+    for start, end, record in iter_json_array_spans(json_file, encoding="latin-1"):
+        msg_id = len(starts)
+        starts.append(start)
+        lengths.append(end - start)
+        if isinstance(record, dict):
+            stamps.append(_timestamp(record.get("date"), record.get("time")))
+            date = _utf8(record.get("date"))
+            dates.add(date if isinstance(date, str) else None)
+            sender = _utf8(record.get("sender"))
+            if sender is not None:
+                postings.setdefault(sender, []).append(msg_id)
+        else:
+            stamps.append(MISSING_TS)
+            dates.add(None)
+
+    order = array("I", sorted((i for i in range(len(stamps)) if stamps[i] != MISSING_TS),
+                              key=stamps.__getitem__))
+    sorted_stamps = array("q", (stamps[i] for i in order))
+    senders = sorted(postings)
+    sender_ids = array("I")
+    sender_ranges = []
+    for sender in senders:
+        sender_ranges.append([len(sender_ids), len(postings[sender])])
+        sender_ids.extend(postings[sender])
+
+    layout, offset = {}, 0
+    tmp_bin = bin_path + ".tmp"
+    with open(tmp_bin, "wb") as f:
+        for name, arr in (("starts", starts), ("lengths", lengths), ("order", order),
+                          ("sorted_stamps", sorted_stamps), ("sender_ids", sender_ids)):
+            data = arr.tobytes()
+            layout[name] = [offset, arr.typecode, len(arr)]
+            f.write(data)
+            pad = -len(data) % 8  # 各数组按 8 字节对齐
+            f.write(b"\0" * pad)
+            offset += len(data) + pad
+    meta = {
+        "source": stamp,
+        "count": len(starts),
+        "arrays": layout,
+        "senders": senders,
+        "sender_ranges": sender_ranges,
+        "dates": dates.ranges,
+    }
+    tmp_meta = meta_path + ".tmp"
+    with open(tmp_meta, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_bin, bin_path)
+    os.replace(tmp_meta, meta_path)
+    return meta_path
+
+
+class ChatArchive:
+    """
+    只读访问一个导出目录（或 qq_chat.json）中的聊天记录，无需 json.load 整个文件：
+
+        with ChatArchive("out_dir/chat") as archive:
+            archive[42]                                   # 按 id 随机访问
+            for msg_id, msg in archive.iter_range("2023-03-01", "2023-03-05"): ...
+            for msg_id, msg in archive.by_sender("张三"): ...
+            for msg_id, msg in archive.search("关键词"): ...
+            archive.dates["2023-03-01"]                   # 当天消息的 id 区间 [[start, end), ...]
+            archive.stats()["senders"][:10]               # 发送者排行等汇总（qq_chat.stats.json）
+
+    记录 id 即其在 JSON 列表中的下标（与 /api 查询接口的 originalId 一致）。
+    JSON 与索引文件均以内存映射打开，查询只解码命中的记录；索引在首次打开时构建，
+    JSON 变化后自动重建（见 build_archive_index）。
+    """
+
+    def __init__(self, path):
+        self.json_file = os.path.join(path, "qq_chat.json") if os.path.isdir(path) else path
+        meta_path, bin_path = _index_paths(self.json_file)
+        meta = None
+        if os.path.exists(meta_path) and os.path.exists(bin_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        if meta is None or meta.get("source") != _source_stamp(self.json_file):
+            print(f"[x] 正在构建记录索引：{meta_path}")
+            build_archive_index(self.json_file)
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+
+        self.count = meta["count"]
+        self.senders = meta["senders"]
+        self.dates = meta["dates"]
+        self._sender_ranges = dict(zip(self.senders, meta["sender_ranges"]))
+        self._files, self._maps, self._views = [], [], []
+        self._json = self._map(self.json_file)
+        index = self._map(bin_path)
+        arrays = {}
+        for name, (offset, typecode, length) in meta["arrays"].items():
+            view = memoryview(index)[offset:offset + length * array(typecode).itemsize].cast(typecode)
+            self._views.append(view)
+            arrays[name] = view
+        self._starts = arrays["starts"]
+        self._lengths = arrays["lengths"]
+        self._order = arrays["order"]
+        self._sorted_stamps = arrays["sorted_stamps"]
+        self._sender_ids = arrays["sender_ids"]
+
+    def _map(self, path):
+        f = open(path, "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""  # 空文件无法映射
+        m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        return m
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        for m in self._maps:
+            m.close()
+        for f in self._files:
+            f.close()
+        self._views, self._maps, self._files = [], [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, msg_id):
+        return json.loads(self.raw(msg_id))
+
+    def raw(self, msg_id):
+        """记录在 JSON 文件中的原始文本（UTF-8 字节），不解码"""
+        if not 0 <= msg_id < self.count:
+            raise IndexError(msg_id)
+        start = self._starts[msg_id]
+        return self._json[start:start + self._lengths[msg_id]]
+
+    def _records(self, ids):
+        for msg_id in ids:
+            yield msg_id, self[msg_id]
+
+    def iter_range(self, start=None, end=None):
+        """按时间顺序产出 [start, end] 内的 (id, 记录)；日期边界包含整天，没有日期的记录不会出现"""
+        lo = 0 if start is None else bisect_left(self._sorted_stamps, _to_timestamp(start))
+        hi = len(self._order) if end is None else bisect_right(self._sorted_stamps, _to_timestamp(end, end=True))
+        return self._records(self._order[i] for i in range(lo, hi))
+
+    def by_sender(self, sender):
+        """按记录顺序产出该发送者的 (id, 记录)"""
+        offset, count = self._sender_ranges.get(sender, (0, 0))
+        return self._records(self._sender_ids[i] for i in range(offset, offset + count))
+
+    def search(self, keyword, ignore_case=False):
+        """
+        产出发送者或正文（含转发内容）包含 keyword 的 (id, 记录)。
+        先在内存映射的原始字节中查找，只解码命中的记录再确认。
+        ignore_case=True 时忽略 ASCII 字母的大小写（与查看器的搜索一致）。
+        """
+        if not keyword or not self.count:
+            return
+        needle = json.dumps(keyword, ensure_ascii=False)[1:-1].encode("utf-8")
+        if ignore_case:
+            pattern = re.compile(re.escape(needle), re.IGNORECASE)
+
+            def find(start):
+                m = pattern.search(self._json, start)
+                return m.start() if m else -1
+        else:
+            def find(start):
+                return self._json.find(needle, start)
+
+        pos, last = find(0), -1
+        while pos != -1:
+            msg_id = bisect_right(self._starts, pos) - 1
+            if msg_id != last and msg_id >= 0 and pos < self._starts[msg_id] + self._lengths[msg_id]:
+                last = msg_id
+                record = self[msg_id]
+                if _contains(record, keyword.lower() if ignore_case else keyword, ignore_case):
+                    yield msg_id, record
+            # 跳到下一条记录继续查找
+            nxt = self._starts[msg_id] + self._lengths[msg_id] if msg_id >= 0 else pos + 1
+            pos = find(max(nxt, pos + 1))
+
+    def stats(self):
+        """
+        汇总统计（发送者排行、每日消息量、小时 / 星期热力图，格式见 analytics.ChatStats）。
+        优先读取导出时写出的 qq_chat.stats.json；缺失或与记录数不符时逐条解码计算并写回。
+        """
+        from qq_chat_converter.analytics import compute_stats, load_stats, stats_path_for
+
+        data = load_stats(self.json_file, count=self.count)
+        if data is None:
+            path = stats_path_for(self.json_file)
+            print(f"[x] 正在计算统计摘要：{path}")
+            data = compute_stats(self[i] for i in range(self.count))
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, path)
+        return data
+
+
+def _contains(record, keyword, ignore_case=False):
+    if not isinstance(record, dict):
+        return False
+    for key in ("sender", "text"):
+        value = record.get(key) or ""
+        if keyword in (value.lower() if ignore_case else value):
+            return True
+    return any(_contains(fwd, keyword, ignore_case) for fwd in record.get("forwarded") or ())
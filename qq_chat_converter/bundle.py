@@ -0,0 +1,88 @@
+import os
+import json
+import gzip
+import base64
+
+from qq_chat_converter.analytics import ChatStats
+from qq_chat_converter.records import RecordStore
+from qq_chat_converter.py_funcs import DateIndex, iter_json_array
+
+
+BUNDLE_VERSION = 1
+INDEX_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+CHUNK_BYTES = 256 << 10   # 每块未压缩 JSON 的目标大小：达到后在下一个日期边界切分
+MAX_CHUNK_BYTES = 1 << 20  # 单日消息过多时在日期内部强制切分
+
+
+def _script(tag_id, text, type_):
+    # JSON 中的 "</" 转义为 "<\/"，避免提前结束 <script>（base64 不含这两个字符）
+    text = text.replace("</", "<\\/")
+    return f'<script type="{type_}" id="{tag_id}">{text}</script>\n'
+
+
+def write_viewer_bundle(json_file, bundle_path=None, template=INDEX_HTML, chunk_bytes=CHUNK_BYTES):
+    """
+    把查看器 index.html 与聊天记录流式写成一个可以直接双击打开的单文件 HTML（图片仍引用旁边的图片目录）。
+    记录按日期切分为若干块（约 chunk_bytes），每块 gzip 压缩后以 base64 内嵌在 <script> 中，
+    查看器按需用 DecompressionStream 解压当前日期所在的块；末尾的清单记录各块的记录 id 区间、
+    日期 -> 记录区间与统计摘要。JSON 逐条读取、逐块写出，不需要把整个文件读入内存。
+    返回 bundle_path（默认为 json_file 旁的 qq_chat_viewer.html）。
+    """
+    if bundle_path is None:
+        bundle_path = os.path.join(os.path.dirname(os.path.abspath(json_file)), "qq_chat_viewer.html")
+    with open(template, "r", encoding="utf-8") as f:
+        page = f.read()
+    cut = page.rfind("</body>")
+    if cut < 0:
+        cut = len(page)
+
+    chunks = []    # [首条记录 id, 记录数, 未压缩字节数, 压缩后字节数]
+    dates = DateIndex()  # 日期 -> [[start, end), ...]，与 qq_chat.index.json 相同
+    stats = ChatStats(RecordStore())
+    state = {"count": 0, "pending": [], "size": 0, "last_date": None}
+
+    tmp = bundle_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        out.write(page[:cut])
+
+        def flush():
+            pending = state["pending"]
+            if not pending:
+                return
+            raw = ("[" + ",".join(pending) + "]").encode("utf-8")
+            data = gzip.compress(raw, compresslevel=9, mtime=0)
+            out.write(_script(f"qqcc-chunk-{len(chunks)}", base64.b64encode(data).decode("ascii"),
+                              "application/gzip;base64"))
+            chunks.append([state["count"] - len(pending), len(pending), len(raw), len(data)])
+            state["pending"], state["size"] = [], 0
+
+        for record in iter_json_array(json_file):
+            date = record.get("date") if isinstance(record, dict) else None
+            if state["size"] >= chunk_bytes and (date != state["last_date"] or state["size"] >= MAX_CHUNK_BYTES):
+                flush()
+            dates.add(date if isinstance(date, str) else None)
+            state["last_date"] = date
+            text = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+            state["pending"].append(text)
+            state["size"] += len(text)
+            state["count"] += 1
+            stats.add(record)
+        flush()
+
+        manifest = {
+            "version": BUNDLE_VERSION,
+            "count": state["count"],
+            "chunks": chunks,
+            "dates": dates.ranges,
+            "stats": stats.result(),
+        }
+        out.write(_script("qqcc-bundle", json.dumps(manifest, ensure_ascii=False, separators=(",", ":")),
+                          "application/json"))
+        out.write(page[cut:])
+    os.replace(tmp, bundle_path)
+
+    raw = sum(c[2] for c in chunks)
+    packed = sum(c[3] for c in chunks)
+    print(f"[x] 已生成单文件查看器：{bundle_path}（{state['count']} 条消息，{len(chunks)} 块，"
+          f"数据 {raw / (1 << 20):.1f} MB -> {packed / (1 << 20):.1f} MB）")
+    return bundle_path
@@ -0,0 +1,138 @@
+import os
+import secrets
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from qq_chat_converter.exports import (find_exports, hash_file, rewrite_export_json, rewrite_export_html,
+                                       refresh_viewer_pages)
+from qq_chat_converter.py_funcs import ProgressReporter, list_image_files
+
+ImageFile = namedtuple("ImageFile", "export_dir name path size dev ino")  # name 相对图片目录，/ 分隔
+
+
+def _list_images(export_dir, image_dir_name):
+    image_dir = os.path.join(export_dir, image_dir_name)
+    files = []
+    if not os.path.isdir(image_dir):
+        return files
+    for name in list_image_files(image_dir):
+        path = os.path.join(image_dir, *name.split("/"))
+        if os.path.islink(path):
+            continue
+        st = os.stat(path)  # Windows 上 DirEntry.stat() 不含 st_ino / st_dev
+        files.append(ImageFile(export_dir, name, path, st.st_size, st.st_dev, st.st_ino))
+    files.sort(key=lambda f: f.name)
+    return files
+
+
+def find_duplicate_images(exports, image_dir_name="Image", workers=None, progress=None):
+    """
+    按内容查找各导出目录图片目录中的重复图片，返回 [[ImageFile, ...]]，每组内容相同、至少两个文件，
+    组内第一个为保留的文件（按导出目录的顺序、再按文件名）。
+    只有大小相同的文件才需要计算哈希；已经是同一文件的硬链接直接视为相同，不重复读取。
+    哈希在线程池中并行计算（hashlib 处理大块数据时释放 GIL）。
+    """
+    files = [f for export_dir in exports for f in _list_images(export_dir, image_dir_name)]
+    by_size = {}
+    for f in files:
+        by_size.setdefault(f.size, []).append(f)
+
+    # 同一 inode 只需哈希一次
+    to_hash = {}
+    for same_size in by_size.values():
+        if len(same_size) > 1:
+            for f in same_size:
+                to_hash.setdefault((f.dev, f.ino), f.path)
+
+    bar = ProgressReporter(progress, "hash", len(to_hash), desc="Hashing images", unit="img")
+    digests = {}
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4)) as pool:
+        for key, digest in zip(to_hash, pool.map(hash_file, to_hash.values())):
+            digests[key] = digest
+            bar.update(1)
+    bar.close()
+
+    groups = {}
+    for f in files:
+        key = (f.dev, f.ino)
+        if key in digests:
+            groups.setdefault((f.size, digests[key]), []).append(f)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _link(target, path):
+    """用指向 target 的硬链接原子地替换 path"""
+    tmp = f"{path}.{secrets.token_hex(4)}.link"
+    os.link(target, tmp)
+    try:
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def dedupe_exports(paths, mode="link", dry_run=False, image_dir_name="Image", json_name="qq_chat.json",
+                   workers=None, progress=None):
+    """
+    按内容对一个或多个导出目录中的图片去重，返回报告 dict。
+    mode="link":      重复文件替换为指向保留文件的硬链接，文件名与 JSON 不变；
+    mode="canonical": 同一导出目录内的重复文件删除，JSON（流式重写）与导出的 HTML 改为引用保留的文件，
+                      已有的单文件查看器与静态页面（site/）随之重新生成；
+                      不同导出目录之间无法共用路径，剩余的跨目录重复仍以硬链接合并。
+    dry_run=True 时只统计可回收的字节数，不修改任何文件。
+    硬链接要求文件位于同一文件系统，无法创建时保留原文件并计入 link_errors。
+    """
+    exports = find_exports(paths, json_name)
+    groups = find_duplicate_images(exports, image_dir_name, workers=workers, progress=progress)
+    report = {"exports": len(exports), "groups": len(groups), "duplicates": 0, "reclaimed_bytes": 0,
+              "removed": 0, "linked": 0, "link_errors": 0, "json_rewritten": 0, "records_rewritten": 0}
+
+    links = []      # (保留文件, 重复文件)
+    removals = {}   # 导出目录 -> {重复文件名: 保留文件名}
+    for group in groups:
+        canonical = group[0]
+        kept = {canonical.export_dir: canonical}
+        # 完成后组内只剩保留文件的 inode，其余每个不同的 inode 回收一份空间
+        report["reclaimed_bytes"] += canonical.size * (len({(f.dev, f.ino) for f in group}) - 1)
+        for f in group[1:]:
+            report["duplicates"] += 1
+            if mode == "canonical" and f.export_dir in kept:
+                removals.setdefault(f.export_dir, {})[f.name] = kept[f.export_dir].name
+                continue
+            if mode == "canonical":
+                kept[f.export_dir] = f
+            if (f.dev, f.ino) != (canonical.dev, canonical.ino):
+                links.append((canonical, f))
+
+    if dry_run:
+        report["removed"] = sum(len(r) for r in removals.values())
+        report["linked"] = len(links)
+        report["json_rewritten"] = len(removals)
+        return report
+
+    for export_dir, rename in removals.items():
+        # 先写回 JSON 与 HTML，再删除重复文件，中途失败不会留下指向已删除图片的 JSON
+        json_file = os.path.join(export_dir, json_name)
+        report["records_rewritten"] += rewrite_export_json(json_file, rename, image_dir_name)
+        report["json_rewritten"] += 1
+        html_file = os.path.join(export_dir, "qq_chat.html")
+        if os.path.exists(html_file):
+            rewrite_export_html(html_file, rename, image_dir_name)
+        refresh_viewer_pages(export_dir, json_file, os.path.join(export_dir, image_dir_name))
+        for name in rename:
+            os.remove(os.path.join(export_dir, image_dir_name, *name.split("/")))
+            report["removed"] += 1
+
+    failed = set()
+    for canonical, f in links:
+        try:
+            _link(canonical.path, f.path)
+            report["linked"] += 1
+        except OSError as e:
+            report["link_errors"] += 1
+            if (f.dev, f.ino) not in failed:
+                failed.add((f.dev, f.ino))
+                report["reclaimed_bytes"] -= f.size
+            print(f"[x] 无法创建硬链接 {f.path} -> {canonical.path}: {e}")
+    return report
@@ -0,0 +1,140 @@
+import os
+import re
+import hashlib
+import secrets
+
+from qq_chat_converter.bundle import INDEX_HTML, write_viewer_bundle
+from qq_chat_converter.py_funcs import iter_json_array, write_json_list, write_export_version, lines_path_for, write_json_lines_copy
+
+
+HASH_BLOCK = 1 << 20
+IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]*)(")', re.IGNORECASE)
+
+
+def find_exports(paths, json_name="qq_chat.json"):
+    """导出目录列表：paths 中的每一项可以是导出目录本身，也可以是包含多个导出目录的上级目录（只查找一层）"""
+    exports = []
+    for path in paths:
+        if os.path.isfile(os.path.join(path, json_name)):
+            exports.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            sub = os.path.join(path, name)
+            if os.path.isfile(os.path.join(sub, json_name)):
+                exports.append(sub)
+    result, seen = [], set()
+    for path in exports:
+        real = os.path.realpath(path)
+        if real not in seen:
+            seen.add(real)
+            result.append(path)
+    return result
+
+
+def hash_file(path):
+    """文件内容的 blake2b 哈希（20 字节），分块读取"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK)
+            if not block:
+                return h.digest()
+            h.update(block)
+
+
+def _json_is_compact(json_file):
+    with open(json_file, "r", encoding="utf-8") as f:
+        head = f.read(2)
+    return head[1:2] != "\n"
+
+
+def image_rel(value, image_dir_name):
+    """JSON 中的图片路径 -> (前缀, 相对图片目录的路径)：去重前形如 Image/xxx.jpg，去重后不含图片目录名"""
+    value = value.replace("\\", "/")
+    prefix = image_dir_name + "/"
+    if value.startswith(prefix):
+        return prefix, value[len(prefix):]
+    return "", value
+
+
+def rewrite_record_images(record, rename, image_dir_name="Image"):
+    """把记录（含转发内容）中指向 rename 的键（相对图片目录的路径）的图片换成对应的值，返回是否有改动"""
+    if not isinstance(record, dict):
+        return False
+    changed = False
+    for key in ("images", "image"):
+        if key not in record:
+            continue
+        value = record[key]
+        paths = value if isinstance(value, list) else [value]
+        new = []
+        for p in paths:
+            if isinstance(p, str):
+                prefix, rel = image_rel(p, image_dir_name)
+                if rel in rename:
+                    p = prefix + rename[rel]
+                    changed = True
+            new.append(p)
+        record[key] = new if isinstance(value, list) else new[0]
+    for fwd in record.get("forwarded") or ():
+        changed = rewrite_record_images(fwd, rename, image_dir_name) or changed
+    return changed
+
+
+def rewrite_export_json(json_file, rename, image_dir_name="Image"):
+    """流式读取并重写 JSON（保持原有的缩进风格与 .gz 副本），同时更新版本文件与 JSON Lines 副本；返回改写的记录数"""
+    compact = _json_is_compact(json_file)
+    gzip_copy = os.path.exists(json_file + ".gz")
+    stats = {"count": 0, "changed": 0}
+
+    def records():
+        for record in iter_json_array(json_file):
+            stats["count"] += 1
+            stats["changed"] += rewrite_record_images(record, rename, image_dir_name)
+            yield record
+
+    tmp = f"{json_file}.{secrets.token_hex(4)}.tmp"
+    try:
+        digest = write_json_list(records(), tmp, compact=compact, gzip_copy=gzip_copy)
+    except BaseException:
+        for p in (tmp, tmp + ".gz"):
+            if os.path.exists(p):
+                os.remove(p)
+        raise
+    os.replace(tmp, json_file)
+    if gzip_copy:
+        os.replace(tmp + ".gz", json_file + ".gz")
+    write_export_version(json_file, digest, stats["count"])
+    if os.path.exists(lines_path_for(json_file)):
+        write_json_lines_copy(json_file, gzip_copy=os.path.exists(lines_path_for(json_file) + ".gz"))
+    return stats["changed"]
+
+
+def rewrite_export_html(html_file, rename, image_dir_name):
+    """逐行改写导出的 HTML 中的 <img src>：指向 rename 的键（相对图片目录的路径）的换成对应的值"""
+    prefix = image_dir_name + "/"
+
+    def sub(m):
+        src = m.group(2).replace("\\", "/")
+        rel = src[len(prefix):]
+        if src.startswith(prefix) and rel in rename:
+            return m.group(1) + prefix + rename[rel] + m.group(3)
+        return m.group(0)
+
+    tmp = f"{html_file}.{secrets.token_hex(4)}.tmp"
+    with open(html_file, "r", encoding="utf-8", newline="") as src, \
+            open(tmp, "w", encoding="utf-8", newline="") as dst:
+        for line in src:
+            dst.write(IMG_SRC_RE.sub(sub, line))
+    os.replace(tmp, html_file)
+
+
+def refresh_viewer_pages(export_dir, json_file, image_dir):
+    """JSON 改写后重新生成导出目录中已有的单文件查看器（qq_chat_viewer.html）与静态页面（site/）"""
+    bundle_file = os.path.join(export_dir, "qq_chat_viewer.html")
+    if os.path.exists(bundle_file):
+        write_viewer_bundle(json_file, bundle_file, template=INDEX_HTML)
+    site_dir = os.path.join(export_dir, "site")
+    if os.path.isdir(site_dir):
+        from qq_chat_converter.static_site import export_static_site
+        export_static_site(json_file, site_dir, image_dir=image_dir)
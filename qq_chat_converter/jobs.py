@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import shutil
+import signal
+
+from contextlib import redirect_stdout, redirect_stderr
+
+from qq_chat_converter.py_funcs import (ExportOptions, export_from_mht, deduplicate_images, index_path_for,
+                                        write_json_lines_copy)
+from qq_chat_converter.bundle import write_viewer_bundle
+
+
+INDEX_HTML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+
+
+def convert_to_dir(mht_path, out_dir, options=None, progress=None, cancel=None, bundle=False, json_lines=False,
+                   **option_kwargs):
+    """
+    完整的转换流程：导出 JSON / HTML / 图片 -> 图片去重 -> 复制查看器 index.html。
+    options 为导出选项 ExportOptions（也可以直接以关键字参数传入其中的选项，见 py_funcs.ExportOptions）。
+    bundle=True 时另外生成内嵌压缩数据、可直接双击打开的单文件查看器 qq_chat_viewer.html。
+    json_lines=True 时另外写出 qq_chat.jsonl，查看器边下载边逐批显示，不必等整个 JSON 下载解析完。
+    返回本次转换的统计信息（字节数、消息数、耗时）。
+    """
+    if options is None:
+        options = ExportOptions(**option_kwargs)
+    elif option_kwargs:
+        raise TypeError(f"已指定 options，不能再单独传入导出选项：{', '.join(option_kwargs)}")
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    json_out = os.path.join(out_dir, "qq_chat.json")
+
+    export_from_mht(
+        mht_path=mht_path,
+        json_out=json_out,
+        html_out=os.path.join(out_dir, "qq_chat.html"),
+        image_dir_name="Image",  # folder name only!
+        options=options,
+        progress=progress,
+        cancel=cancel,
+    )
+    deduplicate_images(
+        image_dir=os.path.join(out_dir, "Image"),
+        json_file=json_out,
+        json_out=json_out,
+        compact_json=options.compact_json,
+        gzip_json=options.gzip_json,
+        progress=progress,
+        cancel=cancel,
+    )
+    if json_lines:
+        write_json_lines_copy(json_out, gzip_copy=options.gzip_json)
+    shutil.copy(INDEX_HTML, os.path.join(out_dir, "index.html"))
+    if bundle:
+        write_viewer_bundle(json_out, os.path.join(out_dir, "qq_chat_viewer.html"), template=INDEX_HTML)
+
+    with open(index_path_for(json_out), "r", encoding="utf-8") as f:
+        messages = json.load(f)["count"]
+    return {
+        "mht_path": mht_path,
+        "out_dir": out_dir,
+        "bytes": os.path.getsize(mht_path),
+        "messages": messages,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+class _QueueWriter:
+    """把工作进程中的 print 输出转发到事件队列"""
+
+    def __init__(self, job_id, events):
+        self.job_id = job_id
+        self.events = events
+
+    def write(self, text):
+        if text:
+            self.events.put((self.job_id, "log", text))
+
+    def flush(self):
+        pass
+
+
+def run_job(job_id, mht_path, out_dir, events, cancel=None, **options):
+    """
+    进程池中的任务入口。进度与日志以 (job_id, kind, payload) 的形式放入 events
+    （multiprocessing.Manager().Queue()），cancel 为 Manager().Event()。
+    """
+    writer = _QueueWriter(job_id, events)
+    with redirect_stdout(writer), redirect_stderr(writer):
+        return convert_to_dir(
+            mht_path, out_dir,
+            progress=lambda ev: events.put((job_id, "progress", ev)),
+            cancel=cancel,
+            **options,
+        )
+
+
+_worker_cancel = None
+
+
+def init_worker(cancel=None):
+    """
+    常驻工作进程的 initializer：导入本模块时已加载转换引擎（bs4 / lxml / tqdm），
+    进程在整个进程池生命周期内复用，之后的任务不再付出解释器启动与导入的开销。
+    工作进程忽略 Ctrl+C，由主进程置位共享的 cancel（multiprocessing.Event）统一停止。
+    """
+    global _worker_cancel
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # 不继承主进程的处理函数
+    _worker_cancel = cancel
+
+
+def run_logged_job(mht_path, out_dir, log_path, **options):
+    """后台任务入口：输出写入 log_path（不显示进度条），取消事件为 init_worker 传入的 cancel"""
+    with open(log_path, "a", encoding="utf-8") as log, redirect_stdout(log), redirect_stderr(log):
+        print(f"[x] {time.strftime('%Y-%m-%d %H:%M:%S')} {mht_path} -> {out_dir}")
+        return convert_to_dir(mht_path, out_dir, progress=lambda ev: None, cancel=_worker_cancel, **options)
@@ -0,0 +1,104 @@
+import os
+import filecmp
+import shutil
+
+from qq_chat_converter.exports import find_exports, rewrite_export_json, rewrite_export_html, refresh_viewer_pages
+from qq_chat_converter.py_funcs import ProgressReporter, IMAGE_LAYOUTS, image_rel_path, list_image_files
+
+
+COPY_SUFFIX = ".layout-tmp"  # 不支持硬链接时复制到新位置所用的临时文件
+
+
+def _same_file(a, b):
+    """同一文件的两个硬链接，或（不支持硬链接时复制出的）内容相同的两个文件"""
+    return os.path.samefile(a, b) or filecmp.cmp(a, b, shallow=False)
+
+
+def _copy(src, dst):
+    tmp = dst + COPY_SUFFIX
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)  # 中断时新位置要么不存在，要么是完整的副本
+
+
+def _plan(image_dir, layout):
+    """
+    图片目录中需要移动的文件：{当前相对路径: 目标相对路径}。
+    上次转换中断后，旧路径与新位置可能是同一文件的两个硬链接（或内容相同的副本）：旧路径照常列入
+    （JSON 可能仍指向它），新位置不再重复列出；只有内容不同的文件映射到同一目标时才报错。
+    """
+    rename, targets = {}, {}
+    for rel in list_image_files(image_dir):
+        if rel.endswith(COPY_SUFFIX):
+            continue  # 中断的复制留下的临时文件，重新运行时会被覆盖
+        target = image_rel_path(rel.rsplit("/", 1)[-1], layout)
+        other = targets.get(target)
+        if other is None:
+            targets[target] = rel
+        elif not _same_file(os.path.join(image_dir, *other.split("/")), os.path.join(image_dir, *rel.split("/"))):
+            raise RuntimeError(f"图片文件名重复，无法转换布局：{other} 与 {rel}")
+        if target != rel:
+            rename[rel] = target
+    return rename
+
+
+def _remove_empty_dirs(image_dir):
+    for root, _, _ in os.walk(image_dir, topdown=False):
+        if root != image_dir:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+
+def migrate_image_layout(paths, layout="fanout", dry_run=False, image_dir_name="Image", json_name="qq_chat.json",
+                         progress=None):
+    """
+    把一个或多个导出目录的图片目录转换为 layout 布局（"fanout"：Image/ab/cd/<name>，"flat"：全部放在 Image 下），
+    paths 的含义与 exports.find_exports 相同。返回报告 dict。
+    每个导出目录依次：在新位置创建硬链接（旧路径仍然有效）-> 流式重写 JSON（含 .gz、JSON Lines 副本与版本文件）、
+    导出的 HTML、单文件查看器与静态页面 -> 删除旧路径。中途中断时 JSON 指向的文件始终存在，重新运行即可继续。
+    不支持硬链接的文件系统上改为先复制到新位置（临时占用双倍空间），同样在 JSON 写回之后才删除旧路径。
+    """
+    if layout not in IMAGE_LAYOUTS:
+        raise ValueError(f"未知的图片目录布局：{layout}")
+    exports = find_exports(paths, json_name)
+    report = {"exports": len(exports), "moved": 0, "json_rewritten": 0, "records_rewritten": 0}
+    for export_dir in exports:
+        image_dir = os.path.join(export_dir, image_dir_name)
+        if not os.path.isdir(image_dir):
+            continue
+        rename = _plan(image_dir, layout)
+        if dry_run or not rename:
+            report["moved"] += len(rename)
+            continue
+
+        bar = ProgressReporter(progress, "layout", len(rename), desc="Linking images", unit="img")
+        for rel, target in rename.items():
+            src = os.path.join(image_dir, *rel.split("/"))
+            dst = os.path.join(image_dir, *target.split("/"))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.exists(dst):
+                if not _same_file(src, dst):
+                    raise RuntimeError(f"目标文件已存在：{dst}")
+            else:
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    _copy(src, dst)
+            bar.update(1)
+        bar.close()
+
+        json_file = os.path.join(export_dir, json_name)
+        report["records_rewritten"] += rewrite_export_json(json_file, rename, image_dir_name)
+        report["json_rewritten"] += 1
+        html_file = os.path.join(export_dir, "qq_chat.html")
+        if os.path.exists(html_file):
+            rewrite_export_html(html_file, rename, image_dir_name)
+        refresh_viewer_pages(export_dir, json_file, image_dir)
+
+        for rel in rename:
+            os.remove(os.path.join(image_dir, *rel.split("/")))
+        _remove_empty_dirs(image_dir)
+        report["moved"] += len(rename)
+        print(f"[x] {export_dir}：{len(rename)} 张图片已转换为 {layout} 布局")
+    return report
@@ -0,0 +1,263 @@
+import os
+import json
+import heapq
+import shutil
+import hashlib
+import tempfile
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from qq_chat_converter.analytics import ChatStats, time_seconds, stats_path_for
+from qq_chat_converter.bundle import INDEX_HTML, write_viewer_bundle
+from qq_chat_converter.exports import hash_file, image_rel
+from qq_chat_converter.records import RecordStore
+from qq_chat_converter.py_funcs import (ProgressReporter, DateIndex, iter_json_array, write_json, write_json_list,
+                                        write_export_version, write_json_lines_copy, index_path_for, image_rel_path,
+                                        IMAGE_LAYOUTS)
+
+
+class _MergeInput:
+    """一个待合并的导出目录：图片按内容哈希（只读文件，不重新解码），记录按 (日期, 时间) 顺序流式读取"""
+
+    def __init__(self, export_dir, image_dir_name, json_name):
+        self.export_dir = export_dir
+        self.image_dir_name = image_dir_name
+        self.image_dir = os.path.join(export_dir, image_dir_name)
+        self.json_file = os.path.join(export_dir, json_name)
+        self.digests = {}      # 相对图片目录的路径（/ 分隔）-> 内容哈希
+        self.out_of_order = 0  # 日期倒退的记录数：这些记录与其他输入中相同的消息可能不在同一窗口
+
+    def image_files(self):
+        for root, _, files in os.walk(self.image_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.image_dir).replace(os.sep, "/"), path
+
+    def image_path(self, value):
+        """JSON 中的图片路径（去重前含图片目录名，去重后相对图片目录）-> 相对图片目录的路径"""
+        return image_rel(value, self.image_dir_name)[1]
+
+    def image_digest(self, value):
+        return self.digests.get(self.image_path(value)) if isinstance(value, str) else None
+
+    def keyed_records(self, index):
+        """产出 (排序键, 输入序号, 序号, 记录)；没有日期 / 时间的记录沿用上一条的排序键，保持原位置"""
+        key, last = ("", -1), None
+        for seq, record in enumerate(iter_json_array(self.json_file)):
+            if isinstance(record, dict) and record.get("date"):
+                seconds = time_seconds(record.get("time"))
+                key = (record["date"], seconds if seconds >= 0 else key[1])
+            if last is not None and key[0] < last:
+                self.out_of_order += 1
+            last = key[0]
+            yield key, index, seq, record
+
+
+def _image_values(record):
+    """记录（含转发内容）中引用的所有图片路径"""
+    for key in ("images", "image"):
+        value = record.get(key)
+        if isinstance(value, list):
+            yield from value
+        elif value:
+            yield value
+    for fwd in record.get("forwarded") or ():
+        if isinstance(fwd, dict):
+            yield from _image_values(fwd)
+
+
+def _content(item):
+    """去掉图片路径后的内容（图片另按内容哈希比较）"""
+    if not isinstance(item, dict):
+        return item
+    return {k: [_content(fwd) for fwd in v] if k == "forwarded" and v else v
+            for k, v in item.items() if k not in ("images", "image")}
+
+
+def _fingerprint(record, source):
+    """发送者、日期、时间、正文（含转发内容）哈希与图片内容哈希；图片缺失时以文件名代替"""
+    images = tuple(source.image_digest(v) or f"missing:{os.path.basename(str(v))}"
+                   for v in dict.fromkeys(_image_values(record)))
+    body = json.dumps([record.get("text"), [_content(fwd) for fwd in record.get("forwarded") or ()]],
+                      ensure_ascii=False, sort_keys=True)
+    text_hash = hashlib.blake2b(body.encode("utf-8"), digest_size=16).digest()
+    return record.get("sender"), record.get("date"), record.get("time"), text_hash, images
+
+
+def _deduplicated(stream, inputs, stats):
+    """
+    按日期为窗口去重：某个指纹在输入 i 中累计出现的次数超过已输出的次数时才输出，
+    因此每个指纹保留的条数等于各输入中出现次数的最大值，同一份导出中本来就重复的消息
+    （例如同一秒连发的相同内容）不会被合并；同一日期内的时间顺序不影响结果。内存只与单日消息数有关。
+    """
+    date, seen, emitted = None, {}, Counter()
+    for key, i, _, record in stream:
+        if key[0] != date:
+            date, seen, emitted = key[0], {}, Counter()
+        fp = _fingerprint(record, inputs[i])
+        counts = seen.setdefault(i, Counter())
+        counts[fp] += 1
+        stats["records_in"] += 1
+        if counts[fp] > emitted[fp]:
+            emitted[fp] += 1
+            yield inputs[i], record
+        else:
+            stats["duplicates"] += 1
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class _ImageSink:
+    """
+    把保留下来的记录引用的图片放入合并后的图片目录：同一内容只放一份（硬链接，跨文件系统时复制），
+    沿用原文件名，重名而内容不同时在扩展名前加上内容哈希；按 layout 放入图片目录（见 image_rel_path）。
+    """
+
+    def __init__(self, image_dir, layout="flat"):
+        self.image_dir = image_dir
+        self.layout = layout
+        self.by_digest = {}  # 内容哈希 -> 输出路径（相对图片目录）
+        self.names = set()
+        self.written = self.shared = 0
+
+    def place(self, value, source):
+        if not isinstance(value, str):
+            return value
+        digest = source.image_digest(value)
+        if digest is None:
+            return value  # 原导出中已缺失的图片：保留原路径
+        rel = self.by_digest.get(digest)
+        if rel is not None:
+            self.shared += 1
+            return rel
+        name = os.path.basename(value.replace("\\", "/"))
+        if name in self.names:
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}.{digest.hex()[:12]}{ext}"
+        rel = image_rel_path(name, self.layout)
+        dst = os.path.join(self.image_dir, *rel.split("/"))
+        if self.layout != "flat":
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _link_or_copy(os.path.join(source.image_dir, *source.image_path(value).split("/")), dst)
+        self.by_digest[digest] = rel
+        self.names.add(name)
+        self.written += 1
+        return rel
+
+    def rewrite(self, record, source):
+        record = dict(record)
+        if isinstance(record.get("images"), list):
+            record["images"] = [self.place(v, source) for v in record["images"]]
+        if record.get("image"):
+            record["image"] = self.place(record["image"], source)
+        if record.get("forwarded"):
+            record["forwarded"] = [self.rewrite(fwd, source) if isinstance(fwd, dict) else fwd
+                                   for fwd in record["forwarded"]]
+        return record
+
+
+def merge_exports(inputs, out_dir, compact_json=False, gzip_json=False, json_lines=False, bundle=False,
+                  image_layout="flat", image_dir_name="Image", json_name="qq_chat.json", workers=None, progress=None,
+                  **convert_options):
+    """
+    把同一聊天的多份导出合并为一个导出目录 out_dir：inputs 可以是已转换的输出目录，也可以是 MHT 文件
+    （先转换到 out_dir 下的临时目录，合并后删除）。
+    各输入的记录按 (日期, 时间) 流式 k 路归并，以指纹（发送者、日期、时间、正文哈希、图片内容哈希）去掉重叠部分；
+    JSON 逐条读取、逐条写出，内存占用与记录总数无关。图片只按文件内容计算哈希，不重新解码，
+    相同内容只保留一份，按 image_layout 放置。输出与普通导出相同（JSON、索引、统计、版本、查看器），但没有 qq_chat.html。
+    返回报告 dict。
+    """
+    from qq_chat_converter.jobs import convert_to_dir
+
+    if image_layout not in IMAGE_LAYOUTS:
+        raise ValueError(f"未知的图片目录布局：{image_layout}")
+    out_dir = os.path.abspath(out_dir)
+    json_out = os.path.join(out_dir, json_name)
+    image_dir = os.path.join(out_dir, image_dir_name)
+    if os.path.exists(json_out) or os.path.isdir(image_dir) and os.listdir(image_dir):
+        raise FileExistsError(f"输出目录中已有导出，请指定新的目录：{out_dir}")
+    os.makedirs(image_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".merge-", dir=out_dir)
+    try:
+        sources = []
+        for n, path in enumerate(inputs):
+            if os.path.isfile(path):
+                export_dir = os.path.join(staging, str(n))
+                print(f"[x] 转换 {path}")
+                convert_to_dir(path, export_dir, progress=progress, **convert_options)
+            elif os.path.isfile(os.path.join(path, json_name)):
+                export_dir = path
+            else:
+                raise FileNotFoundError(f"不是 MHT 文件或导出目录：{path}")
+            sources.append(_MergeInput(export_dir, image_dir_name, json_name))
+
+        files = [(source, rel, path) for source in sources for rel, path in source.image_files()]
+        bar = ProgressReporter(progress, "hash", len(files), desc="Hashing images", unit="img")
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4)) as pool:
+            for (source, rel, _), digest in zip(files, pool.map(hash_file, [f[2] for f in files])):
+                source.digests[rel] = digest
+                bar.update(1)
+        bar.close()
+        del files
+
+        sink = _ImageSink(image_dir, image_layout)
+        stats = {"records_in": 0, "duplicates": 0}
+        date_index = DateIndex()
+        chat_stats = ChatStats(RecordStore())
+        bar = ProgressReporter(progress, "merge", desc="Merging", unit="msg")
+
+        def merged():
+            streams = [source.keyed_records(i) for i, source in enumerate(sources)]
+            for source, record in _deduplicated(heapq.merge(*streams), sources, stats):
+                record = sink.rewrite(record, source)
+                date_index.add(record.get("date"))
+                chat_stats.add(record)
+                bar.update(1)
+                yield record
+
+        tmp = json_out + ".tmp"
+        try:
+            digest = write_json_list(merged(), tmp, compact=compact_json, gzip_copy=gzip_json)
+        except BaseException:
+            for p in (tmp, tmp + ".gz"):
+                if os.path.exists(p):
+                    os.remove(p)
+            raise
+        bar.close()
+        os.replace(tmp, json_out)
+        if gzip_json:
+            os.replace(tmp + ".gz", json_out + ".gz")
+        elif os.path.exists(json_out + ".gz"):
+            os.remove(json_out + ".gz")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    write_json(date_index.result(), index_path_for(json_out), compact=True, gzip_copy=gzip_json)
+    write_export_version(json_out, digest, date_index.count)
+    write_json(chat_stats.result(), stats_path_for(json_out), compact=True)
+    if json_lines:
+        write_json_lines_copy(json_out, gzip_copy=gzip_json)
+    shutil.copy(INDEX_HTML, os.path.join(out_dir, "index.html"))
+    if bundle:
+        write_viewer_bundle(json_out, os.path.join(out_dir, "qq_chat_viewer.html"), template=INDEX_HTML)
+
+    out_of_order = sum(source.out_of_order for source in sources)
+    if out_of_order:
+        print(f"[x] 有 {out_of_order} 条记录的日期早于前一条（导出顺序不连续），这些记录中的重复消息可能没有合并")
+    print(f"[x] 合并完成：{len(sources)} 份导出，{stats['records_in']} 条记录 -> {date_index.count} 条，"
+          f"去掉重复 {stats['duplicates']} 条；图片 {sink.written} 张（另有 {sink.shared} 处引用共用已有图片）")
+    return {
+        "inputs": len(sources),
+        "records_in": stats["records_in"],
+        "records_out": date_index.count,
+        "duplicates": stats["duplicates"],
+        "images": sink.written,
+        "images_shared": sink.shared,
+        "out_of_order": out_of_order,
+    }
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import secrets
+
+
+CACHE_VERSION = "1"
+DEFAULT_CACHE_SIZE = 2 << 30
+SAMPLE_BLOCKS = 16
+SAMPLE_SIZE = 1 << 20
+STALE_STAGING = 24 * 3600  # 超过一天的暂存目录视为中断的写入，淘汰时清理
+
+
+def source_key(mht_path):
+    """
+    MHT 的缓存键：文件大小 + 修改时间 + 快速内容哈希。
+    哈希只读取均匀分布的 SAMPLE_BLOCKS 个 1 MB 块（含首尾），与文件大小无关，几 GB 的文件也只需几毫秒。
+    """
+    st = os.stat(mht_path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{CACHE_VERSION}:{st.st_size}".encode("ascii"))
+    with open(mht_path, "rb") as f:
+        if st.st_size <= SAMPLE_BLOCKS * SAMPLE_SIZE:
+            h.update(f.read())
+        else:
+            step = (st.st_size - SAMPLE_SIZE) // (SAMPLE_BLOCKS - 1)
+            for i in range(SAMPLE_BLOCKS):
+                f.seek(i * step)
+                h.update(f.read(SAMPLE_SIZE))
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}-{h.hexdigest()}"
+
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except OSError:
+            pass
+    return total
+
+
+class CacheEntry:
+    """
+    一份缓存的解析结果（目录 <cache_dir>/<key>）：
+    meta.json     占位符 token、各占位符对应的原始 src、<img> -> 附件的匹配、附件在 MHT 中的偏移表、记录数
+    page.html     img src 替换为占位符的 HTML（输出时按图片目录填回）
+    records.jsonl 解析出的记录，图片为原始 src，每行一条
+    """
+    META = "meta.json"
+    PAGE = "page.html"
+    RECORDS = "records.jsonl"
+
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = meta
+        self.page_path = os.path.join(path, self.PAGE)
+        self.records_path = os.path.join(path, self.RECORDS)
+
+
+class _Staging(CacheEntry):
+    """写入中的缓存条目：在暂存目录中写好全部文件后 commit 原子地换入"""
+
+    def __init__(self, cache, key):
+        super().__init__(os.path.join(cache.cache_dir, f".tmp-{secrets.token_hex(8)}"))
+        self.cache = cache
+        self.key = key
+        os.makedirs(self.path)
+
+    def commit(self, meta):
+        meta = dict(meta, version=CACHE_VERSION, key=self.key)
+        with open(os.path.join(self.path, self.META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        target = os.path.join(self.cache.cache_dir, self.key)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(self.path, target)
+        self.cache.evict(keep=self.key)
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ParseCache:
+    """
+    MHT 解析结果的磁盘缓存，按 source_key 查找，总大小超过 max_bytes 时按最近使用时间淘汰（LRU）。
+    只缓存解析结果本身：图片数据不复制，以偏移表的形式引用原 MHT，命中时再按偏移读取解码。
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        """返回命中的 CacheEntry 并标记为最近使用；未命中返回 None"""
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(path, CacheEntry.META), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != CACHE_VERSION or meta.get("key") != key:
+            return None
+        os.utime(os.path.join(path, CacheEntry.META))  # 最近使用时间
+        return CacheEntry(path, meta)
+
+    def begin(self, key):
+        """开始写入一个条目，完成后调用 commit(meta)，失败时调用 discard()"""
+        return _Staging(self, key)
+
+    def entries(self):
+        """[(最近使用时间, 大小, key)]，按最近使用时间从旧到新排列"""
+        result = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                used = os.path.getmtime(os.path.join(path, CacheEntry.META))
+            except OSError:
+                used = 0  # 不完整的条目最先淘汰
+            try:
+                size = _dir_size(path)
+            except OSError:
+                continue  # 同时进行的转换刚刚替换或淘汰了这个条目
+            result.append((used, size, name))
+        result.sort()
+        return result
+
+    def evict(self, keep=None):
+        """删除最久未使用的条目，直到总大小不超过 max_bytes；keep 指定的条目最后才考虑"""
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if not name.startswith(".tmp-"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stale = now - os.path.getmtime(path) > STALE_STAGING
+            except OSError:
+                continue  # 同时进行的转换已经换入或丢弃了它的暂存目录
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+
+        entries = self.entries()
+        entries.sort(key=lambda e: e[2] == keep)  # 稳定排序：keep 移到最后，其余保持 LRU 顺序
+        total = sum(e[1] for e in entries)
+        for used, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+            if name == keep:
+                print(f"[x] 解析结果 {size / (1 << 20):.1f} MB 超过缓存上限 {self.max_bytes / (1 << 20):.1f} MB，未缓存")
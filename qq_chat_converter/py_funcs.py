@@ -1,12 +1,37 @@
 import os
 import re
+import gzip
+import hashlib
 import json
+import time
 import email
+import sys
+import queue
+import quopri
+import binascii
+import secrets
+import shutil
+import tempfile
+import threading
 
 from tqdm import tqdm  
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from email import policy
+from email.parser import BytesHeaderParser
 from urllib.parse import unquote
 from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution
+
+from qq_chat_converter.records import RecordStore, MessageRecord, ForwardedRecord
+from qq_chat_converter.analytics import ChatStats, stats_path_for
+from qq_chat_converter.parse_cache import ParseCache, source_key
+from qq_chat_converter.transcode import ImageTranscoder
+
+try:
+    import resource  # 仅用于报告进程内存峰值，Windows 上没有
+except ImportError:
+    resource = None
 
 
 IMG_EXT_BY_MIME = {
@@ -17,9 +42,94 @@ IMG_EXT_BY_MIME = {
     "image/webp": ".webp",
 }
 
+IMAGE_LAYOUTS = ("flat", "fanout")
+JSON_READ_BLOCK = 1 << 20  # iter_json_array 每次读取的字符数
+
 DATETIME_RE = re.compile(r"\d{4}[-/]\d{2}[-/]\d{2}[\s\u00A0\u202F]*\d{1,2}:\d{2}:\d{2}")
 TIME_ONLY = re.compile(r"\b(\d{1,2}:\d{2}:\d{2})\b")
 DATE_LINE_RE = re.compile(r"日期[:：]\s*(\d{4}-\d{2}-\d{2})")
+DATE_ROW_RE = re.compile(r"<tr[^>]*>\s*<td[^>]*>\s*日期[:：]\s*(\d{4}-\d{2}-\d{2})", re.IGNORECASE)
+
+
+# 结构化进度事件：stage ∈ {"read", "parts", "images", "messages", "dedup"}；total 未知时为 None
+ProgressEvent = namedtuple("ProgressEvent", ["stage", "done", "total", "bytes"])
+
+
+class ProgressReporter:
+    """
+    未提供回调时退化为 tqdm 进度条（命令行行为不变）；
+    提供回调时按时间节流发送 ProgressEvent，回调次数与迭代次数无关，不拖慢处理。
+    """
+
+    def __init__(self, progress, stage, total=None, desc=None, unit="it", interval=0.05):
+        self.progress = progress
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self.bytes = 0
+        self.interval = interval
+        self._last = 0.0
+        self._bar = tqdm(total=total, desc=desc, unit=unit) if progress is None else None
+
+    def update(self, n=1, nbytes=0):
+        self.done += n
+        self.bytes += nbytes
+        if self._bar is not None:
+            if n:
+                self._bar.update(n)
+            return
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.progress(ProgressEvent(self.stage, self.done, self.total, self.bytes))
+
+    def close(self):
+        if self._bar is not None:
+            self._bar.close()
+        else:
+            self.progress(ProgressEvent(self.stage, self.done, self.total, self.bytes))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConversionCancelled(Exception):
+    """转换被取消（cancel 事件被置位）"""
+
+
+class _CancelCheck:
+    """
+    在循环中调用，按时间间隔检查取消事件，发现取消时抛出 ConversionCancelled。
+    cancel 可以是 threading.Event 或 multiprocessing 的 Event（跨进程代理的 is_set 较慢，因此要节流）。
+    """
+
+    def __init__(self, cancel, interval=0.1):
+        self.cancel = cancel
+        self.interval = interval
+        self._last = 0.0
+
+    def __call__(self):
+        if self.cancel is None:
+            return
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        if self.cancel.is_set():
+            raise ConversionCancelled("转换已取消")
+
+
+class _AnyEvent:
+    """把多个取消来源合并为一个：任意一个置位即视为置位（供后台阶段使用）"""
+
+    def __init__(self, *events):
+        self.events = [e for e in events if e is not None]
+
+    def is_set(self):
+        return any(e.is_set() for e in self.events)
 
 
 def _safe_decode(b: bytes, charset_hint=None) -> str:
@@ -58,117 +168,763 @@ def _norm_keys(*vals):
     return keys
 
 
-def read_mht(mht_path):
+def _decode_part_body(headers, body):
+    """按 Content-Transfer-Encoding 解码 MIME 部分的正文"""
+    cte = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+    if cte == "base64":
+        try:
+            return binascii.a2b_base64(body)
+        except binascii.Error:
+            try:
+                return binascii.a2b_base64(bytes(body) + b"==")  # 与 email 一样容忍缺失的填充
+            except binascii.Error:
+                return bytes(body)
+    if cte == "quoted-printable":
+        return quopri.decodestring(bytes(body))
+    return bytes(body)
+
+
+def _header_str(headers, name):
+    value = headers.get(name)
+    return "".join(str(value).splitlines()) if value is not None else ""
+
+
+_MhtSpan = namedtuple("_MhtSpan", ["offset", "length", "encoding"])
+
+
+def iter_mht_parts(mht_path, progress=None, cancel=None, chunk_size=1 << 22, with_offsets=False, decode=True):
     """
-    读取 MHT 文件并解析 HTML 和附件内容。
-    自动去除文件开头的无关头部信息。
+    流式读取 MHT，逐个产出 (headers, data)：headers 为该部分的头部（email Message），
+    data 为按 Content-Transfer-Encoding 解码后的内容。
+    每个部分读完立即产出，不必等整个文件解析完；只解析各部分的头部，正文直接按边界切分，
+    比 email 的逐行解析快得多。不是 multipart 的文件整体作为一个部分产出。
+    with_offsets: 为 True 时产出 (headers, data, span)，span 为正文在文件中的位置 _MhtSpan
+                  （嵌套 multipart 中的部分为 None），之后可用 read_mht_span 单独读取。
+    decode:       为 False 时 data 为未解码的原始正文（预扫描用，省去 base64 解码）。
     """
+    check = _CancelCheck(cancel)
+
+    def part(headers, start, end):
+        """buf[start:end] 为该部分的正文"""
+        data = _decode_part_body(headers, buf[start:end]) if decode else bytes(buf[start:end])
+        if not with_offsets:
+            return headers, data
+        cte = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+        return headers, data, _MhtSpan(base + start, end - start, cte)
+
     with open(mht_path, "rb") as f:
-        content = f.read()
+        bar = ProgressReporter(progress, "read", os.fstat(f.fileno()).st_size) if progress is not None else None
+        buf = bytearray()
+        base = 0  # buf[0] 在文件中的偏移
 
-    # 查找 "Content-Type" 行，确保从有用信息开始解析
-    content_type_index = content.find(b"Content-Type:")
-    if content_type_index != -1:
-        content = content[content_type_index:]  # 从 "Content-Type" 行开始截取
+        def fill():
+            """再读入一块；文件已读完时返回 False"""
+            check()
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return False
+            buf.extend(chunk)
+            if bar is not None:
+                bar.update(len(chunk), len(chunk))
+            return True
 
-    # 解析 MHT 文件内容
-    msg = email.message_from_bytes(content, policy=policy.default)
+        def header_end(start):
+            """返回 start 处头部之后正文的起始位置（头部以空行结束）"""
+            search = start
+            while True:
+                if buf[start:start + 1] == b"\n":
+                    return start + 1  # 没有头部
+                if buf[start:start + 2] == b"\r\n":
+                    return start + 2
+                # 只在第一个 CRLF 空行之前查找 LF 空行，避免每个部分都扫描整个缓冲区
+                crlf = buf.find(b"\n\r\n", search)
+                lf = buf.find(b"\n\n", search, crlf + 2 if crlf != -1 else len(buf))
+                if lf != -1:
+                    return lf + 2
+                if crlf != -1:
+                    return crlf + 3
+                search = max(start, len(buf) - 2)
+                if not fill():
+                    return len(buf)
 
+        # 查找 "Content-Type" 行，确保从有用信息开始解析
+        while buf.find(b"Content-Type:") == -1 and len(buf) < (1 << 24) and fill():
+            pass
+        skip = max(buf.find(b"Content-Type:"), 0)
+        del buf[:skip]
+        base += skip
+
+        body_start = header_end(0)
+        top = BytesHeaderParser().parsebytes(bytes(buf[:body_start]))
+        boundary = top.get_boundary() if top.get_content_maintype() == "multipart" else None
+        if not boundary:
+            while fill():
+                pass
+            yield part(top, body_start, len(buf))
+            return
+
+        delim = b"\n--" + boundary.encode("ascii", "surrogateescape")
+
+        def find_delim(start):
+            """查找 start 之后位于行首的分隔符，返回其前换行符的位置；没有更多分隔符时返回 -1"""
+            search = start
+            while True:
+                i = buf.find(delim, search)
+                if i != -1:
+                    while len(buf) < i + len(delim) + 2 and fill():
+                        pass
+                    return i
+                search = max(start, len(buf) - len(delim) + 1)
+                if not fill():
+                    return -1
+
+        i = find_delim(body_start - 1)  # 第一个分隔符之前是可忽略的前言
+        while i != -1:
+            j = i + len(delim)
+            if buf[j:j + 2] == b"--":
+                break  # 结束分隔符
+            while buf.find(b"\n", j) == -1 and fill():
+                pass
+            nl = buf.find(b"\n", j)
+            if nl == -1:
+                break
+            start = nl + 1
+            if start >= chunk_size:
+                # 丢弃已处理的部分；攒够一块再整体移动，避免每个部分都搬动整个缓冲区
+                del buf[:start]
+                base += start
+                start = 0
+
+            body_start = header_end(start)
+            headers = BytesHeaderParser().parsebytes(bytes(buf[start:body_start]))
+            i = find_delim(body_start - 1)
+            end = i if i != -1 else len(buf)
+            if end > body_start and buf[end - 1] == 0x0D:
+                end -= 1  # 分隔符前的 CRLF 属于分隔符
+            if headers.get_content_maintype() == "multipart":
+                # 嵌套的 multipart（QQ 导出中不会出现）交给 email 完整解析
+                nested = email.message_from_bytes(bytes(buf[start:max(end, body_start)]), policy=policy.default)
+                for sub in nested.walk():
+                    if not sub.is_multipart():
+                        data = sub.get_payload(decode=True) or b""
+                        yield (sub, data, None) if with_offsets else (sub, data)
+            else:
+                yield part(headers, body_start, max(end, body_start))
+        if bar is not None:
+            bar.close()
+
+
+def _decode_span(span, body):
+    return _decode_part_body({"Content-Transfer-Encoding": span.encoding}, body)
+
+
+def read_mht_span(f, span):
+    """按 iter_mht_parts(with_offsets=True) 给出的位置读取并解码一个部分的正文；f 为以二进制打开的 MHT"""
+    f.seek(span.offset)
+    return _decode_span(span, f.read(span.length))
+
+
+def _classify_part(headers, data, span=None):
+    """返回 ("html", 文本) / ("image", 附件字典) / (None, None)；span 为图片正文在 MHT 中的位置（可选）"""
+    ctype = headers.get_content_type()
+    if ctype == "text/html":
+        return "html", _safe_decode(data, headers.get_content_charset() or "utf-8")
+    if ctype.startswith("image/") and data:
+        return "image", {
+            "name": headers.get_filename() or headers.get_param("name"),
+            "content_id": _header_str(headers, "Content-ID").strip("<>"),
+            "content_location": _header_str(headers, "Content-Location"),
+            "content_type": ctype or "",
+            "data": data,
+            "span": span,
+        }
+    return None, None
+
+
+def read_mht(mht_path, progress=None, cancel=None):
+    """
+    读取 MHT 文件并解析 HTML 和附件内容。
+    自动去除文件开头的无关头部信息。
+    progress: 可选回调，接收 ProgressEvent
+    cancel:   可选取消事件（threading.Event 等），置位后尽快抛出 ConversionCancelled
+    """
     html_text = None
     attachments = []
-    for part in msg.walk():
-        ctype = part.get_content_type()
-        if ctype == "text/html" and html_text is None:
-            payload_bytes = part.get_payload(decode=True)
-            charset = part.get_content_charset() or 'utf-8'
-            if payload_bytes:
-                html_text = _safe_decode(payload_bytes, charset)
-            else:
-                payload = part.get_payload(decode=False)
-                if isinstance(payload, bytes):
-                    html_text = _safe_decode(payload, charset)
-                else:
-                    html_text = str(payload)
+    reporter = ProgressReporter(progress, "parts") if progress is not None else None
+    for headers, data in iter_mht_parts(mht_path, progress=progress, cancel=cancel):
+        if reporter is not None:
+            reporter.update()
+        kind, value = _classify_part(headers, data)
+        if kind == "html" and html_text is None:
+            html_text = value
+        elif kind == "image":
+            attachments.append(value)
+    if reporter is not None:
+        reporter.close()
+    if html_text is None:
+        raise RuntimeError("未在 MHT 中找到 text/html 部分。")
+    return html_text, attachments
+
+
+PART_INDEX_VERSION = 1
+TR_RE = re.compile(rb"<tr[\s>]", re.IGNORECASE)
+
+
+def part_index_path_for(mht_path):
+    """chat.mht -> chat.parts.json"""
+    return os.path.splitext(mht_path)[0] + ".parts.json"
+
+
+def _mht_stamp(mht_path):
+    st = os.stat(mht_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _decoded_size(headers, body):
+    """不解码估算正文解码后的字节数（base64 按去掉空白与填充后的长度计算）"""
+    cte = str(headers.get("Content-Transfer-Encoding", "")).strip().lower()
+    if cte != "base64":
+        return len(_decode_part_body(headers, body))
+    n = len(body) - body.count(b"\n") - body.count(b"\r") - body.count(b" ") - body.count(b"\t")
+    tail = body.rstrip()[-2:]
+    return max(n * 3 // 4 - tail.count(b"="), 0)
+
+
+def scan_mht(mht_path, progress=None, cancel=None, write_index=True):
+    """
+    预扫描 MHT，不做完整转换：流式切分一遍 MIME 部分，不解码图片、不构建文档树，
+    在 HTML 中直接匹配日期行（DATE_LINE_RE）与 <tr> 行，统计日期范围、大致消息数、图片数与图片字节数。
+    write_index: 同时在 MHT 旁写出部分偏移表 <name>.parts.json（见 part_index_path_for）。之后的 export_from_mht
+                 据此直接按偏移读取 HTML 与图片，不必再扫描整个文件；MHT 变化后偏移表自动失效。
+    返回统计信息 dict（即偏移表中的 "summary"）。
+    """
+    start = time.perf_counter()
+    stamp = _mht_stamp(mht_path)
+    html = None
+    attachments = []
+    parts = image_bytes = rows = 0
+    dates = []
+    for headers, body, span in iter_mht_parts(mht_path, progress=progress, cancel=cancel, with_offsets=True,
+                                              decode=False):
+        parts += 1
+        ctype = headers.get_content_type()
+        if ctype == "text/html" and html is None:
+            charset = headers.get_content_charset() or "utf-8"
+            raw = _decode_part_body(headers, body)
+            rows = len(TR_RE.findall(raw))
+            dates = DATE_LINE_RE.findall(_safe_decode(raw, charset))
+            html = {"span": list(span) if span else None, "charset": charset}
         elif ctype.startswith("image/"):
-            data = part.get_payload(decode=True)
-            if not data:
-                continue
+            size = _decoded_size(headers, body)
+            if not size:
+                continue  # 与 _classify_part 一致：空图片不作为附件
+            image_bytes += size
             attachments.append({
-                "name": part.get_filename() or part.get_param("name"),
-                "content_id": (part.get("Content-ID") or "").strip("<>"),
-                "content_location": part.get("Content-Location") or "",
+                "name": headers.get_filename() or headers.get_param("name"),
+                "content_id": _header_str(headers, "Content-ID").strip("<>"),
+                "content_location": _header_str(headers, "Content-Location"),
                 "content_type": ctype or "",
-                "data": data,
+                "span": list(span) if span else None,
             })
-    if html_text is None:
+    if html is None:
         raise RuntimeError("未在 MHT 中找到 text/html 部分。")
-    return html_text, attachments
+
+    summary = {
+        "mht_path": mht_path,
+        "size": os.path.getsize(mht_path),
+        "parts": parts,
+        "messages": max(rows - len(dates), 0),  # 大致数量：<tr> 行减去日期行（含少量表头行）
+        "first_date": min(dates) if dates else None,
+        "last_date": max(dates) if dates else None,
+        "days": len(set(dates)),
+        "images": len(attachments),
+        "image_bytes": image_bytes,
+        "elapsed": time.perf_counter() - start,
+    }
+    if write_index:
+        index_path = part_index_path_for(mht_path)
+        if html["span"] is None or any(att["span"] is None for att in attachments):
+            print(f"[x] MHT 含嵌套的 multipart 部分，不写出偏移表：{index_path}")
+        else:
+            index = {"version": PART_INDEX_VERSION, "source": stamp, "summary": summary, "html": html,
+                     "attachments": attachments}
+            try:
+                write_json(index, index_path, compact=True)
+            except OSError as e:
+                print(f"[x] 无法写出偏移表（{e}），跳过")
+    return summary
 
 
-def build_src_to_local_map(soup, attachments, html_out_path, image_dir_name="Image"):
-    html_dir = os.path.dirname(os.path.abspath(html_out_path))
-    image_dir = os.path.join(html_dir, image_dir_name)
-    os.makedirs(image_dir, exist_ok=True)
+def load_part_index(mht_path):
+    """读取 scan_mht 写出的偏移表；不存在、版本不符或 MHT 已变化时返回 None"""
+    try:
+        with open(part_index_path_for(mht_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != PART_INDEX_VERSION or index.get("source") != _mht_stamp(mht_path):
+            return None
+    except (OSError, ValueError, AttributeError):
+        return None
+    return index
 
-    att_keys_list = []
-    for att in attachments:
-        keys = _norm_keys(att["name"], att["content_location"], att["content_id"])
-        att_keys_list.append(keys)
 
-    src_to_local = {}
-    used_attachments = set()
+_Spilled = namedtuple("_Spilled", ["offset", "length"])
+
+
+class _SpillFile:
+    """超出内存预算的图片数据溢写到临时文件（关闭后自动删除），写出图片时再按偏移读回"""
+
+    def __init__(self, dir=None):
+        self.dir = dir
+        self.size = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def put(self, data):
+        with self._lock:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(prefix="qq_chat_spill_", dir=self.dir)
+            self._file.seek(self.size)
+            self._file.write(data)
+            ref = _Spilled(self.size, len(data))
+            self.size += len(data)
+        return ref
+
+    def get(self, ref):
+        with self._lock:
+            self._file.seek(ref.offset)
+            return self._file.read(ref.length)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _MemoryBudget:
+    """
+    统计流水线中缓冲的数据量，总量不超过 limit 字节（None 表示不限制，只统计峰值）：
+    - held：读取阶段保留在内存中的图片数据，最多占预算的一半，超出部分由调用方溢写（try_hold）；
+    - 其余为临时缓冲（读回的溢写图片、待写出的 HTML、待序列化的记录），预算不足时
+      reserve 等待其它阶段释放（背压）；没有其它临时缓冲时总是放行，避免单个大对象卡死。
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.held = 0
+        self.transient = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def _update_peak(self):
+        self.peak = max(self.peak, self.held + self.transient)
+
+    def try_hold(self, n):
+        with self._cond:
+            if self.limit is not None and (self.held + n > self.limit // 2
+                                           or self.held + self.transient + n > self.limit):
+                return False
+            self.held += n
+            self._update_peak()
+            return True
+
+    def release_held(self):
+        with self._cond:
+            self.held = 0
+            self._cond.notify_all()
+
+    def reserve(self, n, wait=True):
+        with self._cond:
+            while (wait and self.limit is not None and self.transient
+                   and self.held + self.transient + n > self.limit):
+                self._cond.wait()
+            self.transient += n
+            self._update_peak()
+
+    def release(self, n):
+        with self._cond:
+            self.transient -= n
+            self._cond.notify_all()
+
+
+def _record_size(msg):
+    """粗略估计一条记录占用的内存（字节）；紧凑记录中共享的发送者 / 日期 / 时间不计入"""
+    size = sys.getsizeof(msg)
+    if isinstance(msg, (MessageRecord, ForwardedRecord)):
+        size += sys.getsizeof(msg.text)
+        if msg.images:
+            size += sys.getsizeof(msg.images) + sum(sys.getsizeof(p) for p in msg.images)
+        if getattr(msg, "forwarded", None):
+            size += sys.getsizeof(msg.forwarded) + sum(_record_size(f) for f in msg.forwarded)
+        return size
+    for v in msg.values():
+        if isinstance(v, list):
+            size += sys.getsizeof(v) + sum(_record_size(x) if isinstance(x, dict) else sys.getsizeof(x) for x in v)
+        else:
+            size += sys.getsizeof(v)
+    return size
+
+
+def _peak_rss():
+    """进程内存峰值（字节），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class _MhtReader(threading.Thread):
+    """
+    读取阶段：在后台线程中流式读取 MIME 部分。HTML 部分一读完就交给解析阶段，
+    其后的图片部分继续在后台读取、解码，与 HTML 解析重叠进行。
+    lazy: 图片不解码，只记录其在 MHT 中的位置（_MhtSpan），由写入线程只读取解码用到的图片（部分导出时使用）。
+    """
+
+    def __init__(self, mht_path, progress=None, cancel=None, budget=None, spill=None, lazy=False):
+        super().__init__(name="mht-reader", daemon=True)
+        self.mht_path = mht_path
+        self.lazy = lazy
+        self.progress = progress
+        self.cancel = cancel
+        self.budget = budget
+        self.spill = spill
+        self.attachments = []
+        self.error = None
+        self._html = None
+        self._html_ready = threading.Event()
+
+    def run(self):
+        reporter = ProgressReporter(self.progress, "parts") if self.progress is not None else None
+        try:
+            for headers, data, span in iter_mht_parts(self.mht_path, progress=self.progress, cancel=self.cancel,
+                                                      with_offsets=True, decode=not self.lazy):
+                if reporter is not None:
+                    reporter.update()
+                if self.lazy and span is not None:
+                    if headers.get_content_maintype() == "image":
+                        if not _decoded_size(headers, data):
+                            continue
+                        data = span
+                    else:
+                        data = _decode_part_body(headers, data)
+                kind, value = _classify_part(headers, data, span)
+                if kind == "html" and not self._html_ready.is_set():
+                    if self.budget is not None:
+                        self.budget.reserve(sys.getsizeof(value), wait=False)  # 已在内存中，只计入统计
+                    self._html = value
+                    self._html_ready.set()
+                elif kind == "image":
+                    if isinstance(value["data"], _MhtSpan):
+                        pass  # 尚未读取，不占内存
+                    elif self.budget is not None and not self.budget.try_hold(len(value["data"])):
+                        value["data"] = self.spill.put(value["data"])
+                    self.attachments.append(value)
+        except BaseException as e:
+            self.error = e
+        finally:
+            self._html_ready.set()
+            if reporter is not None:
+                reporter.close()
+
+    def take_html(self):
+        """等待 HTML 部分读完并取走（读取线程不再持有）"""
+        self._html_ready.wait()
+        html_text, self._html = self._html, None
+        if html_text is None:
+            self.finish()
+            raise RuntimeError("未在 MHT 中找到 text/html 部分。")
+        return html_text
+
+    def finish(self):
+        """等待读取结束并返回全部图片附件；读取出错时在调用方线程重新抛出"""
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.attachments
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _write_text(path, text, budget=None, nbytes=0):
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    finally:
+        if budget is not None:
+            budget.release(nbytes)
+
+
+class _MhtSource:
+    """按偏移从 MHT 读取图片正文（解析缓存命中时使用），多个写入线程共用一个文件句柄，解码在锁外进行"""
+
+    def __init__(self, mht_path):
+        self._file = open(mht_path, "rb")
+        self._lock = threading.Lock()
 
-    # 为 <img> 标签添加进度条
-    img_tags = soup.find_all("img")
-    for img in tqdm(img_tags, desc="Processing images", unit="img"):
+    def read(self, span):
+        with self._lock:
+            self._file.seek(span.offset)
+            body = self._file.read(span.length)
+        return _decode_span(span, body)
+
+    def close(self):
+        self._file.close()
+
+
+def _write_span(path, span, source, budget=None, store=_write_bytes):
+    """从 MHT 读取解码一张图片并写出（store 为写出函数）；读取的数据计入内存预算"""
+    if budget is not None:
+        budget.reserve(span.length)
+    try:
+        store(path, source.read(span))
+    finally:
+        if budget is not None:
+            budget.release(span.length)
+
+
+def _write_spilled(path, ref, spill, budget, store=_write_bytes):
+    """把溢写到临时文件的图片读回并写出（store 为写出函数）；读回的数据计入内存预算"""
+    budget.reserve(ref.length)
+    try:
+        store(path, spill.get(ref))
+    finally:
+        budget.release(ref.length)
+
+
+class _BackgroundWriter:
+    """
+    写入阶段：用线程池在后台写文件，与解析重叠进行（文件 I/O 期间不占用 GIL）。
+    排队中的写入最多 max_pending 个，超出时提交方等待（背压），避免待写数据无限堆积。
+    """
+
+    def __init__(self, workers=4, max_pending=64):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mht-writer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._errors = []
+
+    def _run(self, fn, args):
+        try:
+            fn(*args)
+        except BaseException as e:
+            self._errors.append(e)
+        finally:
+            self._slots.release()
+
+    def submit(self, fn, *args):
+        if self._errors:
+            raise self._errors[0]
+        self._slots.acquire()
+        self._pool.submit(self._run, fn, args)
+
+    def close(self, raise_errors=True):
+        """等待全部写入完成"""
+        self._pool.shutdown(wait=True)
+        if raise_errors and self._errors:
+            raise self._errors[0]
+
+
+def _match_img_tags(img_tags, attachments):
+    """按标签顺序返回 [(raw_src, 附件下标)]：每个能匹配到附件的 <img> 一项（同一 src 可能出现多次）"""
+    # 键 -> 第一个包含该键的附件，匹配时不必逐个扫描全部附件
+    key_to_idx = {}
+    for idx, att in enumerate(attachments):
+        for k in _norm_keys(att["name"], att["content_location"], att["content_id"]):
+            key_to_idx.setdefault(k, idx)
+
+    matches = []
+    for img in img_tags:
         raw_src = (img.get("src") or "").strip()
         if not raw_src:
             continue
-        src_keys = _norm_keys(raw_src)
-        match_idx = None
-        for idx, keys in enumerate(att_keys_list):
-            if any(k in keys for k in src_keys):
-                match_idx = idx
-                break
-        if match_idx is None:
-            continue
-        used_attachments.add(match_idx)
-        att = attachments[match_idx]
+        found = [key_to_idx[k] for k in _norm_keys(raw_src) if k in key_to_idx]
+        if found:
+            matches.append((raw_src, min(found)))
+    return matches
+
+
+def _data_size(data):
+    return data.length if isinstance(data, (_Spilled, _MhtSpan)) else len(data)
 
+
+def image_rel_path(name, layout="flat"):
+    """
+    图片在图片目录中的相对路径（/ 分隔）：flat 直接放在图片目录下；
+    fanout 按文件名哈希分到两级子目录 ab/cd/<name>（65536 个目录），单个目录中的文件数与图片总数无关。
+    """
+    if layout == "fanout":
+        h = hashlib.blake2b(name.encode("utf-8"), digest_size=2).hexdigest()
+        return f"{h[:2]}/{h[2:]}/{name}"
+    return name
+
+
+def list_image_files(image_dir):
+    """图片目录中的全部文件，相对图片目录、以 / 分隔；fanout 布局的子目录逐层列出，顺序与 os.listdir 相同"""
+    files = []
+    pending = [""]
+    while pending:
+        rel = pending.pop()
+        with os.scandir(os.path.join(image_dir, rel)) as it:
+            for entry in it:
+                path = f"{rel}/{entry.name}" if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(path)
+                elif entry.is_file():
+                    files.append(path)
+    return files
+
+
+def _taken(path, reserved):
+    return os.path.normcase(path) in reserved or os.path.exists(path)
+
+
+def _write_matched_images(matches, attachments, image_dir, html_dir, progress=None, cancel=None, written=None,
+                          write=None, transcode=None, layout="flat"):
+    """
+    为匹配到的图片预留文件名并写出，返回 src_to_local（原始 src -> 相对 HTML 所在目录的路径）。
+    transcode: 可选 TranscodeSession，可转码的图片同时预留同名的 .webp 文件名（按 layout 放置，登记到 transcode），
+               写出后由 transcode.remap 更新路径。
+    layout:    图片目录布局（见 image_rel_path）；fanout 时文件名在全部子目录中仍然唯一。
+    """
+    check = _CancelCheck(cancel)
+    write = write or _write_bytes
+    os.makedirs(image_dir, exist_ok=True)
+
+    src_to_local = {}
+    reserved = set()
+    made = set()  # fanout 布局下已创建的子目录
+
+    def place(name):
+        return os.path.join(image_dir, *image_rel_path(name, layout).split("/"))
+
+    bar = ProgressReporter(progress, "images", len(matches), desc="Processing images", unit="img")
+    for raw_src, idx in matches:
+        check()
+        att = attachments[idx]
         src_base = os.path.basename(unquote(raw_src))
         root, _ext = os.path.splitext(src_base)
         guessed_ext = IMG_EXT_BY_MIME.get(att["content_type"].lower(), "")
-        out_name = (root or "image") + (guessed_ext or ".bin")
-        out_path_abs = os.path.join(image_dir, out_name)
+        alt = transcode is not None and transcode.accepts(guessed_ext)
+
+        def candidates(stem):
+            path = place(stem + (guessed_ext or ".bin"))
+            return [path, place(stem + ".webp")] if alt else [path]
+
+        paths = candidates(root or "image")
         i = 1
-        while os.path.exists(out_path_abs):
-            out_path_abs = os.path.join(image_dir, f"{root or 'image'}_{i}{guessed_ext or '.bin'}")
+        while any(_taken(p, reserved) for p in paths):
+            paths = candidates(f"{root or 'image'}_{i}")
             i += 1
-        with open(out_path_abs, "wb") as f:
-            f.write(att["data"])
-        out_rel = os.path.relpath(out_path_abs, html_dir)
-        src_to_local[raw_src] = out_rel
+        out_path_abs = paths[0]
+        if layout != "flat":
+            for sub_dir in {os.path.dirname(p) for p in paths} - made:
+                os.makedirs(sub_dir, exist_ok=True)
+                made.add(sub_dir)
+        if alt:
+            transcode.reserve(out_path_abs, paths[1])
+        reserved.update(os.path.normcase(p) for p in paths)
+        if written is not None:
+            written.extend(paths)
+        data = att["data"]
+        write(out_path_abs, data)
+        bar.update(1, _data_size(data))
+        src_to_local[raw_src] = os.path.relpath(out_path_abs, html_dir)
+    bar.close()
+    return src_to_local
 
-    return src_to_local, used_attachments
+
+def build_src_to_local_map(soup, attachments, html_out_path, image_dir_name="Image", progress=None,
+                           cancel=None, written=None, write=None):
+    """
+    written: 可选列表，记录本次写出的图片路径（取消时据此清理）
+    write:   可选的 write(path, data)，例如提交给后台写入线程；默认同步写出。
+             文件名在这里预留（不依赖文件是否已写出），异步写入时结果与同步写入相同。
+    """
+    html_dir = os.path.dirname(os.path.abspath(html_out_path))
+    matches = _match_img_tags(soup.find_all("img"), attachments)
+    src_to_local = _write_matched_images(matches, attachments, os.path.join(html_dir, image_dir_name), html_dir,
+                                         progress=progress, cancel=cancel, written=written, write=write)
+    return src_to_local, {idx for _, idx in matches}
+
+
+def _rewritten_src(raw_src, src_to_local, image_dir, html_dir):
+    """<img> 的 src 改写后的值（见 rewrite_html_img_srcs）；不需要改写时返回 None"""
+    if not raw_src:
+        return None
+    if raw_src in src_to_local:
+        return src_to_local[raw_src]
+    base = os.path.basename(unquote(raw_src))
+    if not base:
+        return None
+    return os.path.relpath(os.path.join(image_dir, base), html_dir)
 
 
 def rewrite_html_img_srcs(soup, src_to_local, html_out_path, image_dir_name="Image"):
     html_dir = os.path.dirname(os.path.abspath(html_out_path))
     image_dir = os.path.join(html_dir, image_dir_name)
     os.makedirs(image_dir, exist_ok=True)
+    for img in soup.find_all("img"):
+        new_src = _rewritten_src((img.get("src") or "").strip(), src_to_local, image_dir, html_dir)
+        if new_src is not None:
+            img["src"] = new_src
+
+
+def _html_template(soup, matched_srcs):
+    """
+    把需要改写的 <img> src 换成占位符后序列化，返回 (template, token, slots)，slots[i] 为第 i 个占位符的原始 src。
+    改写结果取决于输出的图片目录，写出时才填入（见 _write_html），模板本身可以缓存复用。
+    """
+    token = secrets.token_hex(6)
+    slots = []
     for img in soup.find_all("img"):
         raw_src = (img.get("src") or "").strip()
-        if not raw_src:
-            continue
-        if raw_src in src_to_local:
-            img["src"] = src_to_local[raw_src]
-        else:
-            base = os.path.basename(unquote(raw_src))
-            if not base:
-                continue
-            tentative_abs = os.path.join(image_dir, base)
-            tentative_rel = os.path.relpath(tentative_abs, html_dir)
-            img["src"] = tentative_rel
+        if raw_src and (raw_src in matched_srcs or os.path.basename(unquote(raw_src))):
+            img["src"] = f"qqcc-{token}-{len(slots)}"
+            slots.append(raw_src)
+    return str(soup), token, slots
+
+
+def _write_html(path, template, token, values, budget=None, nbytes=0):
+    """写出 HTML 模板，占位符替换为 values[i]，引号与转义与 bs4 序列化属性值的方式相同"""
+    slot_re = re.compile(f'"qqcc-{token}-(\\d+)"')
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            pos = 0
+            for m in slot_re.finditer(template):
+                f.write(template[pos:m.start()])
+                f.write(EntitySubstitution.substitute_xml(values[int(m.group(1))], True))
+                pos = m.end()
+            f.write(template[pos:])
+    finally:
+        if budget is not None:
+            budget.release(nbytes)
+
+
+def _image_resolver(src_to_local, image_dir, html_dir):
+    """记录中的原始 src -> 输出路径，与先改写 HTML 的 src 再解析记录得到的路径相同"""
+    def resolve(raw_src):
+        new_src = _rewritten_src(raw_src, src_to_local, image_dir, html_dir)
+        if new_src is None:
+            return src_to_local.get(raw_src, raw_src)
+        new_src = new_src.strip()
+        return src_to_local.get(new_src, new_src)
+    return resolve
+
+
+def _resolve_images(record, resolve):
+    """把导出格式 dict（含转发内容）中的图片路径按 resolve 替换，原地修改并返回"""
+    if not isinstance(record, dict):
+        return record
+    images = record.get("images")
+    if isinstance(images, list):
+        record["images"] = [resolve(p) if isinstance(p, str) else p for p in images]
+    if isinstance(record.get("image"), str):
+        record["image"] = resolve(record["image"])
+    if isinstance(record.get("forwarded"), list):
+        for fwd in record["forwarded"]:
+            _resolve_images(fwd, resolve)
+    return record
 
 
 def _norm_space(s: str) -> str:
@@ -180,10 +936,11 @@ def _norm_space(s: str) -> str:
     return s.strip()
 
 
-def parse_forwarded(container, src_to_local):
+def parse_forwarded(container, src_to_local, store=None):
     """
     解析转发消息块（包含 <font> + <img> 混排），输出严格的 sender + time + text + images。
     container: 转发内容所在的 body <div> 节点
+    store:     可选 RecordStore，提供时返回紧凑的 ForwardedRecord 而不是 dict
     """
     # 先按 <br> 断行，并把 <img> 作为独立行保留下来
     items = []  # [(kind, value)]  kind ∈ {"text","img"}
@@ -253,6 +1010,8 @@ def parse_forwarded(container, src_to_local):
     if not headers:
         texts = [v for k, v in items if k == "text"]
         imgs  = [v for k, v in items if k == "img"]
+        if store is not None:
+            return [store.forwarded(None, None, "\n".join(texts) or None, imgs)]
         return [{
             "sender": None,
             "time": None,
@@ -280,6 +1039,10 @@ def parse_forwarded(container, src_to_local):
                 imgs.append(v)
             j += 1
 
+        if store is not None:
+            forwarded.append(store.forwarded(_norm_space(h["sender"]) or None, h["time"],
+                                             ("\n".join(texts)).strip() if texts else None, imgs))
+            continue
         forwarded.append({
             "sender": _norm_space(h["sender"]) or None,
             "time": h["time"],
@@ -291,7 +1054,11 @@ def parse_forwarded(container, src_to_local):
     return forwarded
 
 
-def parse_message(tr, src_to_local, current_date=None):
+def parse_message(tr, src_to_local, current_date=None, store=None):
+    """
+    解析一行 <tr>，返回 (记录, 当前日期)。
+    store: 可选 RecordStore，提供时返回紧凑的 MessageRecord（发送者 / 日期存为 id），否则返回 dict
+    """
     td = tr.find("td")
     if not td:
         return None, current_date
@@ -321,7 +1088,7 @@ def parse_message(tr, src_to_local, current_date=None):
     text, forwarded = None, None
     fonts = body.find_all("font")
     if fonts and any(DATETIME_RE.search(f.get_text()) for f in fonts):
-        forwarded = parse_forwarded(body, src_to_local)
+        forwarded = parse_forwarded(body, src_to_local, store=store)
         images = None
     else:
         parts = [f.get_text("\n", strip=True) for f in fonts] if fonts else []
@@ -331,6 +1098,8 @@ def parse_message(tr, src_to_local, current_date=None):
         if not images:
             images = None
 
+    if store is not None:
+        return store.message(sender, current_date, time, text, images, forwarded), current_date
     return {
         "sender": sender,
         "date": current_date,
@@ -342,72 +1111,789 @@ def parse_message(tr, src_to_local, current_date=None):
     }, current_date
 
 
+def build_date_index(records):
+    """
+    为记录构建 日期 -> [[start, end), ...] 区间表。
+    查看器据此切片定位某一天的消息，无需每次扫描全部数据。
+    """
+    index = DateIndex()
+    for msg in records:
+        index.add(msg.get("date") if msg else None)
+    return index.result()
+
+
+class DateIndex:
+    """
+    逐条累积日期区间，记录可以边解析边加入（见 build_date_index）。
+    每个日期对应一组连续区间：导出通常按时间排序，每天只有一段；
+    顺序不连续时（例如合并或手工编辑过的 JSON）同一天会有多段，区间内不会混入其它日期的消息。
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.ranges = {}
+
+    def add(self, date):
+        i = self.count
+        self.count += 1
+        if not date:
+            return
+        runs = self.ranges.setdefault(date, [])
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+
+    def result(self):
+        return {"count": self.count, "dates": self.ranges}
+
+
+def index_path_for(json_path):
+    """qq_chat.json -> qq_chat.index.json"""
+    return os.path.splitext(json_path)[0] + ".index.json"
+
+
+def lines_path_for(json_path):
+    """qq_chat.json -> qq_chat.jsonl"""
+    return os.path.splitext(json_path)[0] + ".jsonl"
+
+
+def version_path_for(json_path):
+    """qq_chat.json -> qq_chat.version.json"""
+    return os.path.splitext(json_path)[0] + ".version.json"
+
+
+def write_export_version(json_path, digest, count=None):
+    """
+    写出导出版本文件：digest 为写出 JSON 时计算的内容哈希（见 write_json），
+    查看器以它为键在浏览器中缓存解析好的数据，JSON 内容变化时缓存自动失效。
+    """
+    write_json({"version": digest, "count": count}, version_path_for(json_path), compact=True)
+
+
+def write_json(data, path, compact=False, gzip_copy=False):
+    """
+    写出 JSON 文件，返回内容（UTF-8 文本）的 BLAKE2b 哈希。
+    compact:   不缩进、去掉多余空白，体积明显更小
+    gzip_copy: 写入的同时流式压缩出 path + ".gz"（供查看器服务器直接发送），无需二次读取
+    """
+    if compact:
+        encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    else:
+        encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+    return _write_chunks(encoder.iterencode(data), path, gzip_copy=gzip_copy)
+
+
+def _json_list_chunks(items, compact=False):
+    """逐条编码列表元素，输出与 json.dump(list) 完全相同的文本，列表不必先完整构建"""
+    if compact:
+        encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+        head, sep, tail = "[", ",", "]"
+    else:
+        # 字符串中的换行会被转义，编码结果中的 "\n" 只会出现在结构上，可以直接加一层缩进
+        nested = json.JSONEncoder(ensure_ascii=False, indent=2).encode
+        encode = lambda item: "  " + nested(item).replace("\n", "\n  ")
+        head, sep, tail = "[\n", ",\n", "\n]"
+    first = True
+    for item in items:
+        yield (head if first else sep) + encode(item)
+        first = False
+    yield "[]" if first else tail
+
+
+def write_json_list(items, path, compact=False, gzip_copy=False):
+    """与 write_json 相同，但 items 可以是生成器：边产生边编码写出"""
+    return _write_chunks(_json_list_chunks(items, compact=compact), path, gzip_copy=gzip_copy)
+
+
+def iter_json_array(json_file, block=JSON_READ_BLOCK):
+    """逐条产出 JSON 列表中的元素，每次只读取 block 个字符，内存占用与文件大小无关"""
+    for _, _, item in iter_json_array_spans(json_file, block=block):
+        yield item
+
+
+def iter_json_array_spans(json_file, block=JSON_READ_BLOCK, encoding="utf-8"):
+    """
+    与 iter_json_array 相同，但产出 (start, end, 元素)：元素文本在文件中的 [start, end) 字符位置。
+    encoding="latin-1" 时每个字节对应一个字符，位置即字节偏移，UTF-8 多字节序列也不会与 JSON 结构字符混淆；
+    此时元素中的非 ASCII 字符串需要由调用方按 UTF-8 还原。
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file, "r", encoding=encoding, newline="") as f:  # 不转换换行符，位置与文件一致
+        buf, pos, base, eof = "", 0, 0, False  # base 为 buf[0] 在文件中的位置
+
+        def fill():
+            nonlocal buf, pos, base, eof
+            data = f.read(block)
+            eof = not data
+            base += pos
+            buf = buf[pos:] + data
+            pos = 0
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        fill()
+        skip_ws()
+        if buf[pos:pos + 1] != "[":
+            raise RuntimeError("JSON 格式未知")
+        pos += 1
+        skip_ws()
+        if buf[pos:pos + 1] == "]":
+            return
+        while True:
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    fill()  # 元素跨越了读取块
+                    continue
+                if end == len(buf) and not eof:
+                    fill()  # 数字等可能被截断的元素，读到更多内容后重新解析
+                    continue
+                break
+            yield base + pos, base + end, item
+            pos = end
+            skip_ws()
+            sep = buf[pos:pos + 1]
+            pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise RuntimeError(f"JSON 格式错误（{json_file}）")
+            skip_ws()
+
+
+def write_json_lines(items, path, gzip_copy=False):
+    """每行一条紧凑编码的记录（JSON Lines），读取时可以逐行解析而不必载入整个文件"""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    return _write_chunks((encode(item) + "\n" for item in items), path, gzip_copy=gzip_copy)
+
+
+def write_json_lines_copy(json_file, gzip_copy=False):
+    """
+    把导出的 JSON 列表逐条转写为旁边的 JSON Lines 副本（lines_path_for），供查看器流式读取、边下载边显示。
+    记录逐条读取，内存占用与文件大小无关；返回副本的路径。
+    """
+    lines_path = lines_path_for(json_file)
+    tmp = lines_path + ".tmp"
+    try:
+        write_json_lines(iter_json_array(json_file), tmp, gzip_copy=gzip_copy)
+    except BaseException:
+        _remove_partial_output([tmp, tmp + ".gz"])
+        raise
+    os.replace(tmp, lines_path)
+    if gzip_copy:
+        os.replace(tmp + ".gz", lines_path + ".gz")
+    print(f"[x] 已写出 JSON Lines 副本：{lines_path}")
+    return lines_path
+
+
+def _write_chunks(chunks, path, gzip_copy=False):
+    gz_path = path + ".gz"
+    if not gzip_copy and os.path.exists(gz_path):
+        os.remove(gz_path)  # 避免服务器继续发送过期的压缩版本
+
+    gz = gzip.open(gz_path, "wt", encoding="utf-8", compresslevel=6) if gzip_copy else None
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            buf, size = [], 0
+            for chunk in chunks:
+                buf.append(chunk)
+                size += len(chunk)
+                if size >= 1 << 16:
+                    block = "".join(buf)
+                    f.write(block)
+                    digest.update(block.encode("utf-8"))
+                    if gz:
+                        gz.write(block)
+                    buf, size = [], 0
+            block = "".join(buf)
+            f.write(block)
+            digest.update(block.encode("utf-8"))
+            if gz:
+                gz.write(block)
+    finally:
+        if gz:
+            gz.close()
+    return digest.hexdigest()
+
+
+class _JsonListWriter(threading.Thread):
+    """
+    序列化阶段：在后台线程中把解析出的记录分批编码写入 JSON，与消息解析重叠进行。
+    队列最多缓存 max_batches 批，写入跟不上时解析方等待（背压）。
+    """
+    _END = object()
+
+    def __init__(self, path, compact=False, gzip_copy=False, max_batches=64, budget=None, to_dict=None, lines=False):
+        super().__init__(name="json-writer", daemon=True)
+        self.path = path
+        self.lines = lines  # 写成 JSON Lines 而不是列表
+        self.to_dict = to_dict  # 紧凑记录在这里（输出边缘）才还原为 dict
+        self.compact = compact
+        self.gzip_copy = gzip_copy
+        self.budget = budget
+        self.error = None
+        self.digest = None  # 写完后为内容哈希（见 write_json）
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._aborted = False
+
+    def _items(self):
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            batch, nbytes = item
+            try:
+                if self._aborted:
+                    raise ConversionCancelled("转换已取消")
+                yield from (map(self.to_dict, batch) if self.to_dict else batch)
+            finally:
+                if self.budget is not None:
+                    self.budget.release(nbytes)
+
+    def run(self):
+        try:
+            if self.lines:
+                self.digest = write_json_lines(self._items(), self.path, gzip_copy=self.gzip_copy)
+            else:
+                self.digest = write_json_list(self._items(), self.path, compact=self.compact,
+                                              gzip_copy=self.gzip_copy)
+        except BaseException as e:
+            self.error = e
+            # 继续取空队列，避免解析方在 put 上阻塞
+            while True:
+                item = self._queue.get()
+                if item is self._END:
+                    break
+                if self.budget is not None:
+                    self.budget.release(item[1])
+
+    def put(self, batch):
+        nbytes = 0
+        if self.budget is not None:
+            nbytes = sum(_record_size(msg) for msg in batch)
+            self.budget.reserve(nbytes)
+        self._queue.put((batch, nbytes))
+
+    def close(self):
+        """写入剩余记录并等待完成；写入出错时在调用方线程重新抛出"""
+        self._queue.put(self._END)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def abort(self):
+        self._aborted = True
+        self._queue.put(self._END)
+        self.join()
+
+
+def _remove_partial_output(paths, image_dir=None):
+    """删除本次运行产生的文件；图片目录若为本次新建，删除其中（fanout 布局的子目录）已清空的目录"""
+    for p in paths:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    if image_dir:
+        for root, _, _ in os.walk(image_dir, topdown=False):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+
+def _slice_html_by_date(html_text, since=None, until=None):
+    """
+    按日期分隔行在 HTML 文本中截取 [since, until] 的部分（假定聊天记录按时间顺序排列），
+    范围外的行不进入 HTML 解析，解析耗时与截取的大小成正比。保留第一条日期行之前的页头；找不到日期行时原样返回。
+    """
+    rows = [(m.start(), m.group(1)) for m in DATE_ROW_RE.finditer(html_text)]
+    if not rows:
+        return html_text
+    head = html_text[:rows[0][0]]
+    start = next((pos for pos, date in rows if since is None or date >= since), None)
+    if start is None:
+        return head
+    end = next((pos for pos, date in rows if pos > start and until is not None and date > until), len(html_text))
+    return head + html_text[start:end]
+
+
+def _record_filter(store, since=None, until=None, senders=None):
+    """部分导出的筛选条件 -> keep(记录)；日期范围包含首尾两天，设置了日期范围时没有日期的记录不保留"""
+    def keep(msg):
+        date = store.date_of(msg)
+        if since is not None or until is not None:
+            if date is None or (since is not None and date < since) or (until is not None and date > until):
+                return False
+        return senders is None or store.senders.value_of(msg.sender) in senders
+    return keep
+
+
+def _parse_rows(rows, slot_map, store, progress, check, keep=None):
+    """
+    逐行解析消息；slot_map 把 HTML 模板中的占位符还原为原始 src，记录中的图片暂为原始 src。
+    keep: 可选筛选条件，不保留的消息行同时从文档树中删除（输出的 HTML 与 JSON 一致，其中的图片也不会写出）
+    """
+    current_date = None
+    # 显示进度条（或向回调报告进度）
+    with ProgressReporter(progress, "messages", len(rows), desc="Processing messages", unit="msg") as bar:
+        for tr in rows:
+            check()
+            bar.update()
+            msg, current_date = parse_message(tr, slot_map, current_date, store=store)
+            if msg:
+                if keep is not None and not keep(msg):
+                    tr.decompose()
+                    continue
+                yield msg
+
+
+def _cached_records(path, store, total, progress, check):
+    """逐行读取缓存的记录（JSON Lines），解析时即转换为紧凑记录"""
+    with open(path, "r", encoding="utf-8") as f, \
+            ProgressReporter(progress, "messages", total, desc="Loading cached messages", unit="msg") as bar:
+        for line in f:
+            check()
+            bar.update()
+            yield json.loads(line, object_hook=store.from_dict)
+
+
+class ExportOptions:
+    """
+    export_from_mht 的导出选项。构造时统一校验与规范化（日期转为 'YYYY-MM-DD'、senders 转为集合、
+    缓存目录与 WebP 质量分别转为 ParseCache / ImageTranscoder），各阶段直接使用；可以 pickle 后传给工作进程。
+
+    compact_json: JSON 不缩进、去掉多余空白，体积明显更小。
+    gzip_json: 同时写出 JSON 与日期索引的 .gz 副本（供查看器服务器直接发送）。
+    memory_limit: 可选，流水线缓冲数据的上限（字节）：解码后的图片、待写出的 HTML 与记录。
+              图片超出预算的部分溢写到输出目录下的临时文件，其余缓冲在预算不足时等待下游写出；
+              结束时报告缓冲峰值与进程内存峰值。解析得到的 HTML 文档树本身不在预算之内。
+    cache:    可选 ParseCache 或缓存目录。命中时直接使用缓存的解析结果（记录、HTML 模板、图片在 MHT 中的偏移），
+              跳过 MIME 切分、HTML 与消息解析，只按偏移读取解码图片；未命中时正常解析并写入缓存。
+              输出与不使用缓存时相同，与输出目录、image_dir_name 等选项无关。
+    since / until / senders: 可选，部分导出：只导出日期在 [since, until]（'YYYY-MM-DD' 或 date，包含首尾）内、
+              发送者属于 senders 的消息。范围外的日期在 HTML 解析前按日期行整段跳过，图片只读取解码保留的消息
+              引用到的部分，输出的 HTML 也只包含保留的消息。部分导出不读写解析缓存。
+    transcode: 可选 ImageTranscoder 或 WebP 质量（1~100，需要 Pillow）。PNG / JPEG / 静态 GIF 在写入线程中转为 WebP，
+              变小时才采用；HTML 与 JSON 中的路径指向实际写出的文件，结束时报告节省的字节数。
+    image_layout: 图片目录布局，"flat"（默认，全部放在图片目录下）或 "fanout"（按文件名哈希分到 ab/cd/ 两级子目录，
+              适合图片数以百万计的聊天记录），见 image_rel_path。
+    """
+
+    def __init__(self, compact_json=False, gzip_json=False, memory_limit=None, cache=None, since=None, until=None,
+                 senders=None, transcode=None, image_layout="flat"):
+        if image_layout not in IMAGE_LAYOUTS:
+            raise ValueError(f"未知的图片目录布局：{image_layout}")
+        if cache is not None and not isinstance(cache, ParseCache):
+            cache = ParseCache(cache)
+        if transcode is not None and not isinstance(transcode, ImageTranscoder):
+            transcode = ImageTranscoder(quality=transcode)
+        self.compact_json = compact_json
+        self.gzip_json = gzip_json
+        self.memory_limit = memory_limit
+        self.cache = cache
+        self.since = since.isoformat() if hasattr(since, "isoformat") else since
+        self.until = until.isoformat() if hasattr(until, "isoformat") else until
+        self.senders = set(senders) if senders is not None else None
+        self.transcode = transcode
+        self.image_layout = image_layout
+
+    @property
+    def partial(self):
+        """按日期范围或发送者筛选的部分导出"""
+        return self.since is not None or self.until is not None or self.senders is not None
+
+
+class _ExportRun:
+    """
+    一次 export_from_mht 的共享状态。各阶段为方法，按顺序调用：
+    select_source -> parse -> write_images -> write_html -> write_records -> finish -> publish；
+    任一阶段出错时由 cleanup 停止后台线程并删除本次写出的文件。
+    """
+
+    def __init__(self, mht_path, json_out, html_out, image_dir_name, options, progress, cancel):
+        self.mht_path = mht_path
+        self.json_out = json_out
+        self.html_out = html_out
+        self.options = options
+        self.progress = progress
+        self.cancel = cancel
+        self.check = _CancelCheck(cancel)
+        self.html_dir = os.path.dirname(os.path.abspath(html_out))
+        self.image_dir = os.path.join(self.html_dir, image_dir_name)
+        self.new_image_dir = not os.path.isdir(self.image_dir)
+        self.written = []  # 本次运行创建的文件，取消或中断时清理
+        # JSON 与 HTML 先写临时文件，成功后再替换，取消或失败时不破坏已有的导出
+        self.json_tmp = json_out + ".tmp"
+        self.html_tmp = html_out + ".tmp"
+        self.store = RecordStore()
+        self.abort = threading.Event()
+
+        self.entry = self.staging = self.cache_meta = None  # 解析缓存：命中的条目 / 正在写入的条目
+        self.part_index = None
+        self.budget = self.spill = self.source = None
+        self.transcoding = None
+        self.store_image = _write_bytes
+        self.reader = self.writer = None
+        self.json_writer = self.cache_writer = None
+        self.json_digest = None
+        self.soup = self.html_size = self.kept = self.attachments = None
+
+    def select_source(self):
+        """按 解析缓存 -> 预扫描的偏移表 -> 完整读取 MHT 的顺序选择数据来源，并启动写入线程"""
+        options = self.options
+        if options.cache is not None and not options.partial:
+            cache_key = source_key(self.mht_path)
+            self.entry = options.cache.get(cache_key)
+            if self.entry is None:
+                self.staging = options.cache.begin(cache_key)
+            else:
+                print(f"[x] 命中解析缓存，跳过解析：{self.entry.path}")
+
+        if self.entry is None:
+            self.part_index = load_part_index(self.mht_path)
+            if self.part_index is not None:
+                print(f"[x] 使用预扫描的偏移表：{part_index_path_for(self.mht_path)}")
+
+        if options.memory_limit is not None:
+            os.makedirs(self.image_dir, exist_ok=True)
+            self.budget = _MemoryBudget(options.memory_limit)
+            self.spill = _SpillFile(dir=os.path.dirname(self.image_dir))
+        if self.entry is not None or self.part_index is not None or options.partial:
+            self.source = _MhtSource(self.mht_path)
+        if options.transcode is not None:
+            self.transcoding = options.transcode.start()
+            self.store_image = self.transcoding.store
+            # 转码时写入线程同时是转码的工作线程池，按 CPU 核数扩充
+            self.writer = _BackgroundWriter(workers=max(4, os.cpu_count() or 1))
+        else:
+            self.writer = _BackgroundWriter()
+
+    def _read_html(self):
+        budget = self.budget
+        if self.part_index is None:
+            self.reader = _MhtReader(self.mht_path, progress=self.progress, cancel=_AnyEvent(self.cancel, self.abort),
+                                     budget=budget, spill=self.spill, lazy=self.options.partial)
+            self.reader.start()
+            html_text = self.reader.take_html()
+        else:
+            html = self.part_index["html"]
+            html_text = _safe_decode(self.source.read(_MhtSpan(*html["span"])), html["charset"])
+            if budget is not None:
+                budget.reserve(sys.getsizeof(html_text), wait=False)
+        since, until = self.options.since, self.options.until
+        if since is not None or until is not None:
+            html_size = sys.getsizeof(html_text)
+            html_text = _slice_html_by_date(html_text, since, until)
+            if budget is not None:
+                budget.release(html_size - sys.getsizeof(html_text))
+        return html_text
+
+    def parse(self):
+        """解析 HTML（命中缓存时读取缓存的匹配表），返回图片匹配表 [(原始 src, 附件下标)]；附件表保存在 self.attachments"""
+        if self.entry is not None:
+            meta = self.entry.meta
+            self.attachments = [{"content_type": ctype, "data": _MhtSpan(*span)}
+                                for ctype, span in meta["attachments"]]
+            return [tuple(m) for m in meta["matches"]]
+
+        html_text = self._read_html()
+        self.check()
+        self.html_size = sys.getsizeof(html_text)
+        self.soup = BeautifulSoup(html_text, "lxml")
+        del html_text
+        if self.budget is not None:
+            self.budget.release(self.html_size)
+        self.check()
+        if self.reader is not None:
+            self.attachments = self.reader.finish()
+        else:
+            # 图片不在这里读取，由写入线程按偏移读取解码（只读取用到的图片）
+            self.attachments = [dict(att, data=_MhtSpan(*att["span"]), span=_MhtSpan(*att["span"]))
+                                for att in self.part_index["attachments"]]
+        options = self.options
+        if options.partial:
+            # 先解析并筛选消息（不保留的行从文档树中删除），之后只匹配、写出剩余行中的图片
+            keep = _record_filter(self.store, options.since, options.until, options.senders)
+            self.kept = list(_parse_rows(self.soup.find_all("tr"), {}, self.store, self.progress, self.check,
+                                         keep=keep))
+        return _match_img_tags(self.soup.find_all("img"), self.attachments)
+
+    def _write_image(self, path, data):
+        if isinstance(data, _Spilled):
+            self.writer.submit(_write_spilled, path, data, self.spill, self.budget, self.store_image)
+        elif isinstance(data, _MhtSpan):
+            self.writer.submit(_write_span, path, data, self.source, self.budget, self.store_image)
+        else:
+            self.writer.submit(self.store_image, path, data)
+
+    def write_images(self, matches):
+        """在后台写出匹配到的图片，返回 原始 src -> 本地路径；写出后释放附件表"""
+        attachments = self.attachments
+        src_to_local = _write_matched_images(matches, attachments, self.image_dir, self.html_dir,
+                                             progress=self.progress, cancel=self.cancel, written=self.written,
+                                             write=self._write_image, transcode=self.transcoding,
+                                             layout=self.options.image_layout)
+        if self.staging is not None:
+            used = sorted({idx for _, idx in matches})
+            if all(attachments[i]["span"] is not None for i in used):
+                # 附件表只保留用到的附件，以偏移引用 MHT 中的正文，不复制图片数据
+                renum = {idx: i for i, idx in enumerate(used)}
+                self.cache_meta = {
+                    "attachments": [[attachments[i]["content_type"], list(attachments[i]["span"])] for i in used],
+                    "matches": [[raw_src, renum[idx]] for raw_src, idx in matches],
+                }
+            else:
+                self.staging.discard()  # 嵌套 multipart 中的图片没有偏移，不缓存
+                self.staging = None
+        self.attachments = attachments = None
+        if self.budget is not None or self.transcoding is not None:
+            # 等图片全部写出后再释放它们占用的预算，之后的缓冲才有空间；转码后的文件名也在写出后才确定
+            self.writer.close()
+            self.writer = _BackgroundWriter()
+            if self.budget is not None:
+                self.budget.release_held()
+            if self.transcoding is not None:
+                src_to_local = self.transcoding.remap(src_to_local, self.html_dir)
+        self.check()
+        return src_to_local
+
+    def write_html(self, matches, src_to_local):
+        """在后台写出 HTML（图片指向本地文件），返回模板的占位符 (token, slots)"""
+        budget = self.budget
+        os.makedirs(self.html_dir, exist_ok=True)
+        if self.entry is None:
+            if budget is not None:
+                budget.reserve(self.html_size)  # 输出的 HTML 与源 HTML 大小相近，先按源大小等待预算
+            template, token, slots = _html_template(self.soup, {raw_src for raw_src, _ in matches})
+            if budget is not None:
+                budget.reserve(sys.getsizeof(template) - self.html_size, wait=False)
+            if self.staging is not None:
+                self.writer.submit(_write_text, self.staging.page_path, template)
+        else:
+            with open(self.entry.page_path, "r", encoding="utf-8") as f:
+                template = f.read()
+            token, slots = self.entry.meta["token"], self.entry.meta["slots"]
+            if budget is not None:
+                budget.reserve(sys.getsizeof(template), wait=False)
+        html_size = sys.getsizeof(template)
+        values = [_rewritten_src(raw_src, src_to_local, self.image_dir, self.html_dir) for raw_src in slots]
+        self.writer.submit(_write_html, self.html_tmp, template, token, values, budget, html_size)
+        return token, slots
+
+    def _records(self, token, slots):
+        if self.kept is not None:
+            return self.kept
+        if self.entry is None:
+            slot_map = {f"qqcc-{token}-{i}": raw_src for i, raw_src in enumerate(slots)}
+            return _parse_rows(self.soup.find_all("tr"), slot_map, self.store, self.progress, self.check)
+        return _cached_records(self.entry.records_path, self.store, self.entry.meta["count"], self.progress,
+                               self.check)
+
+    def write_records(self, token, slots, src_to_local):
+        """解析（或读取缓存的）消息，分批交给 JSON 写入线程；返回 (DateIndex, ChatStats)"""
+        store = self.store
+        os.makedirs(os.path.dirname(os.path.abspath(self.json_out)) or ".", exist_ok=True)
+        resolve = _image_resolver(src_to_local, self.image_dir, self.html_dir)
+        # 记录中的图片为原始 src，在输出边缘才按本次的图片目录解析为路径
+        self.json_writer = _JsonListWriter(self.json_tmp, compact=self.options.compact_json,
+                                           gzip_copy=self.options.gzip_json, budget=self.budget,
+                                           to_dict=lambda record: _resolve_images(store.to_dict(record), resolve))
+        self.json_writer.start()
+        if self.staging is not None:
+            self.cache_writer = _JsonListWriter(self.staging.records_path, to_dict=store.to_dict, lines=True)
+            self.cache_writer.start()
+
+        date_index = DateIndex()
+        stats = ChatStats(store)
+        batch = []
+        for msg in self._records(token, slots):
+            date_index.add(store.date_of(msg))
+            stats.add(msg)
+            batch.append(msg)
+            if len(batch) >= 256:
+                self.json_writer.put(batch)
+                if self.cache_writer is not None:
+                    self.cache_writer.put(batch)
+                batch = []
+        self.json_writer.put(batch)
+        self.json_writer, pending = None, self.json_writer
+        pending.close()
+        self.json_digest = pending.digest
+        if self.cache_writer is not None:
+            self.cache_writer.put(batch)
+            self.cache_writer, pending = None, self.cache_writer
+            pending.close()
+        return date_index, stats
+
+    def finish(self, token, slots, count):
+        """等待后台写入完成，关闭数据来源，提交解析缓存"""
+        self.writer.close()
+        if self.spill is not None:
+            self.spill.close()
+        if self.source is not None:
+            self.source.close()
+        if self.staging is not None:
+            self.staging.commit(dict(self.cache_meta, token=token, slots=slots, count=count))
+
+    def cleanup(self, error):
+        """停止后台线程并删除临时文件；取消或中断时同时删除本次写出的图片"""
+        self.abort.set()
+        for pending in (self.json_writer, self.cache_writer):
+            if pending is not None:
+                pending.abort()
+        if self.writer is not None:
+            self.writer.close(raise_errors=False)  # 等后台写入结束后再清理
+        if self.reader is not None:
+            self.reader.join()
+        if self.spill is not None:
+            self.spill.close()
+        if self.source is not None:
+            self.source.close()
+        if self.staging is not None:
+            self.staging.discard()
+        _remove_partial_output([self.json_tmp, self.json_tmp + ".gz", self.html_tmp])
+        if isinstance(error, (ConversionCancelled, KeyboardInterrupt)):
+            _remove_partial_output(self.written, self.image_dir if self.new_image_dir else None)
+            print("[x] 转换已取消，已清理本次写出的文件")
+
+    def publish(self, date_index, stats):
+        """替换 JSON / HTML，写出日期索引、版本与统计摘要；返回统计摘要"""
+        json_out, json_tmp = self.json_out, self.json_tmp
+        os.replace(self.html_tmp, self.html_out)
+        os.replace(json_tmp, json_out)
+        if self.options.gzip_json:
+            os.replace(json_tmp + ".gz", json_out + ".gz")
+        elif os.path.exists(json_out + ".gz"):
+            os.remove(json_out + ".gz")  # 避免服务器继续发送过期的压缩版本
+        # JSON 已更新，旧的 JSON Lines 副本不再一致（需要时由调用方重新生成，见 write_json_lines_copy）
+        for stale in (lines_path_for(json_out), lines_path_for(json_out) + ".gz"):
+            if os.path.exists(stale):
+                os.remove(stale)
+        write_json(date_index.result(), index_path_for(json_out), compact=True, gzip_copy=self.options.gzip_json)
+        write_export_version(json_out, self.json_digest, date_index.count)
+        summary = stats.result()
+        write_json(summary, stats_path_for(json_out), compact=True)
+        return summary
+
+    def report(self, summary, matches):
+        print(f"[x] 已导出 JSON：{self.json_out}")
+        print(f"[x] 已保存可直接打开的 HTML：{self.html_out}")
+        print(f"[x] 已创建并写入图片目录：{self.image_dir}")
+        if self.transcoding is not None:
+            print(f"[x] {self.transcoding.summary()}")
+        if self.options.partial:
+            print(f"[x] 部分导出：保留 {summary['count']} 条消息，写出 {len(matches)} 张图片")
+        print(f"[x] 统计摘要：{summary['count']} 条消息，{len(summary['senders'])} 位发送者，"
+              f"{summary['days']} 天，{summary['images']} 张图片")
+        if self.budget is not None:
+            rss = _peak_rss()
+            print(f"[x] 内存预算 {self.options.memory_limit / (1 << 20):.1f} MB："
+                  f"缓冲数据峰值 {self.budget.peak / (1 << 20):.1f} MB，"
+                  f"溢写到临时文件 {self.spill.size / (1 << 20):.1f} MB"
+                  + (f"，进程内存峰值 {rss / (1 << 20):.0f} MB" if rss else ""))
+
+
 def export_from_mht(
     mht_path: str,
     json_out: str = "qq_chat.json",
     html_out: str = "qq_chat_extracted.html",
     image_dir_name: str = "Image",
+    options=None,
+    progress=None,
+    cancel=None,
+    **option_kwargs,
 ):
-    html_text, attachments = read_mht(mht_path)
-    soup = BeautifulSoup(html_text, "lxml")
-    
-    # 构建 src_to_local 映射
-    src_to_local, _ = build_src_to_local_map(soup, attachments, html_out, image_dir_name=image_dir_name)
-    rewrite_html_img_srcs(soup, src_to_local, html_out, image_dir_name=image_dir_name)
-
-    os.makedirs(os.path.dirname(os.path.abspath(html_out)) or ".", exist_ok=True)
-    with open(html_out, "w", encoding="utf-8") as f:
-        f.write(str(soup))
-
-    records = []
-    current_date = None
-    rows = soup.find_all("tr")  # 获取所有 <tr> 元素
+    """
+    options:  ExportOptions（JSON 格式、内存预算、解析缓存、部分导出、转码、图片目录布局，见 ExportOptions）。
+              也可以不构造 ExportOptions，直接以关键字参数传入这些选项（compact_json=True 等）。
+    progress: 可选回调，接收 ProgressEvent(stage, done, total, bytes)；
+              不提供时在终端显示 tqdm 进度条。回调在处理线程中同步调用，应尽快返回。
+    cancel:   可选取消事件（threading.Event / multiprocessing.Event）。置位后约 0.1 秒内
+              抛出 ConversionCancelled，并删除本次已写出的图片；JSON 与 HTML 成功后才替换，已有的导出保持不变。
+    MHT 旁有 scan_mht 写出的有效偏移表时，直接按偏移读取 HTML，图片由写入线程按偏移读取解码，不再扫描整个文件。
 
-    # 使用 tqdm 显示进度条
-    for tr in tqdm(rows, desc="Processing messages", unit="msg"):
-        msg, current_date = parse_message(tr, src_to_local, current_date)
-        if msg:
-            records.append(msg)
+    各阶段流水线执行：读取线程流式切分 MIME 部分，HTML 一读完即开始解析（与读取图片重叠），
+    图片与 HTML 由后台线程写出，解析出的记录分批交给 JSON 写入线程，阶段之间用有界队列背压。
+    """
+    if options is None:
+        options = ExportOptions(**option_kwargs)
+    elif option_kwargs:
+        raise TypeError(f"已指定 options，不能再单独传入导出选项：{', '.join(option_kwargs)}")
 
-    os.makedirs(os.path.dirname(os.path.abspath(json_out)) or ".", exist_ok=True)
-    with open(json_out, "w", encoding="utf-8") as f:
-        json.dump(records, f, ensure_ascii=False, indent=2)
+    run = _ExportRun(mht_path, json_out, html_out, image_dir_name, options, progress, cancel)
+    try:
+        run.select_source()
+        matches = run.parse()
+        src_to_local = run.write_images(matches)
+        token, slots = run.write_html(matches, src_to_local)
+        date_index, stats = run.write_records(token, slots, src_to_local)
+        run.finish(token, slots, date_index.count)
+    except BaseException as e:
+        run.cleanup(e)
+        raise
+    summary = run.publish(date_index, stats)
+    run.report(summary, matches)
 
-    print(f"[x] 已导出 JSON：{json_out}")
-    print(f"[x] 已保存可直接打开的 HTML：{html_out}")
-    print(f"[x] 已创建并写入图片目录：{os.path.join(os.path.dirname(os.path.abspath(html_out)), image_dir_name)}")
-    
 
-def deduplicate_images(image_dir, json_file, json_out=None):
-    # 1) 扫描图片文件
-    all_files = [f for f in os.listdir(image_dir) if os.path.isfile(os.path.join(image_dir, f))]
+def deduplicate_images(image_dir, json_file, json_out=None, compact_json=False, gzip_json=False, progress=None,
+                       cancel=None):
+    """
+    cancel: 可选取消事件。重复文件在 JSON 写回之后才删除，
+            因此在此之前取消不会留下指向已删除图片的 JSON。
+    """
+    check = _CancelCheck(cancel)
+    # 1) 扫描图片文件（相对图片目录；fanout 布局时包含子目录）
+    all_files = list_image_files(image_dir)
     
     # 2) 归组
     basename_map = {}  # 基础名 -> 第一个文件
-    old_to_new = {}    # 旧文件名 -> 新保留文件名
+    old_to_new = {}    # 旧文件名 -> 新保留文件（相对图片目录的路径）
+    duplicates = []    # 待删除的重复文件
+    reporter = ProgressReporter(progress, "dedup", len(all_files)) if progress is not None else None
     for f in all_files:
+        check()
+        if reporter is not None:
+            reporter.update()
+        file_name = f.rsplit("/", 1)[-1]
         # 去掉扩展名
-        name, ext = os.path.splitext(f)
+        name, ext = os.path.splitext(file_name)
         # 去掉末尾的 _数字
         base_name = re.sub(r'_\d+$', '', name)
         if base_name not in basename_map:
             basename_map[base_name] = f
-            old_to_new[f] = f
+            old_to_new[file_name] = f
         else:
             # 重复文件，指向已有文件
-            old_to_new[f] = basename_map[base_name]
-            # 删除重复文件
-            os.remove(os.path.join(image_dir, f))
-    
-    print(f"[x] 图片去重完成，共保留 {len(basename_map)} 张图片")
+            old_to_new[file_name] = basename_map[base_name]
+            duplicates.append(f)
+    if reporter is not None:
+        reporter.close()
 
-    # 3) 更新 JSON
-    with open(json_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    # 3) 更新 JSON（读取时即转换为紧凑记录，不保留整份 dict 列表）
+    store, data = RecordStore.load_json(json_file)
 
     def update_paths(msg):
         if not msg:
             return
+        if isinstance(msg, (MessageRecord, ForwardedRecord)):
+            if msg.images:
+                msg.images = tuple(old_to_new.get(os.path.basename(p), p) for p in msg.images)
+            for fwd in getattr(msg, "forwarded", None) or ():
+                update_paths(fwd)
+            return
         if msg.get("image"):
             msg["image"] = old_to_new.get(os.path.basename(msg["image"]), msg["image"])
         if msg.get("images"):
@@ -416,37 +1902,46 @@ def deduplicate_images(image_dir, json_file, json_out=None):
             for fwd in msg["forwarded"]:
                 update_paths(fwd)
 
-    if isinstance(data, list):
-        for msg in data:
-            update_paths(msg)
-    elif isinstance(data, dict) and "messages" in data:
-        for msg in data["messages"]:
+    if isinstance(data, list) or (isinstance(data, dict) and "messages" in data):
+        for msg in store:
             update_paths(msg)
     else:
         raise RuntimeError("JSON 格式未知")
+    check()
 
-    # 4) 保存
+    # 4) 保存，再删除重复文件
     json_out = json_out or json_file
-    with open(json_out, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if isinstance(data, list):
+        digest = write_json_list(store.iter_dicts(), json_out, compact=compact_json, gzip_copy=gzip_json)
+    else:
+        digest = write_json({**data, "messages": list(store.iter_dicts())}, json_out, compact=compact_json,
+                            gzip_copy=gzip_json)
+    write_export_version(json_out, digest, len(store))
+    if os.path.exists(lines_path_for(json_out)):
+        write_json_lines(store.iter_dicts(), lines_path_for(json_out), gzip_copy=gzip_json)
+    for f in duplicates:
+        os.remove(os.path.join(image_dir, f))
 
+    print(f"[x] 图片去重完成，共保留 {len(basename_map)} 张图片")
     print(f"[x] JSON 更新完成：{json_out}")
     
     
 def embed_json_in_html(json_path, html_path):
-    """Embed JSON data directly into the HTML file."""
-    with open(json_path, "r", encoding="utf-8") as json_file:
-        json_data = json_file.read()
-    
+    """
+    Embed JSON data directly into the HTML file.
+    以 <script>const embeddedChatData = ...;</script> 插入到 </head> 之前（没有 </head> 时放在开头）。
+    JSON 原样复制进页面，不会整体读入内存；需要按日期分块压缩的单文件查看器时使用 bundle.write_viewer_bundle。
+    """
     with open(html_path, "r", encoding="utf-8") as html_file:
         html_content = html_file.read()
-    
-    # Embed JSON data into a <script> tag in the HTML
-    embedded_script = f"<script>const embeddedChatData = {json_data};</script>"
-    if "</head>" in html_content:
-        html_content = html_content.replace("</head>", f"{embedded_script}\n</head>")
-    else:
-        html_content = f"{embedded_script}\n{html_content}"
-    
-    with open(html_path, "w", encoding="utf-8") as html_file:
-        html_file.write(html_content)
\ No newline at end of file
+    cut = html_content.find("</head>")
+    head, tail = (html_content[:cut], html_content[cut:]) if cut >= 0 else ("", html_content)
+
+    tmp = html_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as out, open(json_path, "r", encoding="utf-8") as json_file:
+        out.write(head)
+        out.write("<script>const embeddedChatData = ")
+        shutil.copyfileobj(json_file, out, 1 << 20)
+        out.write(";</script>\n")
+        out.write(tail)
+    os.replace(tmp, html_path)
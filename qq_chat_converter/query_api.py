@@ -0,0 +1,164 @@
+import os
+import json
+import threading
+
+from http import HTTPStatus
+from itertools import islice
+from urllib.parse import urlsplit, parse_qs
+
+from qq_chat_converter.archive import ChatArchive
+from qq_chat_converter.server import ViewerRequestHandler
+
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 1000
+
+
+def _page_ids(runs, offset, limit):
+    """在若干 [start, end) 区间连接成的序列中取 offset 起的 limit + 1 个 id（多取一个用于判断 has_more）"""
+    ids = []
+    for start, end in runs:
+        if offset >= end - start:
+            offset -= end - start
+            continue
+        first = start + offset
+        ids.extend(range(first, min(end, first + limit + 1 - len(ids))))
+        offset = 0
+        if len(ids) > limit:
+            break
+    return ids
+
+
+def _with_id(raw, msg_id):
+    """记录原文 -> 末尾追加 originalId 字段的 JSON 文本（记录不是对象时原样返回）"""
+    text = raw.decode("utf-8")
+    if not text.startswith("{"):
+        return text
+    body = text[1:-1].strip()
+    return "{" + body + ("," if body else "") + f'"originalId":{msg_id}}}'
+
+
+class ChatQueryService:
+    """
+    基于 ChatArchive 的索引（qq_chat.archive.*：每条记录的字节偏移、日期区间）回答查看器的分页查询。
+    返回的记录直接取自内存映射的 JSON 原文，不经解码再编码；索引在首次查询时构建，源 JSON 变化后自动重建。
+    """
+
+    def __init__(self, json_file):
+        self.json_file = json_file
+        self._lock = threading.Lock()
+        self._archive = None
+        self._stamp = None
+
+    def _open(self):
+        st = os.stat(self.json_file)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if stamp != self._stamp:
+                # 旧的 ChatArchive 不主动关闭：其它线程可能仍在读取，最后一个引用释放时内存映射随之关闭
+                self._archive = ChatArchive(self.json_file)
+                self._stamp = stamp
+            return self._archive
+
+    @staticmethod
+    def _page(archive, ids, limit):
+        return [_with_id(archive.raw(i), i) for i in ids[:limit]], len(ids) > limit
+
+    def dates(self):
+        archive = self._open()
+        return {"dates": [{"date": d, "count": sum(end - start for start, end in runs)}
+                          for d, runs in sorted(archive.dates.items())]}
+
+    def messages(self, date=None, offset=0, limit=DEFAULT_LIMIT):
+        archive = self._open()
+        runs = archive.dates.get(date, []) if date else [[0, len(archive)]]
+        records, has_more = self._page(archive, _page_ids(runs, offset, limit), limit)
+        return {"date": date, "offset": offset, "has_more": has_more, "messages": records}
+
+    def search(self, q, offset=0, limit=DEFAULT_LIMIT):
+        q = (q or "").strip()
+        if not q:
+            return {"q": q, "offset": offset, "has_more": False, "messages": []}
+        archive = self._open()
+        ids = [i for i, _ in islice(archive.search(q, ignore_case=True), offset, offset + limit + 1)]
+        records, has_more = self._page(archive, ids, limit)
+        return {"q": q, "offset": offset, "has_more": has_more, "messages": records}
+
+    def context(self, msg_id, limit=DEFAULT_LIMIT):
+        """返回目标消息所在日期中、以它为中心的一页消息，供“跳转到上下文”使用。"""
+        archive = self._open()
+        if not 0 <= msg_id < len(archive):
+            return None
+        record = archive[msg_id]
+        date = record.get("date") if isinstance(record, dict) else None
+        runs = (isinstance(date, str) and archive.dates.get(date)) or [[msg_id, msg_id + 1]]
+        pos = 0
+        for start, end in runs:
+            if msg_id < end:
+                pos += max(0, msg_id - start)
+                break
+            pos += end - start
+        offset = max(0, pos - limit // 2)
+        records, has_more = self._page(archive, _page_ids(runs, offset, limit), limit)
+        return {"id": msg_id, "date": date, "offset": offset, "has_more": has_more, "messages": records}
+
+
+def _dump_response(result):
+    """messages 字段里已经是序列化好的记录，直接拼接，避免逐条反序列化再序列化。"""
+    records = result.pop("messages", None)
+    head = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    if records is None:
+        return head.encode("utf-8")
+    body = head[:-1] + ("," if len(head) > 2 else "") + '"messages":[' + ",".join(records) + "]}"
+    return body.encode("utf-8")
+
+
+class ApiRequestHandler(ViewerRequestHandler):
+    """在查看器静态文件服务之上增加 /api/dates、/api/messages、/api/search、/api/context。"""
+    query_service = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/api/"):
+            self._handle_api(url.path[len("/api/"):], parse_qs(url.query))
+        else:
+            super().do_GET()
+
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_api(self, route, params):
+        def arg(name, default=None):
+            return params.get(name, [default])[0]
+
+        try:
+            offset = max(0, int(arg("offset", 0)))
+            limit = min(MAX_LIMIT, max(1, int(arg("limit", DEFAULT_LIMIT))))
+            service = self.query_service
+            if route == "dates":
+                result = service.dates()
+            elif route == "messages":
+                result = service.messages(arg("date"), offset, limit)
+            elif route == "search":
+                result = service.search(arg("q", ""), offset, limit)
+            elif route == "context":
+                result = service.context(int(arg("id")), limit)
+                if result is None:
+                    self._send_json(HTTPStatus.NOT_FOUND, b'{"error":"message not found"}')
+                    return
+            else:
+                self._send_json(HTTPStatus.NOT_FOUND, b'{"error":"unknown endpoint"}')
+                return
+        except (TypeError, ValueError):
+            self._send_json(HTTPStatus.BAD_REQUEST, b'{"error":"invalid parameter"}')
+            return
+        except FileNotFoundError:
+            # 目录中没有导出的 JSON（例如浏览多个导出目录的上级目录），查看器会回退到静态模式
+            self._send_json(HTTPStatus.NOT_FOUND, b'{"error":"archive not found"}')
+            return
+        self._send_json(HTTPStatus.OK, _dump_response(result))
@@ -0,0 +1,161 @@
+import json
+
+
+# 导出 JSON 中记录的键顺序；压缩记录还原为 dict 时保持一致，输出与原先逐字节相同
+MESSAGE_KEYS = ("sender", "date", "time", "text", "images", "image", "forwarded")
+FORWARDED_KEYS = ("sender", "time", "text", "images", "image")
+
+
+class StringTable:
+    """把重复出现的字符串（发送者、日期）映射为小整数 id，None 保持为 None"""
+    __slots__ = ("_ids", "values")
+
+    def __init__(self):
+        self._ids = {}
+        self.values = []
+
+    def id_of(self, value):
+        if value is None:
+            return None
+        i = self._ids.get(value)
+        if i is None:
+            # 同一字符串的所有记录共享这一个 int 对象
+            i = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def value_of(self, i):
+        return None if i is None else self.values[i]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ForwardedRecord:
+    """转发消息中的一条：sender 为 id，images 为元组（image 由 images[0] 推出，不单独保存）"""
+    __slots__ = ("sender", "time", "text", "images")
+
+    def __init__(self, sender, time, text, images):
+        self.sender = sender
+        self.time = time
+        self.text = text
+        self.images = images
+
+
+class MessageRecord:
+    """一条聊天消息：sender / date 为 id，forwarded 为 ForwardedRecord 元组"""
+    __slots__ = ("sender", "date", "time", "text", "images", "forwarded")
+
+    def __init__(self, sender, date, time, text, images, forwarded):
+        self.sender = sender
+        self.date = date
+        self.time = time
+        self.text = text
+        self.images = images
+        self.forwarded = forwarded
+
+
+def _is_images(value, image):
+    if value is None:
+        return image is None
+    return (isinstance(value, list) and value and all(isinstance(p, str) for p in value)
+            and image == value[0])
+
+
+def _is_str(*values):
+    return all(v is None or isinstance(v, str) for v in values)
+
+
+class RecordStore:
+    """
+    一组紧凑记录及其共享的字符串表（发送者、日期、时间）。
+    解析与去重都在紧凑记录上进行，只在输出边缘通过 to_dict / iter_dicts 还原为 dict。
+    无法无损压缩的记录（键不同、结构异常）原样保留为 dict。
+    """
+
+    def __init__(self):
+        self.senders = StringTable()
+        self.dates = StringTable()
+        self._times = {}
+        self.records = []
+
+    def _time(self, value):
+        return None if value is None else self._times.setdefault(value, value)
+
+    def forwarded(self, sender, time, text, images):
+        return ForwardedRecord(self.senders.id_of(sender), self._time(time), text,
+                               tuple(images) if images else None)
+
+    def message(self, sender, date, time, text, images, forwarded):
+        return MessageRecord(self.senders.id_of(sender), self.dates.id_of(date), self._time(time), text,
+                             tuple(images) if images else None, tuple(forwarded) if forwarded else None)
+
+    def append(self, record):
+        self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def date_of(self, record):
+        if isinstance(record, MessageRecord):
+            return self.dates.value_of(record.date)
+        return record.get("date") if isinstance(record, dict) else None
+
+    def to_dict(self, record):
+        """紧凑记录 -> 与导出格式相同的 dict（其它对象原样返回）"""
+        if isinstance(record, MessageRecord):
+            images = list(record.images) if record.images else None
+            return {
+                "sender": self.senders.value_of(record.sender),
+                "date": self.dates.value_of(record.date),
+                "time": record.time,
+                "text": record.text,
+                "images": images,
+                "image": images[0] if images else None,
+                "forwarded": [self.to_dict(f) for f in record.forwarded] if record.forwarded else None,
+            }
+        if isinstance(record, ForwardedRecord):
+            images = list(record.images) if record.images else None
+            return {
+                "sender": self.senders.value_of(record.sender),
+                "time": record.time,
+                "text": record.text,
+                "images": images,
+                "image": images[0] if images else None,
+            }
+        return record
+
+    def iter_dicts(self):
+        for record in self.records:
+            yield self.to_dict(record)
+
+    def from_dict(self, d):
+        """导出格式的 dict -> 紧凑记录；不能无损还原的 dict 原样返回"""
+        keys = tuple(d)
+        if keys == FORWARDED_KEYS:
+            if _is_str(d["sender"], d["time"], d["text"]) and _is_images(d["images"], d["image"]):
+                return self.forwarded(d["sender"], d["time"], d["text"], d["images"])
+        elif keys == MESSAGE_KEYS:
+            fwd = d["forwarded"]
+            if (_is_str(d["sender"], d["date"], d["time"], d["text"]) and _is_images(d["images"], d["image"])
+                    and (fwd is None or (isinstance(fwd, list) and fwd))):
+                return self.message(d["sender"], d["date"], d["time"], d["text"], d["images"], fwd)
+        return d
+
+    @classmethod
+    def load_json(cls, path):
+        """
+        读取导出的 JSON，解析过程中即转换为紧凑记录，不会先构建完整的 dict 列表。
+        返回 (store, data)：data 为 JSON 顶层对象（列表本身即 store.records，或含 "messages" 的 dict）。
+        """
+        store = cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f, object_hook=store.from_dict)
+        if isinstance(data, list):
+            store.records = data
+        elif isinstance(data, dict) and isinstance(data.get("messages"), list):
+            store.records = data["messages"]
+        return store, data
@@ -0,0 +1,189 @@
+import os
+import re
+import shutil
+import posixpath
+
+from functools import partial
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+
+PRECOMPRESSED_EXTS = {".json", ".jsonl", ".html", ".js", ".css"}
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ViewerRequestHandler(SimpleHTTPRequestHandler):
+    """
+    查看器用的静态文件 Handler：
+    - ETag / Last-Modified 校验（Cache-Control: no-cache，每次向服务器确认；重新导出到同一目录时
+      Image/1.png 之类的文件名会对应不同的图片，因此图片也不能长期缓存，未变化时只返回 304）；
+    - 单段 Range 请求（206 / 416）；
+    - 客户端接受 gzip 时直接发送同名 .gz 预压缩文件（Content-Encoding: gzip）。
+    """
+    protocol_version = "HTTP/1.1"
+    quiet = False
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def _accepts_gzip(self):
+        accept = self.headers.get("Accept-Encoding", "")
+        for item in accept.split(","):
+            coding, _, params = item.strip().partition(";")
+            if coding.strip().lower() in ("gzip", "*") and params.replace(" ", "") != "q=0":
+                return True
+        return False
+
+    def _not_modified(self, etag, mtime):
+        inm = self.headers.get("If-None-Match")
+        if inm is not None:
+            tags = [t.strip() for t in inm.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        ims = self.headers.get("If-Modified-Since")
+        if ims is not None:
+            try:
+                return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+            except (TypeError, ValueError, IndexError, OverflowError):
+                return False
+        return False
+
+    def _parse_range(self, size, etag):
+        header = self.headers.get("Range")
+        if not header or size == 0:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range.strip() != etag:
+            return None
+        m = RANGE_RE.match(header.strip())
+        if not m or m.group(1) == m.group(2) == "":
+            return None  # 多段或格式不支持时退回完整响应
+        if m.group(1) == "":
+            length = min(int(m.group(2)), size)
+            return size - length, size - 1
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+        if start >= size or end < start:
+            return False
+        return start, min(end, size - 1)
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        self._range = None
+        if os.path.isdir(path):
+            if not self.path.split("?", 1)[0].endswith("/"):
+                return super().send_head()  # 交给父类处理重定向
+            for index in ("index.html", "index.htm"):
+                if os.path.isfile(os.path.join(path, index)):
+                    path = os.path.join(path, index)
+                    break
+            else:
+                return super().send_head()  # 目录列表
+        if path.endswith("/") or not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+
+        ext = posixpath.splitext(path)[1].lower()
+        serve_path, encoding = path, None
+        if ext in PRECOMPRESSED_EXTS and self._accepts_gzip() and os.path.isfile(path + ".gz"):
+            serve_path, encoding = path + ".gz", "gzip"
+
+        try:
+            f = open(serve_path, "rb")
+        except OSError:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return None
+        try:
+            st = os.fstat(f.fileno())
+            etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}{"-gz" if encoding else ""}"'
+
+            cache_headers = {
+                "ETag": etag,
+                "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+                "Cache-Control": "no-cache",
+            }
+            if ext in PRECOMPRESSED_EXTS:
+                cache_headers["Vary"] = "Accept-Encoding"
+
+            if self._not_modified(etag, st.st_mtime):
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                for k, v in cache_headers.items():
+                    self.send_header(k, v)
+                self.end_headers()
+                f.close()
+                return None
+
+            byte_range = None if encoding else self._parse_range(st.st_size, etag)
+            if byte_range is False:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header("Content-Range", f"bytes */{st.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                f.close()
+                return None
+
+            if byte_range:
+                start, end = byte_range
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+                length = end - start + 1
+                f.seek(start)
+                self._range = length
+            else:
+                self.send_response(HTTPStatus.OK)
+                length = st.st_size
+            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            for k, v in cache_headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            return f
+        except Exception:
+            f.close()
+            raise
+
+    def copyfile(self, source, outputfile):
+        if self._range is None:
+            shutil.copyfileobj(source, outputfile)
+            return
+        remaining = self._range
+        while remaining > 0:
+            buf = source.read(min(64 * 1024, remaining))
+            if not buf:
+                break
+            outputfile.write(buf)
+            remaining -= len(buf)
+
+
+def make_viewer_server(directory, port=8000, host="localhost", quiet=False, api=False):
+    """
+    创建以 directory 为根目录的多线程查看器服务器（调用方负责 serve_forever / shutdown）。
+    api=True 时额外提供基于记录索引的分页查询接口 /api/*（见 query_api）。
+    """
+    directory = os.path.abspath(directory)
+    attrs = {"quiet": quiet}
+    base_cls = ViewerRequestHandler
+    if api:
+        from qq_chat_converter.query_api import ApiRequestHandler, ChatQueryService
+        base_cls = ApiRequestHandler
+        attrs["query_service"] = ChatQueryService(os.path.join(directory, "qq_chat.json"))
+    handler_cls = type("ScopedViewerRequestHandler", (base_cls,), attrs)
+    handler = partial(handler_cls, directory=directory)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_viewer(directory, port=8000, host="localhost", api=False):
+    server = make_viewer_server(directory, port=port, host=host, api=api)
+    print(f"HTML Server 已启动: http://{host}:{port}/ -> {os.path.abspath(directory)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,164 @@
+import os
+import json
+import html
+
+from itertools import groupby
+
+from qq_chat_converter.py_funcs import iter_json_array
+
+
+PAGE_STYLE = """
+body { font-family: Arial, "Microsoft YaHei", sans-serif; margin: 0; background: #f4f4f4; }
+.toolbar { background: #3a96f1; color: white; padding: 10px 20px; display: flex; gap: 15px;
+           align-items: center; position: sticky; top: 0; box-shadow: 0 2px 5px rgba(0,0,0,0.2); }
+.toolbar a { color: white; text-decoration: none; }
+.toolbar .disabled { opacity: 0.5; }
+.chat-container { padding: 10px; max-width: 800px; margin: auto; }
+.message { background: white; margin: 8px 0; padding: 12px; border-radius: 8px;
+           box-shadow: 0 1px 3px rgba(0,0,0,0.12); }
+.sender { font-weight: bold; color: #0d47a1; }
+.time { font-size: 12px; color: #555; }
+.text { margin-top: 5px; white-space: pre-wrap; word-wrap: break-word; }
+.image { margin-top: 8px; max-width: 200px; border-radius: 6px; }
+.forwarded-message { margin-left: 20px; background: #e9f5ff; }
+.date-list a { display: block; padding: 6px 0; }
+""".strip()
+
+UNDATED_KEY = "undated"
+
+
+def _esc(s):
+    return html.escape(s or "", quote=True)
+
+
+def _image_href(path, image_prefix):
+    path = path.replace("\\", "/")
+    if path.startswith(("http://", "https://", "/")):
+        return path
+    # 去重前的路径形如 Image/xxx.jpg，去重后只剩文件名，两种都相对图片目录解析
+    folder = image_prefix.rsplit("/", 1)[-1]
+    if path.startswith(folder + "/"):
+        path = path[len(folder) + 1:]
+    return f"{image_prefix}/{path}"
+
+
+def _render_message(msg, image_prefix, forwarded=False, with_date=False):
+    cls = "message forwarded-message" if forwarded else "message"
+    sender = ("↪ " if forwarded else "") + (msg.get("sender") or "未知")
+    time_ = msg.get("time") or ""
+    if with_date and msg.get("date"):
+        time_ = f"{msg['date']} {time_}"
+    parts = [
+        f'<div class="{cls}">',
+        f'<div class="sender">{_esc(sender)}</div>',
+        f'<div class="time">{_esc(time_)}</div>',
+    ]
+    if msg.get("text"):
+        parts.append(f'<div class="text">{_esc(msg["text"])}</div>')
+    images = msg.get("images") or ([msg["image"]] if msg.get("image") else [])
+    for img in images:
+        href = _esc(_image_href(img, image_prefix))
+        parts.append(f'<a href="{href}" target="_blank"><img class="image" src="{href}" loading="lazy" alt="聊天图片"></a>')
+    for fwd in msg.get("forwarded") or []:
+        parts.append(_render_message(fwd, image_prefix, forwarded=True, with_date=True))
+    parts.append("</div>")
+    return "\n".join(parts)
+
+
+def _nav_link(href, label):
+    if href is None:
+        return f'<span class="disabled">{label}</span>'
+    return f'<a href="{_esc(href)}">{label}</a>'
+
+
+def _write_page_head(f, title):
+    f.write("<!DOCTYPE html>\n<html lang=\"zh\">\n<head>\n<meta charset=\"UTF-8\">\n")
+    f.write(f"<title>{_esc(title)}</title>\n<style>\n{PAGE_STYLE}\n</style>\n</head>\n<body>\n")
+
+
+def _plan_pages(records, page_size):
+    """
+    按连续的同日期消息段切分页面，返回 [(date, page, n_pages, file_name, count)]，
+    用于提前确定前后页链接。
+    """
+    pages, seen = [], {}
+    for date, run in groupby(records, key=lambda m: m.get("date")):
+        count = sum(1 for _ in run)
+        key = date or UNDATED_KEY
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:  # 同一日期在导出中不连续出现时避免文件名冲突
+            key = f"{key}-{seen[key]}"
+        n_pages = max(1, -(-count // page_size))
+        for p in range(1, n_pages + 1):
+            name = f"{key}.html" if p == 1 else f"{key}_{p}.html"
+            pages.append((date, p, n_pages, name, count))
+    return pages
+
+
+def _iter_records(json_file):
+    """逐条读取 JSON 中的记录；顶层为含 "messages" 的 dict 时（旧格式）整体读入"""
+    with open(json_file, "r", encoding="utf-8") as f:
+        head = f.read(64).lstrip()
+    if head.startswith("["):
+        return iter_json_array(json_file)
+    with open(json_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return iter(data.get("messages", []) if isinstance(data, dict) else [])
+
+
+def export_static_site(json_file, site_dir, image_dir=None, page_size=500):
+    """
+    将导出的 JSON 渲染为按日期分页的静态 HTML 页面（含日期索引页和前后页链接），
+    无需浏览器端解析 JSON，可直接放在任意静态文件服务器上浏览。
+
+    json_file: export_from_mht / deduplicate_images 生成的 JSON
+    site_dir:  静态页面输出目录
+    image_dir: 图片目录，默认为 JSON 同级的 Image 目录；页面中以相对路径引用
+    page_size: 每页的消息数，单日消息超过时分为多页
+    """
+    os.makedirs(site_dir, exist_ok=True)
+    if image_dir is None:
+        image_dir = os.path.join(os.path.dirname(os.path.abspath(json_file)), "Image")
+    image_prefix = os.path.relpath(os.path.abspath(image_dir), os.path.abspath(site_dir)).replace(os.sep, "/")
+
+    # 第一遍只统计各日期段的消息数以确定页面与前后页链接，第二遍逐条读取、逐页写出；
+    # 两遍都流式读取 JSON，内存占用只与页数有关
+    pages = _plan_pages(_iter_records(json_file), page_size)
+
+    page_idx = 0
+    for date, day_msgs in groupby(_iter_records(json_file), key=lambda m: m.get("date")):
+        for _ in range(pages[page_idx][2]):
+            _, page, n_pages, name, _count = pages[page_idx]
+            prev_href = pages[page_idx - 1][3] if page_idx > 0 else None
+            next_href = pages[page_idx + 1][3] if page_idx + 1 < len(pages) else None
+            title = date or "未知日期"
+            if n_pages > 1:
+                title = f"{title} ({page}/{n_pages})"
+
+            with open(os.path.join(site_dir, name), "w", encoding="utf-8") as f:
+                _write_page_head(f, title)
+                f.write('<div class="toolbar">')
+                f.write(_nav_link(prev_href, "&lt; 上一页"))
+                f.write(_nav_link("index.html", "日期索引"))
+                f.write(f"<span>{_esc(title)}</span>")
+                f.write(_nav_link(next_href, "下一页 &gt;"))
+                f.write('</div>\n<div class="chat-container">\n')
+                for _ in range(page_size):
+                    msg = next(day_msgs, None)
+                    if msg is None:
+                        break
+                    f.write(_render_message(msg, image_prefix))
+                    f.write("\n")
+                f.write("</div>\n</body>\n</html>\n")
+            page_idx += 1
+
+    with open(os.path.join(site_dir, "index.html"), "w", encoding="utf-8") as f:
+        _write_page_head(f, "聊天记录")
+        f.write('<div class="toolbar"><span>聊天记录 · 日期索引</span></div>\n')
+        f.write('<div class="chat-container date-list">\n')
+        for date, page, _n_pages, name, count in pages:
+            if page == 1:
+                f.write(f'<a href="{_esc(name)}">{_esc(date or "未知日期")} ({count})</a>\n')
+        f.write("</div>\n</body>\n</html>\n")
+
+    print(f"[x] 已生成静态页面：{site_dir}（{len(pages)} 页）")
@@ -0,0 +1,126 @@
+import io
+import os
+import threading
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+TRANSCODE_EXTS = (".png", ".jpg", ".jpeg", ".gif")
+DEFAULT_QUALITY = 80
+
+
+class ImageTranscoder:
+    """
+    导出时把 PNG / JPEG / 静态 GIF 重新编码为 WebP（需要 Pillow），只在结果更小时采用，否则保留原图。
+    动图（多帧 GIF / PNG）默认原样保留；指定 animated_max_bytes 时，超过该大小的动图转为 WebP 动图。
+    本身只保存设置（可传给工作进程），每次导出由 start() 创建独立的 TranscodeSession。
+    """
+
+    def __init__(self, quality=DEFAULT_QUALITY, animated_max_bytes=None):
+        if Image is None:
+            raise RuntimeError("图片转码需要 Pillow：pip install pillow")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"WebP 质量应在 1~100 之间：{quality}")
+        self.quality = quality
+        self.animated_max_bytes = animated_max_bytes
+
+    def start(self):
+        return TranscodeSession(self)
+
+
+def _webp_path(path):
+    return os.path.splitext(path)[0] + ".webp"
+
+
+class TranscodeSession:
+    """
+    一次导出中的转码：store(path, data) 作为写图片的函数在写入线程池中并发调用
+    （Pillow 解码 / 编码时释放 GIL，多个线程可同时转码），实际写出的路径记录在 outputs 中，
+    全部写完后由 remap 更新 src_to_local。调用方需同时预留 path 与对应的 .webp 两个文件名，
+    .webp 不与原图同目录时（例如 fanout 布局）先用 reserve 登记。
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.outputs = {}     # 规范化的原图路径 -> 实际写出的路径
+        self.webp_paths = {}  # 规范化的原图路径 -> 转为 WebP 时写出的路径（未登记时与原图同目录）
+        self._lock = threading.Lock()
+        self.converted = self.kept = self.skipped_animated = 0
+        self.bytes_in = self.bytes_out = 0
+
+    @staticmethod
+    def accepts(ext):
+        return ext.lower() in TRANSCODE_EXTS
+
+    def reserve(self, path, webp_path):
+        """登记 path 转为 WebP 时写出的位置"""
+        with self._lock:
+            self.webp_paths[os.path.normcase(os.path.abspath(path))] = webp_path
+
+    def _encode(self, data):
+        """返回更小的 WebP 数据；动图按设置跳过、无法解码或没有变小时返回 None"""
+        try:
+            with Image.open(io.BytesIO(data)) as im:
+                animated = getattr(im, "n_frames", 1) > 1
+                limit = self.options.animated_max_bytes
+                if animated and (limit is None or len(data) <= limit):
+                    return None, True
+                out = io.BytesIO()
+                if animated:
+                    im.save(out, "WEBP", quality=self.options.quality, save_all=True)
+                else:
+                    if im.mode not in ("RGB", "RGBA"):
+                        im = im.convert("RGBA" if im.has_transparency_data else "RGB")
+                    im.save(out, "WEBP", quality=self.options.quality)
+        except Exception:  # 损坏或 Pillow 不支持的图片，保留原图
+            return None, False
+        webp = out.getvalue()
+        return (webp if len(webp) < len(data) else None), False
+
+    def store(self, path, data):
+        key = os.path.normcase(os.path.abspath(path))
+        webp = None
+        animated = False
+        if self.accepts(os.path.splitext(path)[1]):
+            webp, animated = self._encode(data)
+        if webp is not None:
+            with self._lock:
+                out_path = self.webp_paths.get(key) or _webp_path(path)
+            with open(out_path, "wb") as f:
+                f.write(webp)
+        else:
+            out_path = path
+            with open(out_path, "wb") as f:
+                f.write(data)
+        with self._lock:
+            self.outputs[key] = out_path
+            self.bytes_in += len(data)
+            if webp is not None:
+                self.converted += 1
+                self.bytes_out += len(webp)
+            else:
+                self.kept += 1
+                self.skipped_animated += animated
+                self.bytes_out += len(data)
+
+    def remap(self, src_to_local, html_dir):
+        """把 src_to_local 中的路径换成实际写出的文件（转为 WebP 的图片扩展名变为 .webp）"""
+        result = {}
+        for raw_src, rel in src_to_local.items():
+            path = os.path.normcase(os.path.abspath(os.path.join(html_dir, rel)))
+            out_path = self.outputs.get(path)
+            result[raw_src] = rel if out_path is None else os.path.relpath(out_path, html_dir)
+        return result
+
+    def summary(self):
+        saved = self.bytes_in - self.bytes_out
+        text = (f"图片转码：{self.converted} 张转为 WebP，{self.kept} 张保留原图"
+                + (f"（其中动图 {self.skipped_animated} 张）" if self.skipped_animated else "")
+                + f"；{self.bytes_in / (1 << 20):.1f} MB -> {self.bytes_out / (1 << 20):.1f} MB，"
+                  f"节省 {saved / (1 << 20):.1f} MB")
+        if self.bytes_in:
+            text += f"（{saved / self.bytes_in:.0%}）"
+        return text
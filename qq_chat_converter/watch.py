@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import sqlite3
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+MHT_EXTS = (".mht", ".mhtml")
+STATUS_INTERVAL = 30  # 秒：无变化时状态行的最长输出间隔
+
+
+def status_path_for(db_path):
+    """watch_state.db -> watch_state.status.json"""
+    return os.path.splitext(db_path)[0] + ".status.json"
+
+
+class WatchState:
+    """
+    记录收件箱中每个文件的处理状态（SQLite）。以 绝对路径 + 大小 + 修改时间 判断是否已处理：
+    完成或失败的文件在内容不变时不再转换，重启后同样跳过；中断时仍为 running 的文件会重新排队。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, status TEXT, out_dir TEXT, "
+            "messages INTEGER, elapsed REAL, error TEXT, updated REAL)"
+        )
+        self.conn.commit()
+
+    def is_handled(self, path, size, mtime_ns):
+        row = self.conn.execute("SELECT size, mtime_ns, status FROM files WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[:2] == (size, mtime_ns) and row[2] in ("done", "failed")
+
+    def mark(self, path, size, mtime_ns, status, out_dir=None, messages=None, elapsed=None, error=None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, status, out_dir, messages, elapsed, error, time.time()),
+        )
+        self.conn.commit()
+
+    def totals(self):
+        """{status: 文件数}"""
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM files GROUP BY status"))
+
+    def close(self):
+        self.conn.close()
+
+
+class WatchDaemon:
+    """
+    轮询收件箱目录，把新出现的 MHT 转换到 out_root/<文件名>：
+
+    - 文件的大小与修改时间连续 settle 秒不变才视为写入完成（拷贝 / 同步中的文件不会被处理）；
+    - 转换在 workers 个常驻工作进程中执行（jobs.init_worker），同时运行的任务数不超过 workers，
+      其余在本地队列中等待；每个任务的输出写入 out_root/<文件名>.log；
+    - 处理状态记录在 WatchState 中，重启后不会重复转换；
+    - 队列深度、运行中任务数、累计吞吐等计数定期输出，并写入状态 JSON（status_path_for）。
+
+    stop() 后不再接受新任务，等待运行中的任务完成；stop(cancel=True) 让运行中的任务在下一个检查点
+    停止（清理已写出的文件），这些文件下次启动时重新转换。
+    """
+
+    def __init__(self, inbox, out_root, workers=2, poll_interval=2.0, settle=5.0, state_db=None, **options):
+        self.inbox = os.path.abspath(inbox)
+        self.out_root = out_root
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.options = options
+        os.makedirs(out_root, exist_ok=True)
+        self.state = WatchState(state_db or os.path.join(out_root, "watch_state.db"))
+        self.status_path = status_path_for(self.state.db_path)
+
+        self._seen = {}         # 路径 -> (大小, 修改时间, 首次观察到该状态的时间)
+        self._queue = deque()   # 等待工作进程的 (路径, 大小, 修改时间)
+        self._queued = set()
+        self._running = {}      # future -> (路径, 大小, 修改时间, 开始时间)
+        self._stopping = False
+        self._cancel = multiprocessing.Event()
+        self._pool = None
+        self.counters = {"done": 0, "failed": 0, "cancelled": 0, "bytes": 0, "messages": 0, "busy": 0.0}
+        self._start = None
+        self._last_status = (None, 0.0)
+
+    def _scan(self, now):
+        """列出收件箱，返回本轮新变为稳定的文件"""
+        ready, present = [], set()
+        try:
+            entries = list(os.scandir(self.inbox))
+        except OSError as e:
+            print(f"[x] 无法读取收件箱 {self.inbox}: {e}")
+            return ready
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.name.lower().endswith(MHT_EXTS):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue  # 扫描期间被移走
+            path = entry.path
+            present.add(path)
+            if path in self._queued or any(job[0] == path for job in self._running.values()):
+                continue
+            size, mtime_ns = st.st_size, st.st_mtime_ns
+            seen = self._seen.get(path)
+            if seen is None or seen[:2] != (size, mtime_ns):
+                self._seen[path] = (size, mtime_ns, now)  # 新文件或仍在增长，重新计时
+                continue
+            if now - seen[2] < self.settle or seen[2] < 0:
+                continue
+            self._seen[path] = (size, mtime_ns, -1.0)  # 已处理过这一版本，等待下一次变化
+            if size and not self.state.is_handled(path, size, mtime_ns):
+                ready.append((path, size, mtime_ns))
+        for path in list(self._seen):
+            if path not in present:
+                del self._seen[path]
+        return sorted(ready)
+
+    def _out_dir(self, path):
+        return os.path.join(self.out_root, os.path.splitext(os.path.basename(path))[0])
+
+    def _dispatch(self):
+        from qq_chat_converter.jobs import run_logged_job
+
+        while self._queue and len(self._running) < self.workers and not self._stopping:
+            path, size, mtime_ns = job = self._queue.popleft()
+            self._queued.discard(path)
+            out_dir = self._out_dir(path)
+            self.state.mark(path, size, mtime_ns, "running", out_dir=out_dir)
+            future = self._pool.submit(run_logged_job, path, out_dir, out_dir + ".log", **self.options)
+            self._running[future] = job + (time.perf_counter(),)
+            print(f"[x] 开始转换: {os.path.basename(path)} -> {out_dir}")
+
+    def _collect(self):
+        from qq_chat_converter.py_funcs import ConversionCancelled
+
+        for future in [f for f in self._running if f.done()]:
+            path, size, mtime_ns, started = self._running.pop(future)
+            self.counters["busy"] += time.perf_counter() - started
+            name = os.path.basename(path)
+            try:
+                result = future.result()
+            except ConversionCancelled:
+                # 保持 running 状态，下次启动时重新排队
+                self.counters["cancelled"] += 1
+                print(f"[x] 已取消: {name}")
+            except Exception as e:
+                self.counters["failed"] += 1
+                self.state.mark(path, size, mtime_ns, "failed", out_dir=self._out_dir(path), error=str(e))
+                print(f"[x] 转换失败: {name}: {e}（文件变化后会重试）")
+            else:
+                self.counters["done"] += 1
+                self.counters["bytes"] += result["bytes"]
+                self.counters["messages"] += result["messages"]
+                self.state.mark(path, size, mtime_ns, "done", out_dir=result["out_dir"],
+                                messages=result["messages"], elapsed=result["elapsed"])
+                print(f"[x] 转换完成: {name}，{result['messages']} 条消息，{result['elapsed']:.1f} 秒")
+
+    def status(self):
+        """当前计数：队列深度、运行中任务数、累计完成 / 失败数、吞吐（MB/s 按运行时长计，另给出文件数/小时）"""
+        c = self.counters
+        uptime = time.perf_counter() - self._start if self._start else 0.0
+        return {
+            "inbox": self.inbox,
+            "workers": self.workers,
+            "queue_depth": len(self._queue),
+            "running": len(self._running),
+            "settling": sum(1 for s in self._seen.values() if s[2] >= 0),
+            "done": c["done"],
+            "failed": c["failed"],
+            "cancelled": c["cancelled"],
+            "bytes": c["bytes"],
+            "messages": c["messages"],
+            "uptime": round(uptime, 1),
+            "mb_per_s": round(c["bytes"] / (1 << 20) / uptime, 3) if uptime else 0.0,
+            "files_per_hour": round(c["done"] * 3600 / uptime, 2) if uptime else 0.0,
+            "worker_utilization": round(c["busy"] / (uptime * self.workers), 3) if uptime else 0.0,
+            "updated": time.time(),
+        }
+
+    def _report(self, force=False):
+        status = self.status()
+        key = (status["queue_depth"], status["running"], status["settling"], status["done"], status["failed"])
+        now = time.perf_counter()
+        if not force and key == self._last_status[0] and now - self._last_status[1] < STATUS_INTERVAL:
+            return
+        self._last_status = (key, now)
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(status, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.status_path)
+        print(f"[x] 队列 {status['queue_depth']}，运行中 {status['running']}，等待写入完成 {status['settling']}；"
+              f"完成 {status['done']}，失败 {status['failed']}；{status['mb_per_s']:.2f} MB/s，"
+              f"{status['files_per_hour']:.1f} 个/小时")
+
+    def run_once(self):
+        """一轮轮询：收集完成的任务、扫描收件箱、派发任务、输出状态"""
+        self._collect()
+        if not self._stopping:
+            for job in self._scan(time.monotonic()):
+                self._queue.append(job)
+                self._queued.add(job[0])
+        self._dispatch()
+        self._report()
+
+    def run(self):
+        """阻塞运行，直到 stop() 后运行中的任务全部结束（第一次 Ctrl+C 等价于 stop()，第二次为 stop(cancel=True)）"""
+        from qq_chat_converter.jobs import init_worker
+
+        self._start = time.perf_counter()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                         initargs=(self._cancel,))
+        print(f"[x] 正在监视 {self.inbox}（{self.workers} 个工作进程），输出到 {self.out_root}")
+        try:
+            while not (self._stopping and not self._running):
+                try:
+                    self.run_once()
+                    time.sleep(self.poll_interval)
+                except KeyboardInterrupt:
+                    if self._stopping:
+                        self.stop(cancel=True)
+                    else:
+                        self.stop()
+                        if self._running:
+                            print(f"[x] 正在等待 {len(self._running)} 个任务完成，再次按 Ctrl+C 取消")
+            self._collect()
+        finally:
+            self._pool.shutdown(wait=True)
+            self._report(force=True)
+            self.state.close()
+
+    def stop(self, cancel=False):
+        self._stopping = True
+        self._queue.clear()
+        self._queued.clear()
+        if cancel:
+            self._cancel.set()
@@ -1,7 +1,30 @@
 import os
 import sys
+import signal
 import argparse
-import shutil
+
+from datetime import date
+
+
+SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_size(text):
+    """'512M' / '2G' / '65536' -> bytes"""
+    text = text.strip().upper().rstrip("B")
+    unit = text[-1:] if text[-1:] in SIZE_UNITS else ""
+    try:
+        return int(float(text[:len(text) - len(unit)]) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r} (e.g. 512M, 2G)")
+
+
+def parse_date(text):
+    """'2023-03-01' -> the same string, validated"""
+    try:
+        return date.fromisoformat(text).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date: {text!r} (expected YYYY-MM-DD)")
 
 
 def parse_args():
@@ -9,19 +32,152 @@ def parse_args():
     parser.add_argument(
         "mht_path",
         type=str,
-        help="Path to the input MHT file."
+        help="Path to the input MHT file (the inbox directory with --watch)."
     )
     parser.add_argument(
         "--out_dir",
         type=str,
         default=None,
-        help="Output directory. Defaults to 'out_dir/<mht_file_name>' if not specified."
+        help="Output directory. Defaults to 'out_dir/<mht_file_name>' if not specified (with --watch: the root "
+             "directory of the per-file outputs, defaulting to 'out_dir')."
+    )
+    parser.add_argument(
+        "--compact_json",
+        action="store_true",
+        help="Write qq_chat.json without indentation (smaller, faster to load)."
+    )
+    parser.add_argument(
+        "--gzip_json",
+        action="store_true",
+        help="Also write precompressed qq_chat.json.gz, sent automatically by scripts/serve.py and the GUI browser."
+    )
+    parser.add_argument(
+        "--json_lines",
+        action="store_true",
+        help="Also write 'qq_chat.jsonl' (one message per line). The viewer streams it and shows the first "
+             "messages while the rest is still downloading, instead of waiting for the whole qq_chat.json."
+    )
+    parser.add_argument(
+        "--memory_limit",
+        type=parse_size,
+        default=None,
+        help="Cap the data buffered by the export pipeline (e.g. 512M, 2G). Images beyond the budget are "
+             "spilled to a temporary file; peak usage is reported at the end."
+    )
+    parser.add_argument(
+        "--since",
+        type=parse_date,
+        default=None,
+        help="Only export messages on or after this date (YYYY-MM-DD). Days outside the range are skipped before "
+             "HTML parsing and only images referenced by the kept messages are decoded."
+    )
+    parser.add_argument(
+        "--until",
+        type=parse_date,
+        default=None,
+        help="Only export messages on or before this date (YYYY-MM-DD)."
+    )
+    parser.add_argument(
+        "--sender",
+        type=str,
+        action="append",
+        default=None,
+        help="Only export messages from this sender (repeat for several senders)."
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        default=None,
+        help="Cache parsed MHT content in this directory. Re-running on an unchanged MHT (same size, mtime and "
+             "content hash) skips MIME splitting and HTML parsing, whatever the output options."
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=parse_size,
+        default="2G",
+        help="Size cap of --cache_dir; least recently used entries are evicted beyond it. Defaults to 2G."
+    )
+    parser.add_argument(
+        "--webp_quality",
+        type=int,
+        default=None,
+        help="Transcode PNG/JPEG/static GIF images to WebP at this quality (1-100, requires Pillow). A converted "
+             "image is only kept when it is smaller; the bytes saved are reported at the end."
+    )
+    parser.add_argument(
+        "--animated_max_size",
+        type=parse_size,
+        default=None,
+        help="With --webp_quality: also transcode animated images larger than this (e.g. 1M) to animated WebP. "
+             "Animated images are left alone by default."
+    )
+    parser.add_argument(
+        "--image_layout",
+        choices=["flat", "fanout"],
+        default="flat",
+        help="'flat' (default): all images directly in 'Image'. 'fanout': spread images over hashed "
+             "subdirectories 'Image/ab/cd/<name>', for archives with millions of images. Existing outputs can be "
+             "converted with scripts/migrate_image_layout.py."
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Also write 'qq_chat_viewer.html', a single-file viewer with the chat data embedded as compressed "
+             "per-date chunks. It opens by double-click without a server; images still load from 'Image'."
+    )
+    parser.add_argument(
+        "--static_site",
+        action="store_true",
+        help="Also render pre-built per-day HTML pages into '<out_dir>/site' (no client-side JSON parsing)."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Daemon mode: keep polling the mht_path directory and convert every new or changed *.mht once it "
+             "stops growing, each into '<out_dir>/<mht_file_name>'. Converted files are recorded in a state "
+             "database, so restarts never reconvert them."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="With --watch: number of warm worker processes, i.e. conversions running at the same time. Defaults to 2."
+    )
+    parser.add_argument(
+        "--poll_interval",
+        type=float,
+        default=2.0,
+        help="With --watch: seconds between inbox scans. Defaults to 2."
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=5.0,
+        help="With --watch: seconds a file's size and mtime must stay unchanged before it is converted. Defaults to 5."
+    )
+    parser.add_argument(
+        "--state_db",
+        type=str,
+        default=None,
+        help="With --watch: SQLite state database. Defaults to '<out_dir>/watch_state.db'; queue depth and "
+             "throughput counters are written next to it ('watch_state.status.json')."
     )
     
     args = parser.parse_args()
     
+    if args.webp_quality is not None and not 1 <= args.webp_quality <= 100:
+        parser.error("--webp_quality must be between 1 and 100")
+    if args.animated_max_size is not None and args.webp_quality is None:
+        parser.error("--animated_max_size requires --webp_quality")
+    if args.watch:
+        if args.static_site:
+            parser.error("--static_site is not supported with --watch")
+        if args.workers < 1:
+            parser.error("--workers must be at least 1")
+        if args.out_dir is None:
+            args.out_dir = "out_dir"
     # Set default out_dir dynamically if not provided
-    if args.out_dir is None:
+    elif args.out_dir is None:
         mht_file_name = os.path.splitext(os.path.basename(args.mht_path))[0]
         args.out_dir = os.path.join("out_dir", mht_file_name)
     
@@ -30,28 +186,56 @@ def parse_args():
 
 if __name__ == '__main__':
     sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
-    from qq_chat_converter import export_from_mht, deduplicate_images
+    from qq_chat_converter import export_static_site, ExportOptions, ParseCache, ImageTranscoder
+    from qq_chat_converter.jobs import convert_to_dir
     args = parse_args()
-    
-    # Ensure the output directory exists
-    os.makedirs(args.out_dir, exist_ok=True)
-    
-    # Export MHT content
-    export_from_mht(
-        mht_path=args.mht_path,
-        json_out=os.path.join(args.out_dir, "qq_chat.json"),
-        html_out=os.path.join(args.out_dir, "qq_chat.html"),
-        image_dir_name="Image"  # folder name only!
+    cache = ParseCache(args.cache_dir, max_bytes=args.cache_size) if args.cache_dir else None
+    transcode = None
+    if args.webp_quality is not None:
+        transcode = ImageTranscoder(quality=args.webp_quality, animated_max_bytes=args.animated_max_size)
+    options = ExportOptions(
+        compact_json=args.compact_json,
+        gzip_json=args.gzip_json,
+        memory_limit=args.memory_limit,
+        cache=cache,
+        since=args.since,
+        until=args.until,
+        senders=args.sender,
+        transcode=transcode,
+        image_layout=args.image_layout
     )
 
-    # Deduplicate images
-    deduplicate_images(
-        image_dir=os.path.join(args.out_dir, "Image"),
-        json_file=os.path.join(args.out_dir, "qq_chat.json"),
-        json_out=os.path.join(args.out_dir, "qq_chat.json")
+    if args.watch:
+        from qq_chat_converter.watch import WatchDaemon
+        daemon = WatchDaemon(
+            args.mht_path,
+            args.out_dir,
+            workers=args.workers,
+            poll_interval=args.poll_interval,
+            settle=args.settle,
+            state_db=args.state_db,
+            options=options,
+            bundle=args.bundle,
+            json_lines=args.json_lines
+        )
+        # SIGTERM (service managers): cancel running conversions, they are retried on the next start
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop(cancel=True))
+        daemon.run()
+        sys.exit(0)
+
+    # Export MHT content, deduplicate images and copy index.html to the output directory
+    convert_to_dir(
+        args.mht_path,
+        args.out_dir,
+        options,
+        bundle=args.bundle,
+        json_lines=args.json_lines
     )
-    
-    # Copy index.html to the output directory
-    index_html_src = os.path.join(os.path.dirname(__file__), "../qq_chat_converter/index.html")
-    index_html_dst = os.path.join(args.out_dir, "index.html")
-    shutil.copy(index_html_src, index_html_dst)
\ No newline at end of file
+
+    # Render static per-day pages
+    if args.static_site:
+        export_static_site(
+            json_file=os.path.join(args.out_dir, "qq_chat.json"),
+            site_dir=os.path.join(args.out_dir, "site"),
+            image_dir=os.path.join(args.out_dir, "Image")
+        )
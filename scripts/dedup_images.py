@@ -0,0 +1,51 @@
+import os
+import sys
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Deduplicate images by content across one or many output directories."
+    )
+    parser.add_argument(
+        "paths",
+        type=str,
+        nargs="+",
+        help="Output directories (containing qq_chat.json), or parent directories such as 'out_dir' whose "
+             "subdirectories are output directories."
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["link", "canonical"],
+        default="link",
+        help="'link' (default): replace duplicates with hardlinks to one copy, file names and JSON unchanged. "
+             "'canonical': delete duplicates within an output directory and rewrite its qq_chat.json / "
+             "qq_chat.html to the kept file; duplicates across directories are still hardlinked."
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only report duplicates and the bytes that would be reclaimed; change nothing."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Hashing threads. Defaults to min(32, CPU count + 4)."
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+    from qq_chat_converter.dedup import dedupe_exports
+    args = parse_args()
+
+    report = dedupe_exports(args.paths, mode=args.mode, dry_run=args.dry_run, workers=args.workers)
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"[x] {prefix}{report['exports']} output dirs, {report['groups']} groups of identical images, "
+          f"{report['duplicates']} duplicates")
+    print(f"[x] {prefix}{'would reclaim' if args.dry_run else 'reclaimed'} "
+          f"{report['reclaimed_bytes'] / (1 << 20):.1f} MB: {report['linked']} hardlinked, "
+          f"{report['removed']} removed, {report['json_rewritten']} JSON files rewritten"
+          + (f", {report['link_errors']} hardlinks failed" if report["link_errors"] else ""))
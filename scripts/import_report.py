@@ -0,0 +1,68 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GUI_SCRIPT = os.path.join(ROOT, "GUI", "qq-chat-converter-gui.py")
+LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Report module import times (python -X importtime) for the GUI or any module."
+    )
+    parser.add_argument(
+        "target",
+        type=str,
+        nargs="?",
+        default=GUI_SCRIPT,
+        help="A module name (e.g. qq_chat_converter.server) or a *.py script whose top level is executed "
+             "without running its __main__ block. Defaults to the GUI script."
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=15,
+        help="Number of slowest top-level imports to list. Defaults to 15."
+    )
+    return parser.parse_args()
+
+
+def measure(target):
+    """在子进程中以 -X importtime 导入 target，返回 [(self_us, cumulative_us, depth, name)]。"""
+    if target.endswith(".py"):
+        code = f"import runpy; runpy.run_path({os.path.abspath(target)!r}, run_name='__import_report__')"
+    else:
+        code = f"import {target}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env={**os.environ, "PYTHONPATH": ROOT}, capture_output=True, text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = LINE_RE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    if proc.returncode != 0:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        print("\n".join(errors[-5:]))
+    return rows
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rows = measure(args.target)
+    total = sum(r[0] for r in rows)
+    print(f"[x] {args.target}: {len(rows)} modules imported, {total / 1000:.1f} ms in total")
+
+    # 只列出顶层导入（cumulative 已包含其依赖），并标出转换引擎相关的重量级依赖
+    top_level = sorted((r for r in rows if r[2] == 0), key=lambda r: r[1], reverse=True)
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for self_us, cum_us, _, name in top_level[:args.top]:
+        print(f"{cum_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}")
+
+    heavy = sorted({r[3].split(".")[0] for r in rows} & {"bs4", "lxml", "tqdm", "email", "sqlite3"})
+    print(f"[x] engine dependencies loaded at startup: {', '.join(heavy) if heavy else 'none'}")
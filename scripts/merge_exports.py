@@ -0,0 +1,71 @@
+import os
+import sys
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Merge several overlapping exports of the same chat into one output directory."
+    )
+    parser.add_argument(
+        "inputs",
+        type=str,
+        nargs="+",
+        help="Output directories (containing qq_chat.json) and/or MHT files, which are converted first."
+    )
+    parser.add_argument(
+        "--out_dir",
+        type=str,
+        required=True,
+        help="New output directory for the merged export."
+    )
+    parser.add_argument(
+        "--compact_json",
+        action="store_true",
+        help="Write qq_chat.json without indentation (smaller, faster to load)."
+    )
+    parser.add_argument(
+        "--gzip_json",
+        action="store_true",
+        help="Also write precompressed qq_chat.json.gz, sent automatically by scripts/serve.py and the GUI browser."
+    )
+    parser.add_argument(
+        "--json_lines",
+        action="store_true",
+        help="Also write 'qq_chat.jsonl' for progressive loading in the viewer."
+    )
+    parser.add_argument(
+        "--bundle",
+        action="store_true",
+        help="Also write the single-file viewer 'qq_chat_viewer.html'."
+    )
+    parser.add_argument(
+        "--image_layout",
+        choices=["flat", "fanout"],
+        default="flat",
+        help="Layout of the merged 'Image' directory: 'flat' (default) or hashed subdirectories 'Image/ab/cd/<name>'."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Image hashing threads. Defaults to min(32, CPU count + 4)."
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+    from qq_chat_converter.merge import merge_exports
+    args = parse_args()
+
+    merge_exports(
+        args.inputs,
+        args.out_dir,
+        compact_json=args.compact_json,
+        gzip_json=args.gzip_json,
+        json_lines=args.json_lines,
+        bundle=args.bundle,
+        image_layout=args.image_layout,
+        workers=args.workers
+    )
@@ -0,0 +1,43 @@
+import os
+import sys
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Convert the 'Image' directory of existing output directories between the flat and the "
+                    "hashed fan-out layout."
+    )
+    parser.add_argument(
+        "paths",
+        type=str,
+        nargs="+",
+        help="Output directories (containing qq_chat.json), or parent directories such as 'out_dir' whose "
+             "subdirectories are output directories."
+    )
+    parser.add_argument(
+        "--to",
+        choices=["fanout", "flat"],
+        default="fanout",
+        help="Target layout: 'fanout' (default) moves images to 'Image/ab/cd/<name>', 'flat' moves them back "
+             "directly under 'Image'. qq_chat.json (with its .gz, .jsonl and version files), qq_chat.html, the "
+             "single-file viewer and the static site are rewritten to match."
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only report how many images would be moved; change nothing."
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+    from qq_chat_converter.layout import migrate_image_layout
+    args = parse_args()
+
+    report = migrate_image_layout(args.paths, layout=args.to, dry_run=args.dry_run)
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"[x] {prefix}{report['exports']} output dirs, {report['moved']} images "
+          f"{'to move' if args.dry_run else 'moved'} to the {args.to} layout, "
+          f"{report['json_rewritten']} JSON files rewritten")
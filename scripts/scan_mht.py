@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Pre-scan MHT files (date range, message/image counts) without converting them."
+    )
+    parser.add_argument(
+        "mht_paths",
+        type=str,
+        nargs="+",
+        help="Paths to the MHT files to scan."
+    )
+    parser.add_argument(
+        "--no_index",
+        action="store_true",
+        help="Do not write the '<name>.parts.json' part-offset sidecar that a later conversion reuses to skip "
+             "re-scanning the file."
+    )
+    return parser.parse_args()
+
+
+def format_summary(summary):
+    dates = f"{summary['first_date']} ~ {summary['last_date']}" if summary["first_date"] else "no dates"
+    return (f"{os.path.basename(summary['mht_path'])}: {summary['size'] / (1 << 20):.1f} MB, {dates} "
+            f"({summary['days']} days), ~{summary['messages']} messages, {summary['images']} images "
+            f"({summary['image_bytes'] / (1 << 20):.1f} MB), scanned in {summary['elapsed']:.2f}s")
+
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+    from qq_chat_converter import scan_mht
+    args = parse_args()
+
+    for mht_path in args.mht_paths:
+        summary = scan_mht(mht_path, write_index=not args.no_index)
+        print(f"[x] {format_summary(summary)}")
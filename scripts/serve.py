@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve an exported chat directory for the local viewer.")
+    parser.add_argument(
+        "out_dir",
+        type=str,
+        help="Exported output directory (the one containing index.html and qq_chat.json)."
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8000,
+        help="Port to listen on. Defaults to 8000."
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="localhost",
+        help="Interface to bind. Defaults to 'localhost'."
+    )
+    parser.add_argument(
+        "--api",
+        action="store_true",
+        help="Also answer paged /api/dates, /api/messages, /api/search and /api/context queries "
+             "from an on-disk index (qq_chat.archive.*), so the viewer never downloads the whole JSON."
+    )
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+    from qq_chat_converter.server import serve_viewer
+    args = parse_args()
+
+    serve_viewer(args.out_dir, port=args.port, host=args.host, api=args.api)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../"))
+
+from qq_chat_converter.py_funcs import write_json_list, write_export_version  # noqa: E402
+
+
+def _record(sender, date, time, text, images=()):
+    images = list(images)
+    return {"sender": sender, "date": date, "time": time, "text": text,
+            "images": images, "image": images[0] if images else None, "forwarded": None}
+
+
+def _write_export(export_dir, records, images):
+    """最小的导出目录：qq_chat.json（含版本文件）与图片目录；images 为 {相对图片目录的路径: 内容}"""
+    for rel, data in images.items():
+        path = os.path.join(export_dir, "Image", *rel.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    json_file = os.path.join(export_dir, "qq_chat.json")
+    os.makedirs(export_dir, exist_ok=True)
+    write_export_version(json_file, write_json_list(records, json_file), len(records))
+    return json_file
+
+
+@pytest.fixture
+def record():
+    return _record
+
+
+@pytest.fixture
+def make_export(tmp_path):
+    def make(name, records, images):
+        return _write_export(str(tmp_path / name), records, images)
+    return make
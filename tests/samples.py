@@ -0,0 +1,64 @@
+import os
+import base64
+
+
+BOUNDARY = "----=_NextPart_01D9_TEST"
+
+# (GUID, 图片类型, 内容)：MHT 中以 <guid>.dat 引用
+IMAGES = [("{AAAA0001}", "png", os.urandom(300)), ("{AAAA0002}", "jpeg", os.urandom(5000)),
+          ("{AAAA0003}", "gif", b"GIF89a" + os.urandom(40))]
+
+
+def date_row(date):
+    return f'<tr><td style="border-bottom-width:1px">日期: {date}</td></tr>'
+
+
+def message_row(sender, time, body):
+    return (f'<tr><td><div style=color:#42B475;padding-left:10px;><div style=float:left;margin-right:6px;>{sender}'
+            f'</div>{time}</div><div style=padding-left:20px;>{body}</div></td></tr>')
+
+
+def page(rows):
+    return "<html><head><meta charset=utf-8></head><body><table>" + "\n".join(rows) + "</table></body></html>"
+
+
+# 三天、三位发送者；{AAAA0001} 在第一天与第三天都被引用
+CHAT_ROWS = [
+    date_row("2023-03-01"),
+    message_row("甲", "8:00:00", "<font>你好 &lt;world&gt;</font>"),
+    message_row("乙", "8:00:05", '<font>看图</font><img src="{AAAA0001}.dat"><img src="{AAAA0002}.dat">'),
+    date_row("2023-03-02"),
+    message_row("甲", "9:30:00", '<img src="{AAAA0003}.dat">'),
+    message_row("丙", "9:31:00", "<font>收到</font>"),
+    date_row("2023-03-03"),
+    message_row("乙", "10:00:00", '<font>再发一次</font><img src="{AAAA0001}.dat">'),
+    message_row("甲", "10:01:00", "<font>好的</font>"),
+]
+
+
+def write_mht(path, html, images=IMAGES, newline="\n"):
+    """QQ 导出格式的 MHT：第一部分为 HTML，之后每张图片一个 base64 部分"""
+    with open(path, "w", encoding="utf-8", newline=newline) as f:
+        f.write(f'MIME-Version: 1.0\nContent-Type:multipart/related;\n\tcharset="utf-8"\n\ttype="text/html";\n'
+                f'\tboundary="{BOUNDARY}"\n\n')
+        f.write(f"--{BOUNDARY}\nContent-Type:text/html\nContent-Transfer-Encoding:7bit\n\n{html}\n\n")
+        for guid, ext, data in images:
+            f.write(f"--{BOUNDARY}\nContent-Type:image/{ext}\nContent-Transfer-Encoding:base64\n"
+                    f"Content-Location:{guid}.dat\n\n{base64.encodebytes(data).decode()}\n")
+        f.write(f"--{BOUNDARY}--\n")
+    return path
+
+
+def write_chat_mht(path, newline="\n"):
+    return write_mht(path, page(CHAT_ROWS), newline=newline)
+
+
+def read_tree(root):
+    """目录下全部文件的 {相对路径: 内容}"""
+    files = {}
+    for dir_path, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dir_path, name)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, root).replace(os.sep, "/")] = f.read()
+    return files
@@ -0,0 +1,53 @@
+import pytest
+
+from qq_chat_converter import analytics
+from qq_chat_converter.analytics import compute_stats, time_seconds
+
+
+RECORDS = [
+    {"sender": "甲", "date": "2023-03-06", "time": "8:00:00", "text": "早上好", "images": ["a.png"], "forwarded": None},
+    {"sender": "乙", "date": "2023-03-06", "time": "23:59:59", "text": "晚安", "images": None,
+     "forwarded": [{"sender": "丙", "text": "转发", "images": ["b.png", "c.png"]}]},
+    {"sender": "甲", "date": "2023-03-12", "time": "8:30:00", "text": "", "images": [], "forwarded": None},
+    {"sender": None, "date": None, "time": "bad", "text": "系统消息", "images": None, "forwarded": None},
+    "结构异常的记录",
+]
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(analytics, "np", None)
+    return request.param
+
+
+def test_time_seconds():
+    assert time_seconds("8:05:35") == 8 * 3600 + 5 * 60 + 35
+    assert time_seconds("24:00:00") == -1
+    assert time_seconds("bad") == -1 and time_seconds(None) == -1
+
+
+def test_chat_stats(backend):
+    stats = compute_stats(RECORDS)
+    assert stats["count"] == 5
+    assert (stats["first_date"], stats["last_date"], stats["days"]) == ("2023-03-06", "2023-03-12", 2)
+    assert stats["senders"] == [
+        {"sender": "甲", "messages": 2, "images": 1, "chars": 3},
+        {"sender": None, "messages": 2, "images": 0, "chars": 4},
+        {"sender": "乙", "messages": 1, "images": 2, "chars": 2},
+    ]
+    assert stats["daily"] == {"2023-03-06": 2, "2023-03-12": 1}
+    assert stats["images"] == 3 and stats["chars"] == 9
+    assert stats["hours"][8] == 2 and stats["hours"][23] == 1 and sum(stats["hours"]) == 3
+    # 2023-03-06 是周一，2023-03-12 是周日
+    assert stats["weekdays"] == [2, 0, 0, 0, 0, 0, 1]
+    assert stats["heatmap"][0][8] == 1 and stats["heatmap"][0][23] == 1 and stats["heatmap"][6][8] == 1
+
+
+def test_backends_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    with_numpy = compute_stats(RECORDS)
+    monkeypatch.setattr(analytics, "np", None)
+    assert compute_stats(RECORDS) == with_numpy
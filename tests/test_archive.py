@@ -0,0 +1,99 @@
+import os
+import json
+import datetime
+
+import pytest
+
+from qq_chat_converter.archive import ChatArchive
+from qq_chat_converter.py_funcs import iter_json_array_spans
+
+
+def msg(sender, date, time, text, forwarded=None):
+    return {"sender": sender, "date": date, "time": time, "text": text, "images": None, "image": None,
+            "forwarded": forwarded}
+
+
+RECORDS = [
+    msg("甲", "2023-03-01", "8:00:00", "早上好"),
+    msg("乙", "2023-03-01", "8:00:05", 'He said "Hi"\n第二行'),
+    msg("甲", "2023-03-02", "23:59:59", "晚安"),
+    msg("丙", None, None, "没有日期"),
+    msg("乙", "2023-03-01", "21:00:00", "补录的消息", forwarded=[
+        {"sender": "丁", "time": "7:00:00", "text": "转发的原文", "images": None, "image": None}]),
+    msg("甲", "2023-03-03", "0:00:00", "新的一天"),
+]
+
+
+def _write(path, records, newline="\n", indent=2):
+    with open(path, "w", encoding="utf-8", newline=newline) as f:
+        json.dump(records, f, ensure_ascii=False, indent=indent)
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    root = tmp_path_factory.mktemp("archive")
+    _write(str(root / "qq_chat.json"), RECORDS, newline="\r\n")
+    with ChatArchive(str(root)) as archive:
+        yield archive
+
+
+@pytest.mark.parametrize("block", [5, 1 << 20])
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_spans_are_byte_offsets(tmp_path, block, newline):
+    path = str(tmp_path / "qq_chat.json")
+    _write(path, RECORDS + [12345, "尾"], newline=newline)
+    with open(path, "rb") as f:
+        raw = f.read()
+    items = []
+    for start, end, item in iter_json_array_spans(path, block=block, encoding="latin-1"):
+        items.append(json.loads(raw[start:end]))
+    assert items == RECORDS + [12345, "尾"]
+
+
+class TestChatArchive:
+    def test_random_access(self, archive):
+        assert len(archive) == len(RECORDS)
+        assert [archive[i] for i in range(len(archive))] == RECORDS
+        with pytest.raises(IndexError):
+            archive[len(RECORDS)]
+
+    def test_iter_range_is_in_time_order(self, archive):
+        assert [i for i, _ in archive.iter_range("2023-03-01", "2023-03-01")] == [0, 1, 4]
+        assert [i for i, _ in archive.iter_range("2023-03-02")] == [2, 5]
+        assert [i for i, _ in archive.iter_range()] == [0, 1, 4, 2, 5]  # 没有日期的记录不会出现
+
+    def test_iter_range_with_datetimes(self, archive):
+        ids = [i for i, _ in archive.iter_range(datetime.datetime(2023, 3, 1, 8, 0, 5), "2023-03-02T23:59:59")]
+        assert ids == [1, 4, 2]
+        assert list(archive.iter_range(datetime.date(2023, 3, 4))) == []
+
+    def test_by_sender(self, archive):
+        assert archive.senders == sorted({"甲", "乙", "丙"})
+        assert [(i, r["text"]) for i, r in archive.by_sender("乙")] == [(1, 'He said "Hi"\n第二行'), (4, "补录的消息")]
+        assert list(archive.by_sender("丁")) == []  # 转发消息中的发送者不单独建索引
+
+    @pytest.mark.parametrize("keyword, ids", [
+        ("晚安", [2]),
+        ("甲", [0, 2, 5]),
+        ("转发的原文", [4]),
+        ('"Hi"\n第二', [1]),
+        ("2023-03-01", []),  # 只匹配发送者与正文
+        ("不存在", []),
+    ])
+    def test_search(self, archive, keyword, ids):
+        assert [i for i, _ in archive.search(keyword)] == ids
+
+    def test_dates_are_runs(self, archive):
+        assert archive.dates == {"2023-03-01": [[0, 2], [4, 5]], "2023-03-02": [[2, 3]], "2023-03-03": [[5, 6]]}
+
+
+def test_index_is_rebuilt_when_json_changes(tmp_path):
+    json_file = str(tmp_path / "qq_chat.json")
+    _write(json_file, RECORDS[:2])
+    with ChatArchive(json_file) as archive:
+        assert len(archive) == 2
+    _write(json_file, RECORDS, indent=None)
+    st = os.stat(json_file)
+    os.utime(json_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    with ChatArchive(json_file) as archive:
+        assert len(archive) == len(RECORDS) and archive[5] == RECORDS[5]
@@ -0,0 +1,75 @@
+import os
+import re
+import gzip
+import json
+import base64
+
+import pytest
+
+from qq_chat_converter.bundle import write_viewer_bundle
+from qq_chat_converter.py_funcs import embed_json_in_html, iter_json_array, write_json_list
+
+
+RECORDS = [{"sender": "甲", "date": f"2023-03-0{1 + i // 4}", "time": f"8:00:0{i % 10}",
+            "text": f"消息 {i} </script> \"引号\"", "images": None, "n": i * 1.5} for i in range(10)]
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("block", [1, 7, 1 << 20])
+def test_iter_json_array(tmp_path, compact, block):
+    json_file = str(tmp_path / "qq_chat.json")
+    write_json_list(RECORDS + [12345, "尾"], json_file, compact=compact)
+    assert list(iter_json_array(json_file, block=block)) == RECORDS + [12345, "尾"]
+
+
+def test_iter_json_array_empty(tmp_path):
+    json_file = tmp_path / "qq_chat.json"
+    json_file.write_text(" [ ] ", encoding="utf-8")
+    assert list(iter_json_array(str(json_file))) == []
+    json_file.write_text('{"messages": []}', encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        list(iter_json_array(str(json_file)))
+
+
+def test_viewer_bundle_chunks(tmp_path):
+    json_file = str(tmp_path / "qq_chat.json")
+    write_json_list(RECORDS, json_file)
+    template = tmp_path / "index.html"
+    template.write_text("<html><body><p>viewer</p></body></html>", encoding="utf-8")
+
+    bundle = write_viewer_bundle(json_file, str(tmp_path / "qq_chat_viewer.html"), template=str(template),
+                                 chunk_bytes=200)
+    with open(bundle, encoding="utf-8") as f:
+        page = f.read()
+    assert page.startswith("<html><body><p>viewer</p>") and page.endswith("</body></html>")
+    scripts = dict(re.findall(r'<script type="[^"]*" id="([^"]*)">(.*?)</script>', page))
+    manifest = json.loads(scripts["qqcc-bundle"].replace("<\\/", "</"))
+    assert manifest["count"] == len(RECORDS)
+    assert manifest["dates"] == {"2023-03-01": [[0, 4]], "2023-03-02": [[4, 8]], "2023-03-03": [[8, 10]]}
+    assert len(manifest["chunks"]) > 1
+
+    records = []
+    for i, (first, count, raw, packed) in enumerate(manifest["chunks"]):
+        data = base64.b64decode(scripts[f"qqcc-chunk-{i}"])
+        assert len(data) == packed and first == len(records)
+        chunk = gzip.decompress(data)
+        assert len(chunk) == raw
+        records.extend(json.loads(chunk))
+        assert len(records) == first + count
+    assert records == RECORDS
+    assert manifest["stats"]["count"] == len(RECORDS)
+
+
+@pytest.mark.parametrize("template, expected", [
+    ("<html><head><title>t</title></head><body></body></html>",
+     '<html><head><title>t</title><script>const embeddedChatData = {data};</script>\n</head><body></body></html>'),
+    ("<body></body>", '<script>const embeddedChatData = {data};</script>\n<body></body>'),
+])
+def test_embed_json_in_html_keeps_the_page(tmp_path, template, expected):
+    data = '[{"sender":"甲","text":"你好"}]'
+    (tmp_path / "qq_chat.json").write_text(data, encoding="utf-8")
+    html = tmp_path / "qq_chat.html"
+    html.write_text(template, encoding="utf-8")
+    embed_json_in_html(str(tmp_path / "qq_chat.json"), str(html))
+    assert html.read_text(encoding="utf-8") == expected.replace("{data}", data)
+    assert not os.path.exists(str(html) + ".tmp")
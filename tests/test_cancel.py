@@ -0,0 +1,49 @@
+import os
+import time
+import threading
+
+import pytest
+
+from qq_chat_converter.py_funcs import ConversionCancelled, export_from_mht
+from samples import read_tree, write_chat_mht
+
+
+def _export(mht, out_dir, **kwargs):
+    export_from_mht(mht, os.path.join(out_dir, "qq_chat.json"), os.path.join(out_dir, "qq_chat.html"), "Image",
+                    **kwargs)
+
+
+def _cancel_at(stage):
+    cancel = threading.Event()
+
+    def progress(event):
+        if event.stage == stage and not cancel.is_set():
+            cancel.set()
+            time.sleep(0.15)  # 取消检查按 0.1 秒节流，等到下一次检查时生效
+    return cancel, progress
+
+
+@pytest.fixture
+def mht(tmp_path):
+    return write_chat_mht(str(tmp_path / "chat.mht"))
+
+
+@pytest.mark.parametrize("stage", ["images", "messages"])
+def test_cancel_new_export_leaves_nothing(mht, tmp_path, stage):
+    out_dir = str(tmp_path / "out")
+    cancel, progress = _cancel_at(stage)
+    with pytest.raises(ConversionCancelled):
+        _export(mht, out_dir, progress=progress, cancel=cancel)
+    assert read_tree(out_dir) == {}
+
+
+@pytest.mark.parametrize("stage", ["images", "messages"])
+def test_cancel_re_export_keeps_previous_output(mht, tmp_path, stage):
+    out_dir = str(tmp_path / "out")
+    _export(mht, out_dir, progress=lambda e: None)
+    before = read_tree(out_dir)
+
+    cancel, progress = _cancel_at(stage)
+    with pytest.raises(ConversionCancelled):
+        _export(mht, out_dir, progress=progress, cancel=cancel)
+    assert read_tree(out_dir) == before
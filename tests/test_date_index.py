@@ -0,0 +1,16 @@
+from qq_chat_converter.py_funcs import DateIndex, build_date_index
+
+
+def test_sorted_dates_have_one_run_each():
+    records = [{"date": "2023-03-01"}, {"date": "2023-03-01"}, None, {"date": "2023-03-02"}]
+    assert build_date_index(records) == {"count": 4, "dates": {"2023-03-01": [[0, 2]], "2023-03-02": [[3, 4]]}}
+
+
+def test_repeated_date_does_not_cover_other_dates():
+    index = DateIndex()
+    for date in ["2023-03-01", "2023-03-02", "2023-03-01", "2023-03-01", None, "2023-03-01"]:
+        index.add(date)
+    assert index.result() == {
+        "count": 6,
+        "dates": {"2023-03-01": [[0, 1], [2, 4], [5, 6]], "2023-03-02": [[1, 2]]},
+    }
@@ -0,0 +1,48 @@
+import os
+import re
+import json
+
+from qq_chat_converter.dedup import dedupe_exports
+from qq_chat_converter.static_site import export_static_site
+
+
+IMG_SRC_RE = re.compile(r'<img\b[^>]*?\bsrc="([^"]*)"')
+
+
+def _site_img_srcs(site_dir):
+    for name in sorted(os.listdir(site_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(site_dir, name), encoding="utf-8") as f:
+                for src in IMG_SRC_RE.findall(f.read()):
+                    yield os.path.normpath(os.path.join(site_dir, src))
+
+
+def test_canonical_dedup_rebuilds_static_site(make_export, record):
+    images = {"a.png": b"same", "b.png": b"same", "c.png": b"other", "d.png": b"same"}
+    records = [record("甲", "2023-03-01", "8:00:00", "一", ["a.png", "c.png"]),
+               record("乙", "2023-03-01", "8:00:05", "二", ["b.png"]),
+               record("甲", "2023-03-02", "9:00:00", "三", ["d.png"])]
+    json_file = make_export("out", records, images)
+    export_dir = os.path.dirname(json_file)
+    site_dir = os.path.join(export_dir, "site")
+    export_static_site(json_file, site_dir)
+    assert len(list(_site_img_srcs(site_dir))) == 4
+
+    report = dedupe_exports([export_dir], mode="canonical", progress=lambda e: None)
+    assert report["removed"] == 2
+    assert sorted(os.listdir(os.path.join(export_dir, "Image"))) == ["a.png", "c.png"]
+    with open(json_file, encoding="utf-8") as f:
+        assert [r["images"] for r in json.load(f)] == [["a.png", "c.png"], ["a.png"], ["a.png"]]
+    srcs = list(_site_img_srcs(site_dir))
+    assert len(srcs) == 4
+    assert all(os.path.isfile(src) for src in srcs)
+
+
+def test_link_mode_keeps_names(make_export, record):
+    images = {"a.png": b"same", "b.png": b"same"}
+    json_file = make_export("out", [record("甲", "2023-03-01", "8:00:00", "一", ["a.png", "b.png"])], images)
+    image_dir = os.path.join(os.path.dirname(json_file), "Image")
+
+    report = dedupe_exports([os.path.dirname(json_file)], mode="link", progress=lambda e: None)
+    assert report["linked"] == 1 and report["reclaimed_bytes"] == 4
+    assert os.path.samefile(os.path.join(image_dir, "a.png"), os.path.join(image_dir, "b.png"))
@@ -0,0 +1,42 @@
+import os
+import pickle
+import datetime
+
+import pytest
+
+from qq_chat_converter.jobs import convert_to_dir
+from qq_chat_converter.parse_cache import ParseCache
+from qq_chat_converter.py_funcs import ExportOptions, export_from_mht
+from samples import read_tree, write_chat_mht
+
+
+def test_options_are_normalised(tmp_path):
+    options = ExportOptions(cache=str(tmp_path / "cache"), since=datetime.date(2023, 3, 2), senders=["甲", "甲"])
+    assert isinstance(options.cache, ParseCache)
+    assert (options.since, options.until, options.senders) == ("2023-03-02", None, {"甲"})
+    assert options.partial and not ExportOptions().partial
+    assert pickle.loads(pickle.dumps(options)).senders == {"甲"}  # 传给工作进程
+
+
+def test_unknown_layout_is_rejected():
+    with pytest.raises(ValueError):
+        ExportOptions(image_layout="nested")
+
+
+def test_options_object_matches_keywords(tmp_path):
+    mht = write_chat_mht(str(tmp_path / "chat.mht"))
+    trees = []
+    for name, kwargs in (("kw", {"compact_json": True, "until": "2023-03-02"}),
+                         ("obj", {"options": ExportOptions(compact_json=True, until="2023-03-02")})):
+        out_dir = str(tmp_path / name)
+        export_from_mht(mht, os.path.join(out_dir, "qq_chat.json"), os.path.join(out_dir, "qq_chat.html"), "Image",
+                        progress=lambda e: None, **kwargs)
+        trees.append(read_tree(out_dir))
+    assert trees[0] == trees[1]
+
+
+def test_options_and_keywords_are_exclusive(tmp_path):
+    mht = write_chat_mht(str(tmp_path / "chat.mht"))
+    with pytest.raises(TypeError):
+        convert_to_dir(mht, str(tmp_path / "out"), ExportOptions(), compact_json=True)
+    assert not os.path.exists(str(tmp_path / "out"))
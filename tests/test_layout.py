@@ -0,0 +1,98 @@
+import os
+import json
+
+import pytest
+
+from qq_chat_converter import layout
+from qq_chat_converter.layout import migrate_image_layout
+from qq_chat_converter.py_funcs import image_rel_path, list_image_files
+
+
+IMAGES = {"a.png": b"png-a", "b.jpg": b"jpg-b", "c.gif": b"gif-c"}
+
+
+@pytest.fixture
+def export(make_export, record):
+    records = [record("甲", "2023-03-01", "8:00:00", "一", ["a.png", "b.jpg"]),
+               record("乙", "2023-03-01", "8:00:05", "二", ["c.gif"]),
+               record("甲", "2023-03-02", "9:00:00", "三")]
+    return os.path.dirname(make_export("out", records, IMAGES))
+
+
+def _image_paths(export_dir):
+    with open(os.path.join(export_dir, "qq_chat.json"), encoding="utf-8") as f:
+        return [p for r in json.load(f) for p in r["images"]]
+
+
+def _assert_layout(export_dir, layout_name):
+    image_dir = os.path.join(export_dir, "Image")
+    expected = sorted(image_rel_path(name, layout_name) for name in IMAGES)
+    assert sorted(list_image_files(image_dir)) == expected
+    assert sorted(set(_image_paths(export_dir))) == expected
+    for rel in expected:
+        with open(os.path.join(image_dir, *rel.split("/")), "rb") as f:
+            assert f.read() == IMAGES[rel.rsplit("/", 1)[-1]]
+
+
+def test_migrate_round_trip(export):
+    with open(os.path.join(export, "qq_chat.json"), "rb") as f:
+        original = f.read()
+    report = migrate_image_layout([export], "fanout", progress=lambda e: None)
+    assert report["moved"] == len(IMAGES)
+    _assert_layout(export, "fanout")
+
+    migrate_image_layout([export], "flat", progress=lambda e: None)
+    _assert_layout(export, "flat")
+    with open(os.path.join(export, "qq_chat.json"), "rb") as f:
+        assert f.read() == original
+
+
+def test_migrate_resumes_after_interrupted_link_step(export, monkeypatch):
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(layout, "rewrite_export_json", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        migrate_image_layout([export], "fanout", progress=lambda e: None)
+    monkeypatch.undo()
+    # 新位置的硬链接已经建立，旧路径与 JSON 都还没有变
+    assert len(list_image_files(os.path.join(export, "Image"))) == 2 * len(IMAGES)
+    assert sorted(set(_image_paths(export))) == sorted(IMAGES)
+
+    report = migrate_image_layout([export], "fanout", progress=lambda e: None)
+    assert report["records_rewritten"] == 2
+    _assert_layout(export, "fanout")
+
+
+def test_migrate_rejects_different_files_with_same_name(export):
+    image_dir = os.path.join(export, "Image")
+    os.makedirs(os.path.join(image_dir, "sub"))
+    with open(os.path.join(image_dir, "sub", "a.png"), "wb") as f:
+        f.write(b"another a")
+    with pytest.raises(RuntimeError):
+        migrate_image_layout([export], "fanout", progress=lambda e: None)
+    assert sorted(set(_image_paths(export))) == sorted(IMAGES)
+
+
+@pytest.mark.parametrize("stage", ["rewrite_export_json", "refresh_viewer_pages"])
+def test_migrate_without_hardlinks_resumes_after_interruption(export, monkeypatch, stage):
+    def no_link(src, dst):
+        raise OSError("硬链接不可用")
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(os, "link", no_link)
+    with monkeypatch.context() as m:
+        m.setattr(layout, stage, interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            migrate_image_layout([export], "fanout", progress=lambda e: None)
+
+    # 无论中断在 JSON 写回之前还是之后，JSON 指向的图片都完整存在
+    image_dir = os.path.join(export, "Image")
+    for rel in _image_paths(export):
+        with open(os.path.join(image_dir, *rel.split("/")), "rb") as f:
+            assert f.read() == IMAGES[rel.rsplit("/", 1)[-1]]
+
+    migrate_image_layout([export], "fanout", progress=lambda e: None)
+    _assert_layout(export, "fanout")
@@ -0,0 +1,68 @@
+import os
+import json
+
+import pytest
+
+from qq_chat_converter.merge import merge_exports
+
+
+def _load(json_file):
+    with open(json_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _image_bytes(export_dir, records):
+    result = []
+    for r in records:
+        for p in r["images"]:
+            with open(os.path.join(export_dir, "Image", *p.split("/")), "rb") as f:
+                result.append(f.read())
+    return result
+
+
+@pytest.fixture
+def overlapping(make_export, record):
+    """两份重叠的导出：第二份仍是去重前的 Image/ 前缀路径，同一张图片文件名不同，另有同名不同内容的图片"""
+    first = make_export("first", [
+        record("甲", "2023-03-01", "8:00:00", "早"),
+        record("乙", "2023-03-01", "8:00:05", "图", ["a.png"]),
+        record("甲", "2023-03-01", "8:00:05", "图", ["a.png"]),
+        record("乙", "2023-03-02", "9:00:00", "重复"),
+        record("乙", "2023-03-02", "9:00:00", "重复"),
+    ], {"a.png": b"image a"})
+    second = make_export("second", [
+        record("乙", "2023-03-01", "8:00:05", "图", ["Image/copy_of_a.png"]),
+        record("甲", "2023-03-01", "8:00:05", "图", ["Image/copy_of_a.png"]),
+        record("乙", "2023-03-02", "9:00:00", "重复"),
+        record("乙", "2023-03-02", "9:00:00", "重复"),
+        record("甲", "2023-03-03", "10:00:00", "晚", ["Image/a.png"]),
+    ], {"copy_of_a.png": b"image a", "a.png": b"another image"})
+    return os.path.dirname(first), os.path.dirname(second)
+
+
+@pytest.mark.parametrize("layout", ["flat", "fanout"])
+def test_merge_overlapping_exports(overlapping, tmp_path, layout):
+    out_dir = str(tmp_path / "merged")
+    report = merge_exports(overlapping, out_dir, image_layout=layout, progress=lambda e: None)
+
+    records = _load(os.path.join(out_dir, "qq_chat.json"))
+    assert [(r["date"], r["time"], r["text"]) for r in records] == [
+        ("2023-03-01", "8:00:00", "早"),
+        ("2023-03-01", "8:00:05", "图"),
+        ("2023-03-01", "8:00:05", "图"),
+        ("2023-03-02", "9:00:00", "重复"),
+        ("2023-03-02", "9:00:00", "重复"),
+        ("2023-03-03", "10:00:00", "晚"),
+    ]
+    assert report["records_in"] == 10 and report["records_out"] == 6 and report["duplicates"] == 4
+    assert report["images"] == 2
+    assert _image_bytes(out_dir, records) == [b"image a", b"image a", b"another image"]
+
+    index = _load(os.path.join(out_dir, "qq_chat.index.json"))
+    assert index["count"] == 6 and index["dates"]["2023-03-03"] == [[5, 6]]
+    assert _load(os.path.join(out_dir, "qq_chat.version.json"))["count"] == 6
+
+
+def test_merge_refuses_existing_export(overlapping):
+    with pytest.raises(FileExistsError):
+        merge_exports(overlapping, overlapping[0], progress=lambda e: None)
@@ -0,0 +1,49 @@
+import os
+import json
+
+import pytest
+
+from qq_chat_converter.py_funcs import export_from_mht, iter_mht_parts, read_mht_span, list_image_files
+from samples import IMAGES, date_row, message_row, page, write_mht
+
+
+ROWS = [date_row("2023-03-01"),
+        message_row("甲", "8:00:00", "<font>你好 &lt;world&gt;</font>"),
+        message_row("乙", "8:00:05", '<font>看图</font><img src="{AAAA0001}.dat"><img src="{AAAA0002}.dat">'),
+        date_row("2023-03-02"),
+        message_row("甲", "9:30:00", '<img src="{AAAA0003}.dat">')]
+
+
+@pytest.fixture(params=["\n", "\r\n"], ids=["lf", "crlf"])
+def mht(tmp_path, request):
+    return write_mht(str(tmp_path / "chat.mht"), page(ROWS), newline=request.param)
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1 << 22])
+def test_iter_mht_parts_across_chunk_boundaries(mht, chunk_size):
+    parts = list(iter_mht_parts(mht, chunk_size=chunk_size, with_offsets=True))
+    assert [h.get_content_type() for h, _, _ in parts] == ["text/html", "image/png", "image/jpeg", "image/gif"]
+    assert parts[0][1].decode("utf-8").replace("\r\n", "\n").strip() == page(ROWS)
+    assert [data for _, data, _ in parts[1:]] == [data for _, _, data in IMAGES]
+    with open(mht, "rb") as f:
+        for _, data, span in parts:
+            assert read_mht_span(f, span) == data
+
+
+@pytest.mark.parametrize("layout", ["flat", "fanout"])
+def test_export_from_mht(mht, tmp_path, layout):
+    out = tmp_path / "out"
+    json_file = str(out / "qq_chat.json")
+    export_from_mht(mht, json_file, str(out / "qq_chat.html"), "Image", progress=lambda e: None,
+                    image_layout=layout)
+
+    with open(json_file, encoding="utf-8") as f:
+        records = json.load(f)
+    assert [(r["sender"], r["date"], r["time"]) for r in records] == [
+        ("甲", "2023-03-01", "8:00:00"), ("乙", "2023-03-01", "8:00:05"), ("甲", "2023-03-02", "9:30:00")]
+    assert records[0]["text"] == "你好 <world>"
+    images = [p for r in records for p in r["images"] or ()]
+    assert len(images) == 3 == len(list_image_files(str(out / "Image")))
+    for path, (_, _, data) in zip(images, IMAGES):
+        with open(os.path.join(str(out), *path.split("/")), "rb") as f:
+            assert f.read() == data
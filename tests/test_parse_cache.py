@@ -0,0 +1,72 @@
+import os
+import time
+
+import pytest
+
+from qq_chat_converter import py_funcs
+from qq_chat_converter.parse_cache import ParseCache, source_key
+from qq_chat_converter.py_funcs import export_from_mht
+from samples import read_tree, write_chat_mht
+
+
+def _export(mht, out_dir, **options):
+    export_from_mht(mht, os.path.join(out_dir, "qq_chat.json"), os.path.join(out_dir, "qq_chat.html"), "Image",
+                    progress=lambda e: None, **options)
+    return read_tree(out_dir)
+
+
+@pytest.fixture
+def mht(tmp_path):
+    return write_chat_mht(str(tmp_path / "chat.mht"))
+
+
+def test_cache_hit_matches_cold_export(mht, tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path / "cache"))
+    cold = _export(mht, str(tmp_path / "cold"))
+    miss = _export(mht, str(tmp_path / "miss"), cache=cache)
+    assert [key for _, _, key in cache.entries()] == [source_key(mht)]
+
+    def parse(*args, **kwargs):
+        raise AssertionError("命中缓存时不应解析 HTML")
+
+    monkeypatch.setattr(py_funcs, "BeautifulSoup", parse)
+    hit = _export(mht, str(tmp_path / "hit"), cache=cache)
+    assert cold == miss == hit
+
+
+def test_changed_mht_misses(mht, tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    _export(mht, str(tmp_path / "a"), cache=cache)
+    key = source_key(mht)
+    with open(mht, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert source_key(mht) != key
+    assert cache.get(source_key(mht)) is None
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    for name in ("old", "new"):
+        staging = cache.begin(name)
+        with open(staging.records_path, "wb") as f:
+            f.write(b"x" * 1000)
+        staging.commit({})
+        time.sleep(0.01)
+    os.utime(os.path.join(cache.cache_dir, "old", "meta.json"), (1, 1))
+    cache.max_bytes = 1500
+    cache.evict()
+    assert [key for _, _, key in cache.entries()] == ["new"]
+
+
+def test_evict_ignores_vanishing_staging_dirs(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path / "cache"))
+    os.makedirs(os.path.join(cache.cache_dir, ".tmp-0123456789abcdef"))
+    getmtime = os.path.getmtime
+
+    def vanished(path):
+        if ".tmp-" in path:
+            raise FileNotFoundError(path)  # 另一个转换在 listdir 之后换入了它的暂存目录
+        return getmtime(path)
+
+    monkeypatch.setattr(os.path, "getmtime", vanished)
+    cache.evict()
@@ -0,0 +1,64 @@
+import os
+import json
+import datetime
+
+import pytest
+
+from qq_chat_converter.parse_cache import ParseCache
+from qq_chat_converter.py_funcs import export_from_mht
+from samples import IMAGES, write_chat_mht
+
+
+DATA = {guid: data for guid, _, data in IMAGES}
+
+
+@pytest.fixture
+def mht(tmp_path):
+    return write_chat_mht(str(tmp_path / "chat.mht"))
+
+
+def _partial(mht, out_dir, **options):
+    json_file = os.path.join(out_dir, "qq_chat.json")
+    export_from_mht(mht, json_file, os.path.join(out_dir, "qq_chat.html"), "Image", progress=lambda e: None,
+                    **options)
+    with open(json_file, encoding="utf-8") as f:
+        records = json.load(f)
+    images = {}
+    for name in os.listdir(os.path.join(out_dir, "Image")):
+        with open(os.path.join(out_dir, "Image", name), "rb") as f:
+            images[name] = f.read()
+    with open(os.path.join(out_dir, "qq_chat.html"), encoding="utf-8") as f:
+        html = f.read()
+    return records, images, html
+
+
+def test_date_range(mht, tmp_path):
+    records, images, html = _partial(mht, str(tmp_path / "out"), since="2023-03-02",
+                                     until=datetime.date(2023, 3, 2))
+    assert [(r["sender"], r["date"], r["time"]) for r in records] == [
+        ("甲", "2023-03-02", "9:30:00"), ("丙", "2023-03-02", "9:31:00")]
+    assert list(images.values()) == [DATA["{AAAA0003}"]]
+    assert "你好" not in html and "再发一次" not in html and "收到" in html
+
+
+def test_open_ended_range(mht, tmp_path):
+    records, images, _ = _partial(mht, str(tmp_path / "out"), since="2023-03-03")
+    assert [r["text"] for r in records] == ["再发一次", "好的"]
+    assert list(images.values()) == [DATA["{AAAA0001}"]]
+
+
+def test_sender_filter(mht, tmp_path):
+    records, images, html = _partial(mht, str(tmp_path / "out"), senders=["乙"])
+    assert [(r["date"], r["text"]) for r in records] == [("2023-03-01", "看图"), ("2023-03-03", "再发一次")]
+    assert sorted(images.values()) == sorted([DATA["{AAAA0001}"], DATA["{AAAA0002}"], DATA["{AAAA0001}"]])
+    assert DATA["{AAAA0003}"] not in images.values()
+    assert "收到" not in html and "看图" in html
+    for r in records:
+        for path in r["images"]:
+            assert os.path.isfile(os.path.join(str(tmp_path / "out"), path))
+
+
+def test_partial_export_bypasses_cache(mht, tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+    _partial(mht, str(tmp_path / "out"), senders=["甲"], cache=cache)
+    assert cache.entries() == []
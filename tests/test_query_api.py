@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+import http.client
+
+from urllib.parse import urlencode
+
+import pytest
+
+from qq_chat_converter.py_funcs import export_from_mht
+from qq_chat_converter.query_api import _page_ids
+from qq_chat_converter.server import make_viewer_server
+from samples import write_chat_mht
+
+
+@pytest.fixture(scope="module")
+def export_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp("api")
+    mht = write_chat_mht(str(root / "chat.mht"))
+    out_dir = root / "out"
+    export_from_mht(mht, str(out_dir / "qq_chat.json"), str(out_dir / "qq_chat.html"), "Image",
+                    progress=lambda e: None)
+    return out_dir
+
+
+@pytest.fixture(scope="module")
+def api(export_dir):
+    srv = make_viewer_server(str(export_dir), port=0, quiet=True, api=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    port = srv.server_address[1]
+
+    def get(path):
+        conn = http.client.HTTPConnection("localhost", port, timeout=5)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    yield get
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture(scope="module")
+def records(export_dir):
+    with open(str(export_dir / "qq_chat.json"), encoding="utf-8") as f:
+        return [{**r, "originalId": i} for i, r in enumerate(json.load(f))]
+
+
+def test_dates(api):
+    assert api("/api/dates") == (200, {"dates": [
+        {"date": "2023-03-01", "count": 2}, {"date": "2023-03-02", "count": 2}, {"date": "2023-03-03", "count": 2}]})
+
+
+def test_messages_by_date(api, records):
+    status, page = api("/api/messages?date=2023-03-02")
+    assert status == 200
+    assert page == {"date": "2023-03-02", "offset": 0, "has_more": False, "messages": records[2:4]}
+    assert api("/api/messages?date=2024-01-01")[1]["messages"] == []
+
+
+@pytest.mark.parametrize("offset, limit, ids, has_more", [
+    (0, 200, [0, 1, 2, 3, 4, 5], False),
+    (1, 2, [1, 2], True),
+    (4, 2, [4, 5], False),
+    (9, 2, [], False),
+])
+def test_messages_paging(api, offset, limit, ids, has_more):
+    _, page = api(f"/api/messages?offset={offset}&limit={limit}")
+    assert [m["originalId"] for m in page["messages"]] == ids
+    assert page["has_more"] is has_more
+
+
+@pytest.mark.parametrize("q, ids", [("WORLD", [0]), ("乙", [1, 4]), ("收", [3]), ("  ", [])])
+def test_search(api, q, ids):
+    status, page = api("/api/search?" + urlencode({"q": q}))
+    assert status == 200
+    assert [m["originalId"] for m in page["messages"]] == ids
+
+
+def test_search_paging(api):
+    _, page = api("/api/search?" + urlencode({"q": "甲", "limit": 2}))
+    assert [m["originalId"] for m in page["messages"]] == [0, 2] and page["has_more"]
+    _, page = api("/api/search?" + urlencode({"q": "甲", "limit": 2, "offset": 2}))
+    assert [m["originalId"] for m in page["messages"]] == [5] and not page["has_more"]
+
+
+def test_context(api, records):
+    status, page = api("/api/context?id=5&limit=1")
+    assert status == 200
+    assert page == {"id": 5, "date": "2023-03-03", "offset": 1, "has_more": False, "messages": [records[5]]}
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/api/context?id=99", 404),
+    ("/api/context", 400),
+    ("/api/messages?offset=x", 400),
+    ("/api/nothing", 404),
+])
+def test_errors(api, path, status):
+    assert api(path)[0] == status
+
+
+def test_no_database_copy(api, export_dir):
+    api("/api/dates")
+    assert not os.path.exists(str(export_dir / "qq_chat.db"))
+    assert os.path.exists(str(export_dir / "qq_chat.archive.json"))
+
+
+def test_missing_archive(tmp_path):
+    srv = make_viewer_server(str(tmp_path), port=0, quiet=True, api=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    try:
+        conn = http.client.HTTPConnection("localhost", srv.server_address[1], timeout=5)
+        conn.request("GET", "/api/dates")
+        assert conn.getresponse().status == 404
+        conn.close()
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_page_ids_spans_runs():
+    runs = [[0, 2], [5, 6], [8, 11]]
+    assert _page_ids(runs, 0, 3) == [0, 1, 5, 8]
+    assert _page_ids(runs, 2, 2) == [5, 8, 9]
+    assert _page_ids(runs, 5, 10) == [10]
+    assert _page_ids(runs, 6, 10) == []
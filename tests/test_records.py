@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from qq_chat_converter.records import ForwardedRecord, MessageRecord, RecordStore
+
+
+def message(sender="甲", date="2023-03-01", time="8:00:00", text="你好", images=None, forwarded=None):
+    return {"sender": sender, "date": date, "time": time, "text": text, "images": images,
+            "image": images[0] if images else None, "forwarded": forwarded}
+
+
+def forwarded(sender="乙", time="7:59:00", text="原文", images=None):
+    return {"sender": sender, "time": time, "text": text, "images": images,
+            "image": images[0] if images else None}
+
+
+ROUND_TRIP = [
+    message(),
+    message(text=None, images=["Image/a.png", "Image/b.jpg"]),
+    message(sender=None, date=None, time=None),
+    message(forwarded=[forwarded(), forwarded(sender=None, text=None, images=["Image/c.gif"])]),
+]
+
+
+@pytest.mark.parametrize("d", ROUND_TRIP)
+def test_round_trip(d):
+    store = RecordStore()
+    record = store.from_dict(json.loads(json.dumps(d)))
+    assert isinstance(record, MessageRecord)
+    out = store.to_dict(record)
+    assert out == d
+    assert list(out) == list(d)  # 键顺序决定输出字节
+    assert json.dumps(out, ensure_ascii=False) == json.dumps(d, ensure_ascii=False)
+
+
+def test_forwarded_round_trip():
+    store = RecordStore()
+    record = store.from_dict(forwarded(images=["Image/x.png"]))
+    assert isinstance(record, ForwardedRecord)
+    assert store.to_dict(record) == forwarded(images=["Image/x.png"])
+
+
+@pytest.mark.parametrize("d", [
+    {"sender": "甲", "text": "少了键"},
+    dict(message(), extra=1),
+    {**message(images=["Image/a.png"]), "image": "Image/other.png"},  # image 与 images[0] 不一致
+    message(images=[]),
+    message(forwarded=[]),
+    message(text=123),
+    dict(reversed(list(message().items()))),  # 键顺序不同
+])
+def test_lossy_dicts_are_kept_as_is(d):
+    store = RecordStore()
+    assert store.from_dict(d) is d
+    assert store.to_dict(d) is d
+
+
+def test_strings_are_shared():
+    store = RecordStore()
+    a = store.from_dict(message(time="8:00:00"))
+    b = store.from_dict(message(time="8:00:00", text="又一条"))
+    assert a.sender == b.sender and a.date == b.date
+    assert a.time is b.time
+    assert len(store.senders) == 1 and len(store.dates) == 1
+    assert store.date_of(a) == "2023-03-01"
+
+
+@pytest.mark.parametrize("wrap", [lambda records: records, lambda records: {"title": "群", "messages": records}])
+def test_load_json(tmp_path, wrap):
+    records = ROUND_TRIP + [{"note": "非消息"}]
+    path = tmp_path / "qq_chat.json"
+    path.write_text(json.dumps(wrap(records), ensure_ascii=False), encoding="utf-8")
+    store, data = RecordStore.load_json(str(path))
+    assert len(store) == len(records)
+    assert list(store.iter_dicts()) == records
+    assert isinstance(store.records[0], MessageRecord)
+    assert store.records[-1] == {"note": "非消息"}
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from qq_chat_converter import py_funcs
+from qq_chat_converter.py_funcs import export_from_mht, load_part_index, part_index_path_for, scan_mht
+from samples import CHAT_ROWS, IMAGES, page, read_tree, write_chat_mht, write_mht
+
+
+@pytest.fixture
+def mht(tmp_path):
+    return write_chat_mht(str(tmp_path / "chat.mht"))
+
+
+def _export(mht, out_dir):
+    export_from_mht(mht, os.path.join(out_dir, "qq_chat.json"), os.path.join(out_dir, "qq_chat.html"), "Image",
+                    progress=lambda e: None)
+    return read_tree(out_dir)
+
+
+def _no_full_read(*args, **kwargs):
+    raise AssertionError("有有效的偏移表时不应再完整读取 MHT")
+
+
+def test_scan_summary(mht):
+    summary = scan_mht(mht, progress=lambda e: None, write_index=False)
+    assert not os.path.exists(part_index_path_for(mht))
+    assert (summary["first_date"], summary["last_date"], summary["days"]) == ("2023-03-01", "2023-03-03", 3)
+    assert summary["messages"] == 6
+    assert summary["images"] == len(IMAGES)
+    assert summary["image_bytes"] == sum(len(data) for _, _, data in IMAGES)
+
+
+def test_sidecar_is_reused(mht, tmp_path, monkeypatch):
+    cold = _export(mht, str(tmp_path / "cold"))
+    scan_mht(mht, progress=lambda e: None)
+    assert load_part_index(mht) is not None
+
+    monkeypatch.setattr(py_funcs, "_MhtReader", _no_full_read)
+    assert _export(mht, str(tmp_path / "indexed")) == cold
+
+
+def test_sidecar_is_invalidated_when_mht_changes(mht, tmp_path, monkeypatch):
+    scan_mht(mht, progress=lambda e: None)
+    write_mht(mht, page(CHAT_ROWS), images=IMAGES[::-1])  # 大小不变，各图片的偏移都变了
+    st = os.stat(mht)
+    os.utime(mht, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert load_part_index(mht) is None
+
+    reads = []
+    reader = py_funcs._MhtReader
+    monkeypatch.setattr(py_funcs, "_MhtReader", lambda *a, **kw: reads.append(1) or reader(*a, **kw))
+    out = _export(mht, str(tmp_path / "out"))
+    assert reads == [1]
+    os.remove(part_index_path_for(mht))
+    assert out == _export(mht, str(tmp_path / "cold"))
@@ -0,0 +1,65 @@
+import gzip
+import threading
+import http.client
+
+import pytest
+
+from qq_chat_converter.server import make_viewer_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "Image").mkdir()
+    (tmp_path / "Image" / "1.png").write_bytes(b"0123456789")
+    (tmp_path / "qq_chat.json").write_text("[]", encoding="utf-8")
+    (tmp_path / "qq_chat.json.gz").write_bytes(gzip.compress(b"[]"))
+    srv = make_viewer_server(str(tmp_path), port=0, quiet=True)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield tmp_path, srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()
+
+
+def _get(port, path, **headers):
+    conn = http.client.HTTPConnection("localhost", port, timeout=5)
+    try:
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, dict(resp.getheaders()), resp.read()
+    finally:
+        conn.close()
+
+
+def test_images_are_revalidated(server):
+    root, port = server
+    status, headers, body = _get(port, "/Image/1.png")
+    assert status == 200 and body == b"0123456789"
+    assert headers["Cache-Control"] == "no-cache"
+
+    status, _, body = _get(port, "/Image/1.png", **{"If-None-Match": headers["ETag"]})
+    assert status == 304 and body == b""
+
+    # 重新导出到同一目录：同名文件换成另一张图片，旧的 ETag 不再匹配
+    (root / "Image" / "1.png").write_bytes(b"another image")
+    status, _, body = _get(port, "/Image/1.png", **{"If-None-Match": headers["ETag"]})
+    assert status == 200 and body == b"another image"
+
+
+def test_range_requests(server):
+    _, port = server
+    status, headers, body = _get(port, "/Image/1.png", Range="bytes=2-4")
+    assert status == 206 and body == b"234" and headers["Content-Range"] == "bytes 2-4/10"
+    status, _, body = _get(port, "/Image/1.png", Range="bytes=-3")
+    assert status == 206 and body == b"789"
+    status, headers, _ = _get(port, "/Image/1.png", Range="bytes=10-")
+    assert status == 416 and headers["Content-Range"] == "bytes */10"
+
+
+def test_precompressed_json(server):
+    _, port = server
+    status, headers, body = _get(port, "/qq_chat.json", **{"Accept-Encoding": "gzip"})
+    assert status == 200 and headers["Content-Encoding"] == "gzip" and gzip.decompress(body) == b"[]"
+    assert headers["Vary"] == "Accept-Encoding"
+    status, headers, body = _get(port, "/qq_chat.json")
+    assert status == 200 and "Content-Encoding" not in headers and body == b"[]"
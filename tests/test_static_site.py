@@ -0,0 +1,52 @@
+import os
+import re
+import json
+
+import pytest
+
+from qq_chat_converter.static_site import export_static_site
+
+
+@pytest.fixture
+def json_file(make_export, record):
+    records = [record("甲", "2023-03-01", f"8:00:0{i}", f"一 {i}") for i in range(5)]
+    records.append(record("乙", "2023-03-02", "9:00:00", "二", ["a.png"]))
+    records.append(record("甲", None, None, "无日期"))
+    return make_export("out", records, {"a.png": b"png"})
+
+
+def _links(site_dir, name):
+    with open(os.path.join(site_dir, name), encoding="utf-8") as f:
+        page = f.read()
+    return re.findall(r'<a href="([^"]*)">', page), page.count('class="message"')
+
+
+def test_pages_and_navigation(json_file, monkeypatch):
+    def load(*args, **kwargs):
+        raise AssertionError("JSON 应当流式读取")
+
+    monkeypatch.setattr(json, "load", load)
+    site_dir = os.path.join(os.path.dirname(json_file), "site")
+    export_static_site(json_file, site_dir, page_size=2)
+
+    names = ["2023-03-01.html", "2023-03-01_2.html", "2023-03-01_3.html", "2023-03-02.html", "undated.html"]
+    assert sorted(os.listdir(site_dir)) == sorted(names + ["index.html"])
+    counts = [2, 2, 1, 1, 1]
+    for i, name in enumerate(names):
+        links, n = _links(site_dir, name)
+        assert n == counts[i]
+        expected = ([names[i - 1]] if i else []) + ["index.html"] + ([names[i + 1]] if i + 1 < len(names) else [])
+        assert [link for link in links if link.endswith(".html")] == expected
+
+    links, _ = _links(site_dir, "index.html")
+    assert links == ["2023-03-01.html", "2023-03-02.html", "undated.html"]
+    with open(os.path.join(site_dir, "2023-03-02.html"), encoding="utf-8") as f:
+        assert 'src="../Image/a.png"' in f.read()
+
+
+def test_messages_dict(tmp_path):
+    json_file = str(tmp_path / "qq_chat.json")
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump({"messages": [{"sender": "甲", "date": "2023-03-01", "time": "8:00:00", "text": "一"}]}, f)
+    export_static_site(json_file, str(tmp_path / "site"))
+    assert sorted(os.listdir(tmp_path / "site")) == ["2023-03-01.html", "index.html"]
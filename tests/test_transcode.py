@@ -0,0 +1,35 @@
+import io
+import os
+
+import pytest
+
+from qq_chat_converter.py_funcs import _write_matched_images, image_rel_path, list_image_files
+
+Image = pytest.importorskip("PIL.Image")
+
+from qq_chat_converter.transcode import ImageTranscoder  # noqa: E402
+
+
+def _noise_png():
+    out = io.BytesIO()
+    Image.frombytes("RGB", (64, 64), os.urandom(64 * 64 * 3)).save(out, "PNG")
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("layout", ["flat", "fanout"])
+def test_webp_is_placed_by_its_own_name(tmp_path, layout):
+    html_dir = str(tmp_path)
+    image_dir = os.path.join(html_dir, "Image")
+    attachments = [{"content_type": "image/png", "data": _noise_png()} for _ in range(3)]
+    matches = [("file:///a/photo.png", 0), ("file:///b/photo.png", 1), ("file:///c/other.png", 2)]
+    session = ImageTranscoder().start()
+
+    src_to_local = _write_matched_images(matches, attachments, image_dir, html_dir, progress=lambda e: None,
+                                         write=session.store, transcode=session, layout=layout)
+    src_to_local = session.remap(src_to_local, html_dir)
+
+    assert session.converted == 3
+    names = ["photo.webp", "photo_1.webp", "other.webp"]
+    assert sorted(list_image_files(image_dir)) == sorted(image_rel_path(name, layout) for name in names)
+    for (raw_src, _), name in zip(matches, names):
+        assert src_to_local[raw_src] == f"Image/{image_rel_path(name, layout)}"
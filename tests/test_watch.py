@@ -0,0 +1,91 @@
+import os
+import json
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pytest
+
+from qq_chat_converter import jobs
+from qq_chat_converter.watch import WatchDaemon, WatchState
+from samples import write_chat_mht
+
+
+class Inbox:
+    """在线程池中运行 WatchDaemon 的轮询（不启动工作进程），记录每次派发的转换"""
+
+    def __init__(self, tmp_path, monkeypatch):
+        self.inbox = tmp_path / "inbox"
+        self.out_root = str(tmp_path / "out")
+        self.inbox.mkdir()
+        self.converted = []
+        run_logged_job = jobs.run_logged_job
+
+        def recorded(mht_path, out_dir, log_path, **options):
+            self.converted.append(os.path.basename(mht_path))
+            return run_logged_job(mht_path, out_dir, log_path, **options)
+
+        monkeypatch.setattr(jobs, "run_logged_job", recorded)
+
+    def add(self, name):
+        return write_chat_mht(str(self.inbox / name))
+
+    def start(self):
+        daemon = WatchDaemon(str(self.inbox), self.out_root, workers=1, settle=0)
+        daemon._pool = ThreadPoolExecutor(max_workers=1)
+        daemon._start = 0.0
+        return daemon
+
+    @staticmethod
+    def poll(daemon, rounds=3):
+        """第一轮记录文件状态，第二轮视为写入完成并派发；每轮等待派发的任务结束"""
+        for _ in range(rounds):
+            daemon.run_once()
+            wait(list(daemon._running))
+        daemon._collect()
+
+    @staticmethod
+    def shutdown(daemon):
+        daemon._pool.shutdown(wait=True)
+        daemon.state.close()
+
+
+@pytest.fixture
+def inbox(tmp_path, monkeypatch):
+    return Inbox(tmp_path, monkeypatch)
+
+
+def test_restart_skips_converted_files(inbox):
+    inbox.add("a.mht")
+    daemon = inbox.start()
+    inbox.poll(daemon)
+    inbox.shutdown(daemon)
+    assert inbox.converted == ["a.mht"]
+    with open(os.path.join(inbox.out_root, "a", "qq_chat.json"), encoding="utf-8") as f:
+        assert len(json.load(f)) == 6
+
+    inbox.add("b.mht")
+    daemon = inbox.start()
+    inbox.poll(daemon)
+    assert daemon.counters["done"] == 1
+    inbox.shutdown(daemon)
+    assert inbox.converted == ["a.mht", "b.mht"]
+    assert WatchState(os.path.join(inbox.out_root, "watch_state.db")).totals() == {"done": 2}
+
+
+def test_restart_reconverts_changed_and_interrupted_files(inbox):
+    a, b = inbox.add("a.mht"), inbox.add("b.mht")
+    daemon = inbox.start()
+    inbox.poll(daemon)
+    inbox.shutdown(daemon)
+
+    st = os.stat(a)
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 1))  # 内容被替换
+    state = WatchState(os.path.join(inbox.out_root, "watch_state.db"))
+    st = os.stat(b)
+    state.mark(os.path.abspath(b), st.st_size, st.st_mtime_ns, "running")  # 上次运行中被中断
+    state.close()
+
+    daemon = inbox.start()
+    inbox.poll(daemon)
+    inbox.shutdown(daemon)
+    assert sorted(inbox.converted) == ["a.mht", "a.mht", "b.mht", "b.mht"]